@@ -0,0 +1,12 @@
+#!/usr/bin/env python
+# ! DO NOT MANUALLY INVOKE THIS setup.py, USE CATKIN INSTEAD
+
+from distutils.core import setup
+from catkin_pkg.python_setup import generate_distutils_setup
+
+# The metrics and tracing libraries are also used by the perception nodes
+setup_args = generate_distutils_setup(
+    packages=['baxter_cashier_manipulation'],
+    package_dir={'': 'src'})
+
+setup(**setup_args)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+"""
+Arm Selection.
+
+Chooses  which of  Baxter's arms takes the banknote from which of the customer's
+hands. Every (hand, arm) pair is given a cost, the estimated time (in seconds)
+of the motion:
+
+- the joint-space distance between the current joints of the arm and the
+joints reaching the hand (inverse kinematics), divided by the joint speed.
+Baxter's joints move at the same time, hence the largest joint distance
+gives the time of the motion;
+- plus a penalty if the arm is still busy with another motion (e.g returning
+to neutral after leaving a banknote to the table).
+
+The  hands  the  arm  can  not reach (no IK solution) are never chosen. The
+IK of all the hands is solved in one request per arm; if the request fails,
+the arm is not chosen this time.
+
+    Copyright (C)  2016/2017 The University of Leeds and Rafael Papallas
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Speed (radians per second) of Baxter's joints used to estimate the time of
+# a motion. Only the relative costs matter, hence a rough value is enough.
+DEFAULT_JOINT_SPEED = 1.0
+
+# Time (in seconds) added to the cost of an arm busy with another motion
+DEFAULT_BUSY_PENALTY = 2.0
+
+
+def joint_distance(joints, other_joints):
+    """
+    Will return the largest distance between the joints of two configurations.
+
+    - joints and other_joints: dict joint name -> position. Only the joints of
+    both configurations are compared.
+    """
+    distances = [abs(position - other_joints[name])
+                 for name, position in joints.items()
+                 if name in other_joints]
+
+    return max(distances) if len(distances) > 0 else 0.0
+
+
+class ArmSelector:
+    """Picks the cheapest (hand, arm) pair to take the banknote."""
+
+    def __init__(self, planner, joint_speed=DEFAULT_JOINT_SPEED,
+                 busy_penalty=DEFAULT_BUSY_PENALTY):
+        """
+        Default constructor.
+
+        - planner: the `MoveItPlanner` (or its simulation) giving the IK, the
+        joints of the arms and whether they are busy.
+        - joint_speed: in radians per second.
+        - busy_penalty: in seconds.
+        """
+        self.planner = planner
+        self.joint_speed = joint_speed
+        self.busy_penalty = busy_penalty
+
+    def costs(self, poses, arms=None):
+        """
+        Will return the cost of every (pose, arm) pair.
+
+        - poses: the `BaxterPose`s of the customer's hands.
+        - arms: the arms to consider, both by default.
+
+        Returns a list of (cost, pose, arm), without the pairs the arm can
+        not reach.
+        """
+        if arms is None:
+            arms = [self.planner.left_arm, self.planner.right_arm]
+
+        costs = []
+
+        for arm in arms:
+            with self.planner.timer.span("arm_selection", str(arm), "ik"):
+                solutions = self.planner.solve_ik(poses, arm)
+
+            # The IK service failed, whether the arm reaches is unknown
+            if solutions is None:
+                continue
+
+            current = self.planner.get_joint_positions(arm)
+            penalty = self.busy_penalty if self.planner.is_arm_busy(arm) \
+                else 0.0
+
+            for pose, joints in zip(poses, solutions):
+                if joints is None:
+                    continue
+
+                cost = joint_distance(joints, current) / self.joint_speed
+                costs.append((cost + penalty, pose, arm))
+
+        return costs
+
+    def select(self, poses, arms=None):
+        """
+        Will return the cheapest (pose, arm) pair, or None if none reachable.
+
+        See `costs`.
+        """
+        costs = self.costs(poses, arms)
+        if len(costs) == 0:
+            return None
+
+        cost, pose, arm = min(costs, key=lambda entry: entry[0])
+
+        return pose, arm
@@ -0,0 +1,10 @@
+"""
+Libraries of the manipulation package shared with the perception nodes.
+
+The services of the package are generated into another directory under the
+same package name (baxter_cashier_manipulation.srv), hence the path of the
+package is extended to every directory of the name on the Python path.
+"""
+from pkgutil import extend_path
+
+__path__ = extend_path(__path__, __name__)
@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+"""
+Metrics.
+
+Always-on operational metrics of the cashier nodes: counters (e.g transactions
+completed,  failed  recognitions) and  latency histograms  (e.g recognition
+time,  plan  time). Each  node  publishes its metrics periodically, as JSON, on
+its `~metrics` topic, with both the totals since the node started and the
+values of the last period (rolling window).
+
+Values are  recorded  from any thread (e.g the service callbacks) without
+taking a lock: each thread records to its own shard, and the shards are only
+merged when the metrics are published. rospy  serves every service call on a
+new thread, hence the shards of the threads that have finished are folded
+into a single one when merged, rather than kept forever.
+
+Example:
+
+    metrics.observe("recognition_time", 0.4)
+    metrics.increment("failed_recognitions")
+    metrics.start_publishing(period=10.0)
+
+    Copyright (C)  2016/2017 The University of Leeds and Rafael Papallas
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# System-wide imports
+import bisect
+import json
+import threading
+import time
+
+# Upper bounds (in seconds) of the histogram buckets. The last bucket holds
+# everything above the last bound.
+DEFAULT_BUCKETS = [0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 60]
+
+
+class Histogram:
+    """Histogram of durations with fixed bucket bounds."""
+
+    def __init__(self, buckets=None):
+        """Default constructor."""
+        self.buckets = buckets or DEFAULT_BUCKETS
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+
+    def add(self, value):
+        """Will record a single value to the histogram."""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+    def merge(self, other):
+        """Will add the values of another histogram (same buckets)."""
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+
+        if other.minimum is not None and (self.minimum is None or
+                                          other.minimum < self.minimum):
+            self.minimum = other.minimum
+
+        if other.maximum is not None and (self.maximum is None or
+                                          other.maximum > self.maximum):
+            self.maximum = other.maximum
+
+    def since(self, earlier):
+        """
+        Will return the histogram of the values added since `earlier`.
+
+        - earlier: a copy of this histogram taken before (see `copy`).
+
+        The minimum and maximum of the values since then are not known.
+        """
+        histogram = Histogram(self.buckets)
+        histogram.counts = [a - b for a, b in zip(self.counts, earlier.counts)]
+        histogram.count = self.count - earlier.count
+        histogram.total = self.total - earlier.total
+
+        return histogram
+
+    def copy(self):
+        """Will return a copy of the histogram."""
+        histogram = Histogram(self.buckets)
+        histogram.merge(self)
+
+        return histogram
+
+    def mean(self):
+        """Will return the mean of the values or None if empty."""
+        return self.total / self.count if self.count > 0 else None
+
+    def percentile(self, percent):
+        """
+        Will return an estimate of the given percentile (0-100).
+
+        The estimate is the upper bound of the bucket the percentile falls in,
+        capped to the maximum value seen (if known).
+        """
+        if self.count == 0:
+            return None
+
+        rank = percent / 100.0 * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count > 0:
+                if i < len(self.buckets):
+                    if self.maximum is None:
+                        return self.buckets[i]
+                    return min(self.buckets[i], self.maximum)
+                break
+
+        return self.maximum
+
+    def to_dict(self):
+        """Will return a dictionary representation of the histogram."""
+        return {"count": self.count,
+                "total": self.total,
+                "mean": self.mean(),
+                "min": self.minimum,
+                "max": self.maximum,
+                "p50": self.percentile(50),
+                "p95": self.percentile(95),
+                "buckets": self.buckets,
+                "counts": self.counts}
+
+
+class _Shard:
+    """The counters and histograms recorded by a single thread."""
+
+    def __init__(self):
+        """Default constructor."""
+        self.counters = {}
+        self.histograms = {}
+
+    def merge(self, other):
+        """Will add the counters and histograms of another shard."""
+        for name, value in list(other.counters.items()):
+            self.counters[name] = self.counters.get(name, 0) + value
+
+        for name, histogram in list(other.histograms.items()):
+            if name not in self.histograms:
+                self.histograms[name] = Histogram(histogram.buckets)
+            self.histograms[name].merge(histogram)
+
+
+class Metrics:
+    """Counters and histograms of a node, recorded in per-thread shards."""
+
+    def __init__(self):
+        """Default constructor."""
+        self._local = threading.local()
+
+        # The lock is only taken to add the shard of a new thread and to
+        # merge the shards.
+        self._lock = threading.Lock()
+
+        # (thread, shard) of the threads recording, and the values of the
+        # threads that have finished.
+        self._shards = []
+        self._retired = _Shard()
+
+        # Totals at the last `window` call, to compute the rolling window
+        self._last_totals = None
+
+        self._publisher = None
+        self._timer = None
+
+    def _shard(self):
+        """Will return the shard of the current thread."""
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+
+        return shard
+
+    def increment(self, name, value=1):
+        """Will add the value to the counter."""
+        counters = self._shard().counters
+        counters[name] = counters.get(name, 0) + value
+
+    def observe(self, name, value):
+        """Will record the value (e.g a latency in seconds) to the histogram."""
+        histograms = self._shard().histograms
+        histogram = histograms.get(name)
+        if histogram is None:
+            histogram = histograms[name] = Histogram()
+
+        histogram.add(value)
+
+    def totals(self):
+        """
+        Will return the counters and histograms since the node started.
+
+        Returns (counters, histograms), merged across the threads.
+        """
+        with self._lock:
+            # A finished thread records nothing more, its shard is folded
+            # into the retired values.
+            alive = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    alive.append((thread, shard))
+                else:
+                    self._retired.merge(shard)
+            self._shards = alive
+
+            total = _Shard()
+            total.merge(self._retired)
+
+        for _, shard in alive:
+            total.merge(shard)
+
+        return total.counters, total.histograms
+
+    def snapshot(self):
+        """
+        Will return the metrics as a dictionary (published as JSON).
+
+        Holds the totals and the values since the last snapshot (window).
+        """
+        counters, histograms = self.totals()
+
+        last_counters, last_histograms = self._last_totals or ({}, {})
+        self._last_totals = (counters, dict([(name, h.copy()) for name, h
+                                             in histograms.items()]))
+
+        window_histograms = {}
+        for name, histogram in histograms.items():
+            if name in last_histograms:
+                window_histograms[name] = histogram.since(
+                                                    last_histograms[name])
+            else:
+                window_histograms[name] = histogram
+
+        return {
+            "timestamp": time.time(),
+            "counters": counters,
+            "histograms": dict([(name, h.to_dict()) for name, h
+                                in histograms.items()]),
+            "window": {
+                "counters": dict([(name, value - last_counters.get(name, 0))
+                                  for name, value in counters.items()]),
+                "histograms": dict([(name, h.to_dict()) for name, h
+                                    in window_histograms.items()]),
+            },
+        }
+
+    def start_publishing(self, topic="~metrics", period=10.0):
+        """
+        Will publish the snapshot periodically on the given ROS topic.
+
+        The snapshot is published as JSON in a `std_msgs/String` message.
+        """
+        # Imported here so the metrics can also be used without ROS.
+        import rospy
+        from std_msgs.msg import String
+
+        self._publisher = rospy.Publisher(topic, String, queue_size=1,
+                                          latch=True)
+
+        def publish(_):
+            self._publisher.publish(String(json.dumps(self.snapshot())))
+
+        self._timer = rospy.Timer(rospy.Duration(period), publish)
+
+    def stop_publishing(self):
+        """Will stop publishing the metrics."""
+        if self._timer is not None:
+            self._timer.shutdown()
+            self._timer = None
+
+
+# The metrics of this process
+_metrics = Metrics()
+
+
+def increment(name, value=1):
+    """Will add the value to the counter of the process."""
+    _metrics.increment(name, value)
+
+
+def observe(name, value):
+    """Will record the value to the histogram of the process."""
+    _metrics.observe(name, value)
+
+
+def snapshot():
+    """Will return the metrics of the process (see `Metrics.snapshot`)."""
+    return _metrics.snapshot()
+
+
+def start_publishing(topic="~metrics", period=10.0):
+    """Will publish the metrics of the process on the ROS topic."""
+    _metrics.start_publishing(topic, period)
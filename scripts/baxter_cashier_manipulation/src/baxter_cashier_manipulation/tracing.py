@@ -0,0 +1,339 @@
+#!/usr/bin/env python
+"""
+Tracing.
+
+Opt-in tracing of the hot paths of the cashier nodes (service calls, tf
+lookups, planning and execution, display publishing, sleeps), written in the
+Chrome  trace  event  format, which  can be opened in Chrome (about:tracing) or
+Perfetto (ui.perfetto.dev).
+
+Tracing is enabled by setting the `BAXTER_CASHIER_TRACE` environment variable
+to a directory. Each process writes its own trace (trace-<start>-<pid>.json,
+<start> being the time the process started tracing) to that directory as it
+runs: the events are buffered and appended to the trace every few seconds (or
+once the buffer is full), in the JSON array format, whose closing bracket is
+optional, hence the trace of a killed node is still valid.
+The traces of the separate ROS nodes are then merged into one, ordered by
+timestamp:
+
+    python -m baxter_cashier_manipulation.tracing merge ~/traces \
+        --output cashier_trace.json
+
+When tracing is disabled, `span` returns a shared object doing nothing, hence
+the hooks can be left in production code.
+
+Example:
+
+    with tracing.span("lookup_transform", "tf", target=target):
+        listener.lookupTransform(source, target, rospy.Time(0))
+
+    Copyright (C)  2016/2017 The University of Leeds and Rafael Papallas
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# System-wide imports
+import argparse
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+from os.path import join
+
+# Environment variable of the directory of the traces
+TRACE_DIRECTORY_VARIABLE = "BAXTER_CASHIER_TRACE"
+
+# Period, in seconds, of appending the buffered events to the trace
+FLUSH_PERIOD = 5.0
+
+# The buffered events are appended at once when there are this many
+MAX_BUFFERED_EVENTS = 10000
+
+
+class _NullSpan:
+    """A span doing nothing, used while tracing is disabled."""
+
+    def __enter__(self):
+        """Nothing to measure."""
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        """Nothing to record."""
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    """Measures the `with` block and records it as a complete event."""
+
+    def __init__(self, tracer, name, category, args):
+        """Default constructor."""
+        self._tracer = tracer
+        self._name = name
+        self._category = category
+        self._args = args
+        self._start = None
+
+    def __enter__(self):
+        """Will start measuring."""
+        self._start = time.time()
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        """Will record the event, with the error raised (if any)."""
+        if exception_type is not None:
+            self._args["error"] = exception_type.__name__
+
+        self._tracer.complete(self._name, self._category, self._start,
+                              time.time() - self._start, self._args)
+        return False
+
+
+class Tracer:
+    """Collects the trace events of this process."""
+
+    def __init__(self, directory, flush_period=FLUSH_PERIOD,
+                 max_events=MAX_BUFFERED_EVENTS):
+        """
+        Will append the trace of the process to a file of the directory.
+
+        - flush_period: seconds between two appends of the buffered events,
+        None to only append them once the buffer is full (or on `flush`).
+        - max_events: size of the buffer.
+        """
+        self.directory = directory
+        self.max_events = max_events
+        self._pid = os.getpid()
+
+        # Part of the name of the trace, as a PID is reused by later processes
+        self._started = time.strftime("%Y%m%d-%H%M%S")
+
+        # Appending to a list is atomic, hence the events are recorded from
+        # any thread without a lock.
+        self._events = []
+
+        # Taken to append the events to the trace, one thread at a time
+        self._lock = threading.Lock()
+        self._file = None
+        self._is_empty = True
+
+        if flush_period is not None:
+            flusher = threading.Thread(target=self._flush_periodically,
+                                       args=(flush_period,))
+            flusher.daemon = True
+            flusher.start()
+
+    def _flush_periodically(self, period):
+        """Will append the buffered events to the trace, every period."""
+        while True:
+            time.sleep(period)
+            self.flush()
+
+    def _record(self, event):
+        """Will buffer the event, appending the buffer to the trace if full."""
+        self._events.append(event)
+
+        if len(self._events) >= self.max_events:
+            self.flush()
+
+    def _event(self, phase, name, category, timestamp, args):
+        """Will return a trace event (timestamps in microseconds)."""
+        return {"ph": phase,
+                "name": name,
+                "cat": category,
+                "ts": timestamp * 1e6,
+                "pid": self._pid,
+                "tid": threading.current_thread().ident,
+                "args": args}
+
+    def complete(self, name, category, started, duration, args=None):
+        """Will record an event of the given start and duration (seconds)."""
+        event = self._event("X", name, category, started, args or {})
+        event["dur"] = duration * 1e6
+        self._record(event)
+
+    def instant(self, name, category, args=None):
+        """Will record an event happening now."""
+        event = self._event("i", name, category, time.time(), args or {})
+        event["s"] = "t"
+        self._record(event)
+
+    def set_process_name(self, process_name):
+        """Will name the process in the trace (e.g the ROS node)."""
+        self._record({"ph": "M",
+                      "name": "process_name",
+                      "pid": self._pid,
+                      "tid": 0,
+                      "args": {"name": process_name}})
+
+    def path(self):
+        """Will return the path of the trace of the process."""
+        return join(self.directory,
+                    "trace-{}-{}.json".format(self._started, self._pid))
+
+    def flush(self):
+        """Will append the events buffered so far to the trace file."""
+        with self._lock:
+            # Only the events taken are removed, the ones recorded meanwhile
+            # by other threads stay buffered.
+            count = len(self._events)
+            events = self._events[:count]
+            del self._events[:count]
+
+            if len(events) == 0:
+                return
+
+            if self._file is None:
+                if not os.path.exists(self.directory):
+                    os.makedirs(self.directory)
+
+                # Never replaces the trace of another process
+                descriptor = os.open(self.path(),
+                                     os.O_WRONLY | os.O_CREAT | os.O_EXCL,
+                                     0o644)
+                self._file = os.fdopen(descriptor, "w")
+                self._file.write("[")
+
+            for event in events:
+                if not self._is_empty:
+                    self._file.write(",")
+                self._file.write("\n" + json.dumps(event))
+                self._is_empty = False
+
+            self._file.flush()
+
+    def close(self):
+        """Will append the buffered events and end the trace."""
+        self.flush()
+
+        with self._lock:
+            if self._file is not None:
+                self._file.write("\n]\n")
+                self._file.close()
+                self._file = None
+
+
+def _create_tracer():
+    """Will return the tracer of the process, or None if disabled."""
+    directory = os.environ.get(TRACE_DIRECTORY_VARIABLE)
+    if not directory:
+        return None
+
+    tracer = Tracer(os.path.expanduser(directory))
+    atexit.register(tracer.close)
+
+    return tracer
+
+
+_tracer = _create_tracer()
+
+
+def is_enabled():
+    """Will return True if tracing is enabled."""
+    return _tracer is not None
+
+
+def span(name, category="cashier", **args):
+    """
+    Will trace the `with` block.
+
+    - args: shown with the event (e.g the arm or the frame).
+    """
+    if _tracer is None:
+        return _NULL_SPAN
+
+    return _Span(_tracer, name, category, args)
+
+
+def complete(name, category, started, duration, **args):
+    """Will trace an event that has already been measured (in seconds)."""
+    if _tracer is not None:
+        _tracer.complete(name, category, started, duration, args)
+
+
+def instant(name, category="cashier", **args):
+    """Will trace an event happening now."""
+    if _tracer is not None:
+        _tracer.instant(name, category, args)
+
+
+def set_process_name(process_name):
+    """Will name this process in the trace."""
+    if _tracer is not None:
+        _tracer.set_process_name(process_name)
+
+
+def flush():
+    """Will append the buffered events to the trace of the process now."""
+    if _tracer is not None:
+        _tracer.flush()
+
+
+def load_events(path):
+    """
+    Will return the events of a trace.
+
+    The trace of a process that was killed lacks the closing bracket.
+    """
+    with open(path) as f:
+        text = f.read().strip()
+
+    if text.startswith("{"):
+        return json.loads(text)["traceEvents"]
+
+    if not text.endswith("]"):
+        text = text.rstrip(",") + "]"
+
+    return json.loads(text)
+
+
+def merge(paths):
+    """
+    Will merge the traces of several processes into one.
+
+    The events are ordered by timestamp, the process names first.
+    """
+    events = []
+    for path in paths:
+        events.extend(load_events(path))
+
+    events.sort(key=lambda event: (event["ph"] != "M", event.get("ts", 0)))
+
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Merges the traces of the "
+                                                 "cashier nodes")
+    subparsers = parser.add_subparsers(dest="command")
+
+    merge_parser = subparsers.add_parser("merge", help="Merge the traces")
+    merge_parser.add_argument("directory",
+                              help="Directory of the traces (trace-*.json)")
+    merge_parser.add_argument("--output", default="trace.json",
+                              help="File of the merged trace")
+
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(join(os.path.expanduser(args.directory),
+                                  "trace-*.json")))
+
+    with open(args.output, "w") as f:
+        json.dump(merge(paths), f)
+
+    print("Merged {} traces into {}".format(len(paths), args.output))
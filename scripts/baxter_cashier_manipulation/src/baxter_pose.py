@@ -19,17 +19,17 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 # System-wide imports
 import time
 
-# ROS-wide imports
-import rospy
-from geometry_msgs.msg import (PoseStamped, Pose, Point, Quaternion,)
-from std_msgs.msg import Header
-
 
 class BaxterPose:
     """Represents a pose that is used in the entire project."""
 
-    def __init__(self, x1, y1, z1, x2, y2, z3, w):
-        """Initialise the class with the given attributes."""
+    def __init__(self, x1, y1, z1, x2, y2, z3, w, created=None):
+        """
+        Initialise the class with the given attributes.
+
+        - created: the time (in seconds) the pose was observed, e.g the stamp
+        of the sensor data. Now by default.
+        """
         self.transformation_x = x1
         self.transformation_y = y1
         self.transformation_z = z1
@@ -39,7 +39,7 @@ class BaxterPose:
         self.rotation_z = z3
         self.rotation_w = w
 
-        self.created = time.time()
+        self.created = created if created is not None else time.time()
 
     def __str__(self):
         """String representation of the pose."""
@@ -53,6 +53,10 @@ class BaxterPose:
 
     def _get_position_and_orientation(self):
         """Will return the position and orientation of the pose."""
+        # ROS is imported here so poses can also be used without ROS (e.g in
+        # the simulation, see simulation.py).
+        from geometry_msgs.msg import Point, Quaternion
+
         position = Point(self.transformation_x,
                          self.transformation_y,
                          self.transformation_z)
@@ -66,11 +70,17 @@ class BaxterPose:
 
     def get_pose(self):
         """Will return a Pose object."""
+        from geometry_msgs.msg import Pose
+
         position, orientation = self._get_position_and_orientation()
         return Pose(position=position, orientation=orientation)
 
     def get_pose_stamped(self):
         """Will return a pose stamped object of the pose."""
+        import rospy
+        from geometry_msgs.msg import PoseStamped
+        from std_msgs.msg import Header
+
         pose = self.get_pose()
         header = Header(stamp=rospy.Time.now(), frame_id='base')
 
@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+"""
+Cashier Benchmark.
+
+Drives  many  scripted  transactions through the `Cashier`, on the simulation
+backend (see simulation.py), and reports its cycle time:
+
+- transactions per minute;
+- seconds per banknote taken from the customer (grab, recognise and stash);
+- seconds per unit of change given back;
+- the time spent in each state of the interaction and each motion phase.
+
+The  transactions  are generated from a seed, hence two runs with the same
+arguments drive exactly the same transactions and their results (written as
+JSON) can be compared across commits to catch regressions.
+
+Example:
+
+    python benchmark.py --transactions 500 --output results.json
+
+    Copyright (C)  2016/2017 The University of Leeds and Rafael Papallas
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# System-wide imports
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+# Project specific imports
+from cashier import GRAB, RECOGNISE, STASH, GIVE_CHANGE
+from simulation import SimulatedClock, SimulationBackend, create_cashier
+
+# Kinds of transactions and how often they occur
+EXACT = "exact"
+OVERPAYMENT = "overpayment"
+FAILED_RECOGNITION = "failed_recognition"
+UNREACHABLE_HAND = "unreachable_hand"
+
+DEFAULT_MIX = {
+    EXACT: 0.4,
+    OVERPAYMENT: 0.3,
+    FAILED_RECOGNITION: 0.15,
+    UNREACHABLE_HAND: 0.15,
+}
+
+# States in which a banknote is taken from the customer
+TAKING_STATES = [GRAB, RECOGNISE, STASH]
+
+# A transaction taking longer than this (simulated) is stopped
+TRANSACTION_TIME_LIMIT = 600
+
+
+def exact_notes(amount):
+    """Will return the fewest 5 and 1 banknotes making up the amount."""
+    return [5] * (amount // 5) + [1] * (amount % 5)
+
+
+def generate_transactions(count, seed=0, mix=None):
+    """
+    Will return `count` transactions, generated from the seed.
+
+    Each transaction is a dictionary with the kind of the transaction, the
+    amount due, the banknotes of the customer and the arguments of the
+    `SimulationBackend`.
+    """
+    mix = mix or DEFAULT_MIX
+    generator = random.Random(seed)
+    kinds = sorted(mix.keys())
+
+    transactions = []
+    for i in range(count):
+        # Pick a kind of transaction by its weight
+        value = generator.random() * sum(mix.values())
+        for kind in kinds:
+            value -= mix[kind]
+            if value <= 0:
+                break
+
+        amount = generator.randint(1, 12)
+        notes = exact_notes(amount)
+        options = {"seed": i}
+
+        if kind == OVERPAYMENT:
+            # Pays with fives only, getting the rest back
+            notes = [5] * ((amount + 4) // 5)
+        elif kind == FAILED_RECOGNITION:
+            options["recogniser_failures"] = [generator.randrange(len(notes))]
+        elif kind == UNREACHABLE_HAND:
+            options["unreachable_for"] = generator.uniform(2, 10)
+
+        transactions.append({"kind": kind,
+                             "amount_due": amount,
+                             "notes": notes,
+                             "options": options})
+
+    return transactions
+
+
+def run_transaction(transaction, clock, durations=None):
+    """
+    Will drive a transaction through the `Cashier`.
+
+    Returns the result of the transaction and the timer summary.
+    """
+    backend = SimulationBackend(transaction["notes"],
+                                clock=clock,
+                                durations=durations,
+                                time_limit=TRANSACTION_TIME_LIMIT,
+                                **transaction["options"])
+    cashier = create_cashier(backend)
+
+    started = clock.now()
+    cashier.amount_due = transaction["amount_due"]
+    cashier.interact_with_customer()
+
+    result = {"kind": transaction["kind"],
+              "seconds": clock.now() - started,
+              "completed": cashier.amount_due == 0,
+              "banknotes_taken": len(cashier.banknotes_given),
+              "change_given": max(sum(cashier.banknotes_given) -
+                                  transaction["amount_due"], 0)}
+
+    return result, backend.planner.timer.summary()
+
+
+def _add_totals(totals, key, entry):
+    """Will add the count and total of the timer entry to the totals."""
+    total = totals.setdefault(key, {"count": 0, "total": 0.0})
+    total["count"] += entry["count"]
+    total["total"] += entry["total"]
+
+
+def _ratio(numerator, denominator):
+    """Will return the ratio, or None if the denominator is zero."""
+    return numerator / float(denominator) if denominator else None
+
+
+def run_benchmark(count, seed=0, durations=None):
+    """Will drive the transactions and return the results."""
+    clock = SimulatedClock()
+    wall_started = time.time()
+
+    states = {}
+    phases = {}
+    kinds = {}
+    results = []
+
+    for transaction in generate_transactions(count, seed):
+        result, summary = run_transaction(transaction, clock, durations)
+        results.append(result)
+
+        kind = kinds.setdefault(result["kind"], {"count": 0, "total": 0.0})
+        kind["count"] += 1
+        kind["total"] += result["seconds"]
+
+        for entry in summary:
+            if entry["phase"] == "state":
+                _add_totals(states, entry["motion"], entry)
+            else:
+                _add_totals(phases, entry["phase"], entry)
+
+    for totals in [states, phases, kinds]:
+        for total in totals.values():
+            total["mean"] = _ratio(total["total"], total["count"])
+
+    seconds = sum([r["seconds"] for r in results])
+    banknotes = sum([r["banknotes_taken"] for r in results])
+    change = sum([r["change_given"] for r in results])
+
+    taking = sum([states[s]["total"] for s in TAKING_STATES if s in states])
+    giving = states.get(GIVE_CHANGE, {}).get("total", 0.0)
+
+    return {
+        "commit": _current_commit(),
+        "seed": seed,
+        "transactions": count,
+        "incomplete": len([r for r in results if not r["completed"]]),
+        "simulated_seconds": seconds,
+        "wall_seconds": time.time() - wall_started,
+        "transactions_per_minute": _ratio(count * 60.0, seconds),
+        "seconds_per_banknote_taken": _ratio(taking, banknotes),
+        "seconds_per_change_unit": _ratio(giving, change),
+        "states": states,
+        "phases": phases,
+        "kinds": kinds,
+    }
+
+
+def _current_commit():
+    """Will return the git commit of the code, or None."""
+    try:
+        with open(os.devnull, "w") as devnull:
+            return subprocess.check_output(
+                        ["git", "rev-parse", "HEAD"],
+                        cwd=os.path.dirname(os.path.abspath(__file__)),
+                        stderr=devnull).strip().decode("ascii")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmarks the cashier")
+    parser.add_argument("--transactions", type=int, default=200,
+                        help="Number of transactions")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed of the generated transactions")
+    parser.add_argument("--durations", default=None,
+                        help="JSON file with the time of each motion")
+    parser.add_argument("--output", default=None,
+                        help="JSON file of the results (default: stdout)")
+
+    args = parser.parse_args()
+
+    durations = None
+    if args.durations is not None:
+        with open(args.durations) as f:
+            durations = json.load(f)
+
+    # The cashier prints its progress, keep the output for the results
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        results = run_benchmark(args.transactions, args.seed, durations)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    else:
+        print(json.dumps(results, indent=2, sort_keys=True))
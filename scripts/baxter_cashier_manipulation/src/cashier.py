@@ -7,6 +7,10 @@ project. The script will take the responsibility to check if a user entered
 the scene, if Baxter owns money to the customer or the customer owns money
 to Baxter and trigger the appropriate algorithms to serve the customer.
 
+The  cashier  uses the robot through a backend  (planner, perception, display
+and clock): `RosBackend` for the real robot (see ros_backend.py) or
+`SimulationBackend` to run without the robot (see simulation.py).
+
     Copyright (C)  2016/2017 The University of Leeds and Rafael Papallas
 
 This program is free software: you can redistribute it and/or modify
@@ -23,221 +27,221 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-# System specific imports
-import copy
-import threading
-import time
-
-import baxter_interface
-from baxter_interface import CHECK_VERSION
-from baxter_interface import CameraController
-
-# ROS specific imports
-import rospy
-import cv2
-import cv_bridge
-import rospkg
-
-from sensor_msgs.msg import (Image,)
-
 # Project specific imports
-from baxter_cashier_manipulation.srv import GetUserPose
-from baxter_cashier_manipulation.srv import RecogniseBanknote
-from baxter_pose import BaxterPose
-from moveit_controller import MoveItPlanner
+from baxter_cashier_manipulation import metrics
+from arm_selection import ArmSelector
+from motion_futures import MotionCancelledError, MotionTimeoutError
+from table_inventory import DEFAULT_LAYOUTS_PATH, ROW_OFFSETS
+from table_inventory import TableInventory, TableLayout, offset_pose
+from table_inventory import load_layouts, save_layouts
+from baxter_cashier_manipulation import tracing
+
+# States of the interaction with the customer
+IDLE = "idle"
+AWAIT_HAND = "await_hand"
+GRAB = "grab"
+RECOGNISE = "recognise"
+STASH = "stash"
+GIVE_CHANGE = "give_change"
+DONE = "done"
+
+# Maximum time, in seconds, spent in the states able to give up. Waiting for
+# a hand times out back to idle (which shows the screen again), the motion to
+# the hand is stopped. The other states have no timeout.
+STATE_TIMEOUTS = {
+    AWAIT_HAND: 30.0,
+    GRAB: 30.0,
+}
 
 
-class ImageGenerator:
-    """
-        This class create dynamic images on the fly. Using some image templates
-        it will write text on the image using OpenCV library. The images are
-        the amount due and change due images that are displayed on Baxter's
-        head screen.
+class Cashier:
     """
-    def __init__(self):
-        """
-            Constructor that load the templates and some other constant
-            variables.
-        """
-        rospack = rospkg.RosPack()
-        path = rospack.get_path('baxter_cashier_manipulation')
-        full_path = path + "/img/"
-
-        self.template_amount_due = cv2.imread(full_path + 'amount_due_template.png')
-        self.template_change_due = cv2.imread(full_path + 'change_due_template.png')
-        self.thank_you_image = cv2.imread(full_path + 'thank_you_message.png')
-
-        # Vertical banknotes
-        self.five_bill = cv2.imread(full_path + 'five_bill_vertical.png')
-        self.one_bill = cv2.imread(full_path + 'one_bill_vertical.png')
-
-        # Reise the banknotes to smaller so they can fit
-        self.five_bill = cv2.resize(self.five_bill, (100, 180))
-        self.one_bill = cv2.resize(self.one_bill, (100, 180))
-
-        self.font = cv2.FONT_HERSHEY_SIMPLEX
-        self.x_offset = 30
-        self.y_offset = 350
-
-    def generate_change_due(self, change_due):
-        """Generates the change due screen with the change due value on it."""
-        if change_due == 0:
-            return self.thank_you_image
+    Main script that put everything together.
 
-        img = copy.deepcopy(self.template_change_due)
-        cv2.putText(img, str(change_due), (650, 323), self.font, 2, (0, 0, 0), 3)
-        return img
+    This script is the main logic of the project, it uses all the pieces to
+    achieve the end result, from picking money, returning change, doing the
+    money recognition etc.
+    """
 
-    def generate_amount_due(self, amount_due, banknotes_given):
+    def __init__(self, backend, inventory=None):
         """
-            Generates the amount due with the banknotes given so far appended
-            on it.
-        """
-        def get_image_from_number(number):
-            return self.five_bill if number == 5 else self.one_bill
-
-        self.x_offset = 30
-        img = copy.deepcopy(self.template_amount_due)
-        cv2.putText(img, str(amount_due), (650, 130), self.font, 2, (0, 0, 0), 3)
-
-        for number in banknotes_given:
-            banknote_image = copy.deepcopy(get_image_from_number(number))
-            img[self.y_offset:self.y_offset+banknote_image.shape[0], self.x_offset:self.x_offset+banknote_image.shape[1]] = banknote_image
-            self.x_offset += 120
-
-        return img
+        Default constructor that setup the environemnt.
 
+        - backend: the robot (e.g `RosBackend` or `SimulationBackend`).
+        - inventory: the `TableInventory` of the banknotes on the table. If
+        not given, the layouts of the table saved by the last calibration are
+        loaded (see `load_table`).
+        """
+        self.backend = backend
+        self.planner = backend.planner
+        self.perception = backend.perception
+        self.display = backend.display
+        self.clock = backend.clock
 
-class Banknote:
-    """This class represent a single banknote on the table."""
+        self.amount_due = 0
+        self.customer_last_pose = None
 
-    def __init__(self, pose):
-        """Default constructor."""
-        self.pose = pose
-        self.is_available = True
+        # File of the layouts of the banknotes on the table, saved once the
+        # operator has calibrated the table. Set `~recalibrate_table` to
+        # calibrate the table again, and `~spot_check_table` to move the arms
+        # to a banknote of the loaded layouts before serving customers.
+        self.table_layouts_path = backend.get_param("~table_layouts",
+                                                    DEFAULT_LAYOUTS_PATH)
+        self.recalibrate_table = backend.get_param("~recalibrate_table",
+                                                   False)
+        self.spot_check = backend.get_param("~spot_check_table", False)
+
+        self.inventory = inventory
+        if self.inventory is None:
+            self.load_table()
+
+        # If True, the operator is assumed to refill the table before every
+        # customer. Otherwise the table is refilled by `restock`.
+        self.restock_each_customer = backend.get_param(
+                                                "~restock_each_customer", True)
 
+        self.banknotes_given = []
 
-class BanknotesOnTable:
-    """This class represents the banknotes on the one side of the table."""
+        # Timeouts of the states (see STATE_TIMEOUTS), can be overridden by
+        # the `~state_timeouts` ROS parameter.
+        self.state_timeouts = dict(STATE_TIMEOUTS)
+        self.state_timeouts.update(backend.get_param("~state_timeouts", {}))
 
-    def __init__(self, initial_pose, table_side, num_of_remaining_banknotes):
-        """Default constructor."""
-        self._table_side = table_side
-        self._initial_pose = initial_pose
-        self._number_of_remaining_banknotes = num_of_remaining_banknotes
-        self.banknotes = [Banknote(initial_pose)]
+        # Frames per second of the skeleton tracker, the customer's hands are
+        # checked once per frame while waiting for them.
+        self.perception_rate = backend.get_param("~perception_rate", 30.0)
 
-        self._calculate_pose_of_remaining_poses(table_side)
+        # Maximum age, in seconds, of a hand pose (from the time it was
+        # observed by the skeleton tracker) to move the arm to it.
+        self.max_hand_pose_age = backend.get_param("~max_hand_pose_age", 1.0)
 
-    def is_left(self):
-        """
-        Will check if the side of the table is the left one.
+        # Chooses the arm taking the money from the customer's hand, by the
+        # estimated time of the motion.
+        self.arm_selector = ArmSelector(
+                        self.planner,
+                        joint_speed=backend.get_param("~arm_joint_speed", 1.0),
+                        busy_penalty=backend.get_param("~arm_busy_penalty",
+                                                       2.0))
 
-        Will return True if is the left side of the table, false otherwise.
-        """
-        return True if self._table_side == "left" else False
+        # The customer's hand to take the money from: (pose, arm)
+        self._customer_hand = None
 
-    def is_right(self):
+    def load_table(self):
         """
-        Will check if the side of the table is the right one.
+        Will load the banknotes on the table, without asking the operator.
 
-        Will return True if is the left side of the table, false otherwise.
+        The layouts saved by the last calibration are loaded. If there are
+        none (or `~recalibrate_table` is set), the operator is asked to
+        calibrate both sides of the table and the layouts are saved for the
+        next start. A layouts file of a newer version raises
+        `LayoutsFileError`, rather than being calibrated again and replaced.
         """
-        return True if self._table_side == "right" else False
+        layouts = None
+        if not self.recalibrate_table:
+            layouts = load_layouts(self.table_layouts_path)
 
-    def reset_availability_for_all_banknotes(self):
-        """
-        Will reset the availability of all banknotes.
+        if layouts:
+            self.inventory = TableInventory.from_layouts(layouts)
+            print("Loaded {} banknotes on the table from {}".format(
+                            len(self.inventory.slots), self.table_layouts_path))
+            self.validate_table()
 
-        Each banknote has a flag variable called "is_available", which flip to
-        false if Baxter pick it, so Baxter is aware of which ones are not
-        on the table.
+            if self.spot_check:
+                self.spot_check_table()
 
-        This function will reset all of them to true, assuming that the
-        operator has also return the banknotes to the posistions.
-        """
-        for banknote in self.banknotes:
-            banknote.is_available = True
+            return self.inventory
 
-    def get_next_available_banknote(self):
-        """Will return the next available banknote on the table."""
-        for banknote in self.banknotes:
-            if banknote.is_available:
-                banknote.is_available = False
-                return banknote
+        self.inventory = TableInventory()
+        self.set_banknotes_on_table(side="left")
+        self.set_banknotes_on_table(side="right")
 
-        return None
+        save_layouts(self.inventory.layouts, self.table_layouts_path)
+        print("Saved the banknotes on the table to {}".format(
+                                                    self.table_layouts_path))
 
-    def _calculate_pose_of_remaining_poses(self, side):
-        """
-        Will calculate the remaining banknotes on the table.
+        return self.inventory
 
-        This will calculate the poses of the remaining banknotes on the table.
+    def validate_table(self):
         """
-        static_x_to_be_added = 0.10  # 10cm
-        static_y_to_be_added = -0.10
+        Will exclude the banknotes of the table the arms can not reach.
 
-        if side == "right":
-            for _ in range(0, self._number_of_remaining_banknotes):
-                new_pose = copy.deepcopy(self.banknotes[-1])
-                new_pose.pose.transformation_x += static_x_to_be_added
-                self.banknotes.append(new_pose)
-
-        if side == "left":
-            for _ in range(0, self._number_of_remaining_banknotes):
-                new_pose = copy.deepcopy(self.banknotes[-1])
-                new_pose.pose.transformation_y += static_y_to_be_added
-                self.banknotes.append(new_pose)
+        The reachability of all the banknotes of a side is checked in a single
+        batch (see `are_poses_reachable_by_arm`). Will return the number of
+        banknotes excluded.
 
+        If the reachability can not be checked (the IK service failed), no
+        banknote of the side is excluded.
+        """
+        excluded = 0
 
-class Cashier:
-    """
-    Main script that put everything together.
+        for side, arm in [("left", self.planner.left_arm),
+                          ("right", self.planner.right_arm)]:
+            slots = [slot for slot in self.inventory.slots
+                     if slot.side == side and slot.is_reachable]
+            if len(slots) == 0:
+                continue
 
-    This script is the main logic of the project, it uses all the pieces to
-    achieve the end result, from picking money, returning change, doing the
-    money recognition etc.
-    """
+            reachable = self.planner.are_poses_reachable_by_arm(
+                                        [slot.pose for slot in slots], arm)
+            if reachable is None:
+                print("Unable to check the banknotes on the {} side of the "
+                      "table, all of them will be used".format(side))
+                continue
 
-    def __init__(self):
-        """Default constructor that setup the environemnt."""
-        # This is the camera topic to be used for money recognition (Baxter's
-        # head camera or RGB-D camera)
-        self._money_recognition_camera_topic = "/cameras/head_camera/image"
+            for slot, is_reachable in zip(slots, reachable):
+                if not is_reachable:
+                    self.inventory.exclude(slot)
+                    excluded += 1
 
-        # Baxter's libms configured
-        self.planner = MoveItPlanner()
+        if excluded > 0:
+            print("{} banknotes on the table are not reachable and will not "
+                  "be used".format(excluded))
 
-        self.amount_due = 0
-        self.customer_last_pose = None
+        return excluded
 
-        self.banknotes_table_left = self.set_banknotes_on_table(side="left")
-        self.banknotes_table_right = self.set_banknotes_on_table(side="right")
+    def spot_check_table(self):
+        """
+        Will move each arm above a single banknote of its side of the table.
 
-        self.banknote_recognition_task_completed = False
+        The last banknote of the side is the furthest from the first one, so
+        the operator can see at a glance whether the table (or the robot) has
+        moved since the layouts were saved.
+        """
+        for side, arm in [("left", self.planner.left_arm),
+                          ("right", self.planner.right_arm)]:
+            slots = [slot for slot in self.inventory.slots
+                     if slot.side == side and slot.is_reachable]
+            if len(slots) == 0:
+                continue
 
-        self.banknotes_given = []
-        self.image_generator = ImageGenerator()
+            self.planner.active_hand = arm
+            self.planner.move_to_position(offset_pose(slots[-1].pose, z=0.10),
+                                          arm,
+                                          "banknote_above")
+            self.planner.set_neutral_position_of_limb()
 
     def set_banknotes_on_table(self, side):
         """
         Will record and calculate the poses of the banknotes on the table.
 
-        This function will ask two questions from the user:
+        The banknotes of a side are a grid of rows and columns. This function
+        will ask these questions from the user:
         (1) To move Baxter's arm to the position of the first banknote.
-        (2) The number of the remaining banknotes on the table.
+        (2) The value of the banknotes on this side of the table.
+        (3) The number of the remaining banknotes in the first row.
+        (4) The number of rows.
+        (5) To move Baxter's arm to the last banknote of the first row and the
+        first banknote of the last row (if more than one).
 
-        It will then record the pose and also calculate the poses of the
-        remaining banknotes.
+        It will then record the poses (the corners of the grid) and calculate
+        the poses of the remaining banknotes. The banknotes the arm can not
+        reach are reported and never used.
 
-        This function will also move Baxter's arms to the remaining banknotes
-        just to ensure that the remaining banknotes are placed correctly.
+        This function will also move Baxter's arms to the other corners of the
+        grid just to ensure that the banknotes are placed correctly.
 
-        Finally the returned list of poses will include a list tuple
-        (pose, bool) for every banknote on the table of either left or right
-        side. The `pose` is the pose of the corresponding banknote, where the
-        bool value (initially set to True) represents if Baxter have used this
-        banknote.
+        Finally the banknotes are added to the inventory, and their slots are
+        returned.
         """
         if side == "left":
             arm = self.planner.left_arm
@@ -252,32 +256,85 @@ class Cashier:
         raw_input("Press ENTER to set the pose...")
         initial_pose = self.planner.get_end_effector_current_pose(side)
 
-        # Calculate the remaining poses
-        num = int(raw_input("2. Number of REMAINING banknotes on this side of \
-                            the table? : "))
+        denomination = raw_input("2. Value of the banknotes on this side of \
+                                 the table? (default 1): ")
+        denomination = int(denomination) if denomination.strip() else 1
 
-        # Create the table with the banknotes. This will also auto-calculate
+        # Calculate the remaining poses
+        num = int(raw_input("3. Number of REMAINING banknotes in the first \
+                            row? : "))
+
+        rows = raw_input("4. Number of rows of banknotes? (default 1): ")
+        rows = int(rows) if rows.strip() else 1
+
+        # The corners of the grid give the spacing of the columns and rows.
+        # Without them, the banknotes of a row are spaced by the default
+        # offset of the side.
+        row_end_pose = None
+        if num > 0:
+            print("5. Move Baxter's {} hand above the last banknote of the "
+                  "first row".format(side))
+            raw_input("Press ENTER to set the pose...")
+            row_end_pose = self.planner.get_end_effector_current_pose(side)
+
+        column_end_pose = None
+        if rows > 1:
+            print("6. Move Baxter's {} hand above the first banknote of the "
+                  "last row".format(side))
+            raw_input("Press ENTER to set the pose...")
+            column_end_pose = self.planner.get_end_effector_current_pose(side)
+
+        # Add the banknotes to the inventory. This will also auto-calculate
         # the poses of the remaining banknotes on the table.
-        banknotes_on_table = BanknotesOnTable(initial_pose=initial_pose,
-                                              table_side=side,
-                                              num_of_remaining_banknotes=num)
-
-        # To ensure that the poses were calculated correctly, this will go
-        # through the remaining banknotes and will move baxter there to show
-        # to user exactly what the pose of the remaining banknotes is.
-        for banknote in banknotes_on_table.banknotes[1:]:
-            self.planner.move_to_position(banknote.pose, arm)
-            rospy.sleep(1)
-
-        # Once calibration is done, will move Baxter's arm back to normal pose
-        self.planner.active_hand = arm
-        banknote_above = copy.deepcopy(banknote)
-        banknote_above.pose.transformation_z += 0.10
-        self.planner.move_to_position(banknote_above.pose, arm)
+        layout = TableLayout.from_anchors(side, denomination, initial_pose,
+                                          row_end_pose, column_end_pose,
+                                          rows, num + 1)
+        slots = self.inventory.add_layout(layout)
+
+        # Check all the banknotes at once, instead of moving to each one
+        reachable = self.planner.are_poses_reachable_by_arm(
+                                        [slot.pose for slot in slots], arm)
+        if reachable is None:
+            print("Unable to check whether the banknotes are reachable")
+            reachable = [True] * len(slots)
+
+        for slot, is_reachable in zip(slots, reachable):
+            if not is_reachable:
+                print("Banknote {} is not reachable".format(slot.index))
+                self.inventory.exclude(slot)
+
+        # To ensure that the poses were calculated correctly, this will move
+        # baxter to the last corner of the grid to show to user exactly what
+        # the pose of the remaining banknotes is.
+        if slots[-1].is_reachable:
+            if len(slots) > 1:
+                self.planner.move_to_position(slots[-1].pose, arm,
+                                              "calibration")
+                self.clock.sleep(1)
+
+            # Once calibration is done, will move Baxter's arm back to normal
+            # pose
+            self.planner.active_hand = arm
+            self.planner.move_to_position(offset_pose(slots[-1].pose, z=0.10),
+                                          arm,
+                                          "banknote_above")
 
         self.planner.set_neutral_position_of_limb()
 
-        return banknotes_on_table
+        return slots
+
+    def restock(self, side=None, denomination=None):
+        """
+        Will make the banknotes on the table available again.
+
+        Called once the operator has refilled the table (or only one side or
+        denomination of it). The poses of the banknotes are not calibrated
+        again.
+        """
+        restocked = self.inventory.restock(side, denomination)
+        print("Restocked {} banknotes".format(restocked))
+
+        return restocked
 
     def interact_with_customer(self):
         """
@@ -290,115 +347,214 @@ class Cashier:
         zero. Therefore, before calling this function, ensure that you have
         changed the self.amount_due variable to either a positive or negative
         value.
-        """
-        def pose_is_outdated(pose):
-            """Will check whether the pose is recent or not."""
-            return (time.time() - pose.created) > 3
 
+        The interaction is a state machine:
+
+            idle -> await_hand -> grab -> recognise -> stash -> idle
+            idle -> give_change -> idle
+            idle -> done
+
+        The interaction stops in give_change if no banknote on the table fits
+        the change due.
+
+        Each state returns the next one. The time spent in each state is
+        recorded by the timer of the planner (phase "state"). The states are
+        given their deadline (see STATE_TIMEOUTS), or None if they have no
+        timeout.
+        """
         # Disable some Baxter's cameras and ensure that head camera is enabled.
-        try:
-            left_hand_camera = CameraController('left_hand_camera')
-            head_camera = CameraController('head_camera')
-            left_hand_camera.close()
-            head_camera.open()
-        except:
-            pass
+        self.backend.enable_head_camera()
 
         # Make Baxter's screen eyes to shown normal
-        self.show_eyes_normal()
+        self.display.show_eyes_normal()
         self.banknotes_given = []
 
         # Since we have new iteration here, ensure that the position of the
         # banknotes on the table is reset to normal.
-        self.banknotes_table_left.reset_availability_for_all_banknotes()
-        self.banknotes_table_right.reset_availability_for_all_banknotes()
-
-        # Do this while customer own money or baxter owns money
-        while self.amount_due != 0:
-            # If the amount due is negative, Baxter owns money
-            if self.amount_due < 0:
-                change_due_image = self.image_generator.generate_change_due(change_due=abs(self.amount_due))
-                self.show_image_to_baxters_head_screen(image_path=None, image=change_due_image)
-                self.give_money_to_customer()
-                continue
+        if self.restock_each_customer:
+            self.inventory.restock()
+
+        states = {IDLE: self._idle,
+                  AWAIT_HAND: self._await_hand,
+                  GRAB: self._grab,
+                  RECOGNISE: self._recognise,
+                  STASH: self._stash,
+                  GIVE_CHANGE: self._give_change,
+                  DONE: self._done}
+
+        with tracing.span("transaction", "cashier",
+                          amount_due=self.amount_due):
+            state = IDLE
+            while state is not None and not self.backend.is_shutdown():
+                timeout = self.state_timeouts.get(state)
+                started = self.clock.now()
+                deadline = started + timeout if timeout is not None else None
+
+                with self.planner.timer.span("state", "none", state):
+                    next_state = states[state](deadline)
+
+                if timeout is not None and \
+                        self.clock.now() - started > timeout:
+                    print("State {} took {:.1f} s (timeout {} s)".format(
+                                state, self.clock.now() - started, timeout))
+                    tracing.instant("state_timeout", "cashier", state=state)
+
+                state = next_state
+
+    def _idle(self, deadline):
+        """Will show the amount due and decide what to do next."""
+        if self.amount_due == 0:
+            return DONE
+
+        # If the amount due is negative, Baxter owns money
+        if self.amount_due < 0:
+            return GIVE_CHANGE
+
+        self.display.show_amount_due(self.amount_due, self.banknotes_given)
+
+        return AWAIT_HAND
+
+    def _await_hand(self, deadline):
+        """
+        Will wait for a recent and reachable hand of the customer.
+
+        The hands are checked once per perception frame, sleeping in between.
+        Once a hand is seen, the arm taking the money from it is the one
+        estimated to get there first (see arm_selection.py).
+        """
+        def pose_is_outdated(pose):
+            """Will check whether the pose is recent or not."""
+            return (self.clock.now() - pose.created) > self.max_hand_pose_age
 
-            print self.banknotes_given
-            amount_due_image = self.image_generator.generate_amount_due(amount_due=self.amount_due,
-                                                                        banknotes_given=self.banknotes_given)
-            self.show_image_to_baxters_head_screen(image_path=None, image=amount_due_image)
+        rate = self.clock.rate(self.perception_rate)
+        started = self.clock.now()
 
+        # Without a deadline, the customer is waited for until shutdown
+        while (deadline is None or self.clock.now() < deadline) and \
+                not self.backend.is_shutdown():
             # Get the hand pose of customer's two hands.
             left_pose, right_pose = self.get_pose_from_space()
 
             # If the pose detected is not too recent, ignore.
-            if pose_is_outdated(left_pose) and pose_is_outdated(right_pose):
-                continue
-
-            # NOTE that we use right hand for left pose and left hand for right
-            # pose. Baxter's left arm is closer to user's right hand and vice
-            # versa.
-            if self.pose_is_reachable(left_pose):
-                self.take_money_from_customer(left_pose,
-                                              self.planner.right_arm)
+            poses = [pose for pose in [left_pose, right_pose]
+                     if not pose_is_outdated(pose) and
+                     self.pose_is_reachable(pose)]
 
-            elif self.pose_is_reachable(right_pose):
-                self.take_money_from_customer(right_pose,
-                                              self.planner.left_arm)
-            else:
-                print("Wasn't able to move hand to goal position")
+            if len(poses) > 0:
+                # Any arm may take the money from any hand, the cheapest
+                # pair is chosen.
+                self._customer_hand = self.arm_selector.select(poses)
+                if self._customer_hand is not None:
+                    metrics.observe("hand_wait_time",
+                                    self.clock.now() - started)
+                    return GRAB
 
-        thank_you_message_image = self.image_generator.generate_change_due(change_due=0)
-        self.show_image_to_baxters_head_screen(image_path=None, image=thank_you_message_image)
-        rospy.sleep(3)
+            # Wait for the next frame
+            rate.sleep()
 
-    def pose_is_reachable(self, pose):
-        """Will check whether the given pose is reachable."""
-        if not pose.is_empty():
-            # Verify that Baxter can move there
-            is_reachable = self.planner.is_pose_within_reachable_area(pose)
-            return is_reachable
+        return IDLE
 
-        return False
+    def _grab(self, deadline):
+        """Will take the banknote from the customer's hand."""
+        pose, arm = self._customer_hand
 
-    def take_money_from_customer(self, pose, arm):
-        """Will take money from the customer."""
         # Move there to get the money from customer's hand.
-        self.planner.move_to_position(pose, arm)
+        motion = self.planner.move_to_position_async(pose, arm,
+                                                     "customer_hand")
+        try:
+            motion.result(max(deadline - self.clock.now(), 0)
+                          if deadline is not None else None)
+        except (MotionTimeoutError, MotionCancelledError):
+            motion.cancel()
+            print("Wasn't able to move hand to goal position")
+            metrics.increment("grab_retries")
+            self.planner.set_neutral_position_of_limb_async()
+            return IDLE
 
         # Open/Close the Gripper to catch the money from customer's hand
         self.planner.open_gripper()
-        rospy.sleep(1)
+        self.clock.sleep(1)
         self.planner.close_gripper()
 
+        return RECOGNISE
+
+    def _recognise(self, deadline):
+        """Will show the banknote to the head camera and recognise it."""
         # Moves Baxter hand to head for money recognition
         self.planner.move_hand_to_head_camera()
 
-        # Here show Baxter's eyes moving to show that the robot is not stuck
-        # but is instead "thinking" (because eyes are moving)
-        self.run_nonblocking(self.make_eyes_animated_reading_banknote)
-
         # Start reading the banknote value using money recognition
+        started = self.clock.now()
         banknote_value = self.get_banknote_value()
+        metrics.observe("recognition_time", self.clock.now() - started)
 
-        if banknote_value != -1:
-            # Show image of the recognised banknote.
-            image = "one_bill_recognised.png"
-            if banknote_value == 5:
-                image = "five_bill_recognised.png"
+        if banknote_value is None or banknote_value == -1:
+            metrics.increment("failed_recognitions")
+            self.display.show_image("unable_to_recognise.png")
 
-            self.show_image_to_baxters_head_screen(image)
+            # The arm returns to neutral in the background, so the screen and
+            # the perception of the next banknote are not waiting for it.
+            self.planner.set_neutral_position_of_limb_async()
+            return IDLE
 
-            self.banknotes_given.append(banknote_value)
+        # Show image of the recognised banknote.
+        image = "one_bill_recognised.png"
+        if banknote_value == 5:
+            image = "five_bill_recognised.png"
 
-            # Since we detected amount, subtract the value from the own amount
-            self.amount_due -= int(banknote_value)
-            self.customer_last_pose = (pose, arm)
-            self.planner.leave_banknote_to_the_table()
-            rospy.sleep(1)
-        else:
-            self.show_image_to_baxters_head_screen("unable_to_recognise.png")
+        self.display.show_image(image)
 
-        self.planner.set_neutral_position_of_limb()
+        self.banknotes_given.append(banknote_value)
+
+        # Since we detected amount, subtract the value from the own amount
+        self.amount_due -= int(banknote_value)
+        self.customer_last_pose = self._customer_hand
+
+        return STASH
+
+    def _stash(self, deadline):
+        """Will leave the banknote taken from the customer to the table."""
+        self.planner.leave_banknote_to_the_table()
+        self.clock.sleep(1)
+
+        # The arm returns to neutral in the background, so the screen and the
+        # perception of the next banknote are not waiting for it. Any next
+        # motion of this arm will wait for it to complete.
+        self.planner.set_neutral_position_of_limb_async()
+
+        return IDLE
+
+    def _give_change(self, deadline):
+        """Will give one banknote of the change to the customer."""
+        self.display.show_change_due(abs(self.amount_due))
+
+        if not self.give_money_to_customer():
+            # The change can not be given, the operator has to take over
+            print("No banknote on the table for the change due ({}), "
+                  "please restock the table".format(-self.amount_due))
+            metrics.increment("change_unavailable")
+            tracing.instant("change_unavailable", "cashier",
+                            change_due=-self.amount_due)
+            return None
+
+        return IDLE
+
+    def _done(self, deadline):
+        """Will thank the customer."""
+        metrics.increment("transactions_completed")
+        self.display.show_change_due(0)
+        self.clock.sleep(3)
+
+        return None
+
+    def pose_is_reachable(self, pose):
+        """Will check whether the given pose is reachable."""
+        if not pose.is_empty():
+            # Verify that Baxter can move there
+            is_reachable = self.planner.is_pose_within_reachable_area(pose)
+            return is_reachable
+
+        return False
 
     def get_banknote_value(self):
         """"Will do the money recognition and will return the detected amount.
@@ -406,179 +562,126 @@ class Cashier:
         This will either return a correct amount like 1 or 5 but also -1 if
         nothing detected.
         """
-        self.banknote_recognition_task_completed = False
-
-        # This method blocks until the service 'get_user_pose' is available
-        rospy.wait_for_service('recognise_banknote')
+        # Here show Baxter's eyes moving to show that the robot is not stuck
+        # but is instead "thinking" (because eyes are moving)
+        self.display.start_reading_animation()
 
         try:
-            # Handle for calling the service
-            recognise_banknote = rospy.ServiceProxy('recognise_banknote',
-                                                    RecogniseBanknote)
-
-            # Use the handle as any other normal function
-            value = recognise_banknote(self._money_recognition_camera_topic)
-            self.banknote_recognition_task_completed = True
-            return value.banknote_amount
-        except rospy.ServiceException as e:
-            print("Service call failed: %s" % e)
-
-        self.banknote_recognition_task_completed = True
-        return None
+            return self.perception.recognise_banknote()
+        finally:
+            self.display.stop_reading_animation()
 
-    def run_nonblocking(self, function):
-        """
-        Will run a function in a separate thread.
+    def pick_banknote_from_slot(self, arm, slot):
+        """Will pick up the banknote of the (allocated) slot."""
+        self.planner.active_hand = arm
+        self.planner.open_gripper()
 
-        Usually needed for the "eye animation" which does not need to block
-        the entire program, but needs to happen at the same time with another
-        task.
-        """
-        thread = threading.Thread(target=function)
-        thread.start()
-
-    def make_eyes_animated_reading_banknote(self):
-        """Will create the illusion that the eyes are moving."""
-        funcs = [self.show_eyes_focusing,
-                      self.show_eyes_focusing_right,
-                      self.show_eyes_focusing_left,
-                      self.show_eyes_focusing_right,
-                      self.show_eyes_focusing_left]
-
-        while self.banknote_recognition_task_completed == False:
-            for func in funcs:
-                func()
-
-    def show_eyes_normal(self):
-        """Will show normal eyes to Baxter's screen."""
-        self.show_image_to_baxters_head_screen("normal_eyes.png")
-
-    def show_eyes_focusing(self):
-        """Will show focusing eyes to Baxter's screen."""
-        self.show_image_to_baxters_head_screen("looking_eyes.png")
-
-    def show_eyes_focusing_left(self):
-        """Will show focusing eyes looking to left to Baxter's screen."""
-        self.show_image_to_baxters_head_screen("looking_left_eyes.png")
-
-    def show_eyes_focusing_right(self):
-        """Will show focusing eyes looking to right to Baxter's screen."""
-        self.show_image_to_baxters_head_screen("looking_right_eyes.png")
-
-    def show_image_to_baxters_head_screen(self, image_path, image=None):
-        """Will show an image to Baxter's screen."""
-        if image_path:
-            rospack = rospkg.RosPack()
-            path = rospack.get_path('baxter_cashier_manipulation')
-            img = cv2.imread(path + "/img/" + image_path)
-
-        if image is not None:
-            img = image
-
-        msg = cv_bridge.CvBridge().cv2_to_imgmsg(img, encoding="bgr8")
-        pub = rospy.Publisher('/robot/xdisplay',
-                              Image,
-                              latch=True,
-                              queue_size=2)
-        pub.publish(msg)
-
-        # Sleep to allow for image to be published
-        rospy.sleep(1)
-
-    def pick_banknote_from_table(self, arm):
+        # Create a new pose from the banknote pose, just to make sure Baxter
+        # first move a bit above the banknote and then actually pick it.
+        banknote_above = offset_pose(slot.pose, z=0.10)
+        self.planner.move_to_position(banknote_above, arm, "banknote_above")
+
+        # Now actually move exactly where the pose is to pick the banknote
+        self.planner.move_to_position(slot.pose, arm, "banknote")
+        self.planner.close_gripper()
+        self.planner.move_to_position(banknote_above, arm, "banknote_above")
+
+    def give_money_to_customer(self):
         """
-        Will pick a banknote from the table.
+        Will return change to the customer.
+
+        Gives the largest banknote, available on either side of the table,
+        not exceeding the change due. Of these, the banknote nearest to the
+        customer's hand is given, by the arm of its side.
 
-        Will find the next available banknote from the table and will pick it
-        up.
+        Will return False, without moving, if no banknote on the table fits
+        the change due.
         """
-        self.planner.active_hand = arm
-        self.planner.open_gripper()
+        customer_hand_pose, _ = self.customer_last_pose
 
-        # Find the next available banknote from the table.
-        if arm.is_left():
-            banknote = self.banknotes_table_left.get_next_available_banknote()
-        elif arm.is_right():
-            banknote = self.banknotes_table_right.get_next_available_banknote()
-
-        # If one is available.
-        if banknote is not None:
-            # Go there and pick it up.
-
-            # Create a new pose from the banknote pose, just to make sure
-            # Baxter first move a bit above the banknote and then actually
-            # pick it.
-            banknote_above = copy.deepcopy(banknote)
-            banknote_above.pose.transformation_z += 0.10
-            self.planner.move_to_position(banknote_above.pose, arm)
-
-            # Now actually move exactly where the pose is to pick the banknote
-            self.planner.move_to_position(banknote.pose, arm)
-            self.planner.close_gripper()
-            self.planner.move_to_position(banknote_above.pose, arm)
-        else:
-            print("No available banknotes on the table...")
+        change_due = -self.amount_due
+        denominations = [d for d in self.inventory.denominations()
+                         if d <= change_due]
+        if len(denominations) == 0:
+            return False
 
-    def give_money_to_customer(self):
-        """Will return change to the customer."""
-        customer_hand_pose, baxter_arm = self.customer_last_pose
-        money_to_give_back = 1
+        slot = self.inventory.allocate_nearest(denominations[0],
+                                               customer_hand_pose)
+        if slot is None:
+            return False
+
+        if slot.side == "left":
+            baxter_arm = self.planner.left_arm
+        else:
+            baxter_arm = self.planner.right_arm
 
         # Pick banknote from the table.
-        self.pick_banknote_from_table(baxter_arm)
+        self.pick_banknote_from_slot(baxter_arm, slot)
 
         # Move torwards to customer's hand.
         self.planner.move_to_position(customer_hand_pose,
-                                      baxter_arm)
+                                      baxter_arm,
+                                      "customer_hand")
 
         # Waiting user to reach the robot to get the money
-        rospy.sleep(1)
+        self.clock.sleep(1)
         self.planner.open_gripper()
 
         # Now that the user got his banknote update the amount due variable.
-        self.amount_due += money_to_give_back
+        self.amount_due += slot.denomination
 
-        # If amount is not negative, then move the hand to neutral position.
+        # If amount is not negative, then move the hand to neutral position,
+        # while the thank you message is shown to the customer.
         if self.amount_due >= 0:
-            self.planner.set_neutral_position_of_limb()
+            self.planner.set_neutral_position_of_limb_async()
+
+        return True
 
     def get_pose_from_space(self):
         """Will return the user's hand-pose from space."""
-        # This method blocks until the service 'get_user_pose' is available
-        rospy.wait_for_service('get_user_pose')
-
-        try:
-            # Handle for calling the service
-            get_user_pose = rospy.ServiceProxy('get_user_pose', GetUserPose)
-
-            # Use the handle as any other normal function
-            # IMPORTANT: Note that for some reason the Skeelton Tracker library
-            # identifies the left hand as the right and the right as left,
-            # hence an easy and quick fix was to request the opposite hand here
-            left_hand = get_user_pose(user_number=1, body_part='right_hand')
-            right_hand = get_user_pose(user_number=1, body_part='left_hand')
-        except rospy.ServiceException as e:
-            print("Service call failed: %s" % e)
-
-        # Left hand pose
-        x1, y1, z1 = left_hand.transformation
-        x2, y2, z2, w = left_hand.rotation
-        left_hand_pose = BaxterPose(x1, y1, z1, x2, y2, z2, w)
-
-        # Right hand pose
-        x1, y1, z1 = right_hand.transformation
-        x2, y2, z2, w = right_hand.rotation
-        right_hand_pose = BaxterPose(x1, y1, z1, x2, y2, z2, w)
-
-        return left_hand_pose, right_hand_pose
+        return self.perception.get_hand_poses()
 
 
 if __name__ == '__main__':
+    import rospy
+    import baxter_interface
+    from baxter_interface import CHECK_VERSION
+    from std_msgs.msg import String
+    from ros_backend import RosBackend
+
     rospy.init_node("baxter_cashier")
+    tracing.set_process_name(rospy.get_name())
+    metrics.start_publishing(period=rospy.get_param("~metrics_period", 10.0))
     rs = baxter_interface.RobotEnable(CHECK_VERSION)
     init_state = rs.state().enabled
     rs.enable()
-    cashier = Cashier()
+
+    cashier = Cashier(RosBackend())
+
+    def restock(message):
+        """
+        Will restock the table, on a message on the `~restock` topic.
+
+        The message is empty (the entire table) or "side[:denomination]",
+        e.g "left" or "right:5".
+        """
+        side, _, denomination = message.data.strip().partition(":")
+
+        # A bad message is ignored, rather than raising in the callback
+        if side and side not in ROW_OFFSETS:
+            rospy.logwarn("Unable to restock unknown side '{}'".format(side))
+            return
+
+        try:
+            denomination = int(denomination) if denomination else None
+        except ValueError:
+            rospy.logwarn("Unable to restock unknown denomination '{}'"
+                          .format(denomination))
+            return
+
+        cashier.restock(side or None, denomination)
+
+    rospy.Subscriber("~restock", String, restock)
 
     while True:
         amount_due = int(input("Enter amount due: "))
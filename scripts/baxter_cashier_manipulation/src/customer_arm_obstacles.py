@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+"""
+Customer Arm Obstacles.
+
+The  planning  scene  only  knows about the  static  obstacles of the
+environment  (walls, table, tripod), hence  the planner  is free  to plan paths
+that sweep through the customer's arm. This  module turns the forearms tracked
+by the skeleton tracker (cob_body_tracker) into cylinder collision objects and
+keeps them up to date in the planning scene.
+
+To avoid  flooding  move_group, the forearms  are checked at a bounded rate and
+a forearm is sent again only if it has moved more than a threshold. The
+cylinder stops short of the hand, so Baxter can still reach the customer's
+hand to take or give the money.
+
+    Copyright (C)  2016/2017 The University of Leeds and Rafael Papallas
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# System-wide imports
+import math
+import threading
+
+# ROS-wide imports
+import rospy
+import tf
+from geometry_msgs.msg import Pose
+
+# Project specific imports
+from planning_scene_updater import cylinder_collision_object
+from planning_scene_updater import removal_collision_object
+
+
+def _distance(a, b):
+    """Will return the euclidean distance between two points."""
+    return math.sqrt(sum([(v - w) ** 2 for v, w in zip(a, b)]))
+
+
+def segment_pose(start, end):
+    """
+    Will return the `Pose` of a cylinder going from start to end.
+
+    The pose is at the middle of the segment and its z axis (the axis of the
+    cylinder) points from start to end.
+    """
+    length = _distance(start, end)
+    direction = [(e - s) / length for s, e in zip(start, end)]
+
+    pose = Pose()
+    pose.position.x = (start[0] + end[0]) / 2.0
+    pose.position.y = (start[1] + end[1]) / 2.0
+    pose.position.z = (start[2] + end[2]) / 2.0
+
+    # Rotation of the z axis onto the direction: the rotation axis is their
+    # cross product and the angle comes from their dot product.
+    axis = [-direction[1], direction[0], 0.0]
+    axis_norm = math.sqrt(axis[0] ** 2 + axis[1] ** 2)
+    angle = math.acos(max(-1.0, min(1.0, direction[2])))
+
+    if axis_norm < 1e-9:
+        # Already aligned with the z axis (either way)
+        axis = [1.0, 0.0, 0.0]
+        axis_norm = 1.0
+
+    sine = math.sin(angle / 2.0)
+    pose.orientation.x = axis[0] / axis_norm * sine
+    pose.orientation.y = axis[1] / axis_norm * sine
+    pose.orientation.z = 0.0
+    pose.orientation.w = math.cos(angle / 2.0)
+
+    return pose
+
+
+class CustomerArmObstacles:
+    """Keeps the customer's forearms as collision objects in the scene."""
+
+    def __init__(self, scene_updater, user_number=1, rate=5.0,
+                 threshold=0.03, radius=0.06, hand_clearance=0.15,
+                 max_age=1.0):
+        """
+        Default constructor.
+
+        - scene_updater: the `PlanningSceneUpdater` of the scene.
+        - user_number: the user tracked by the skeleton tracker.
+        - rate: maximum number of scene updates per second.
+        - threshold: distance in metres an elbow or hand has to move before
+        the forearm is updated.
+        - radius: radius of the forearm cylinder.
+        - hand_clearance: length of the forearm kept free of the cylinder
+        next to the hand.
+        - max_age: frames older than this (in seconds) mean the arm is no
+        longer tracked, and its cylinder is removed.
+        """
+        self._updater = scene_updater
+        self._user_number = user_number
+        self._rate = rate
+        self._threshold = threshold
+        self._radius = radius
+        self._hand_clearance = hand_clearance
+        self._max_age = max_age
+
+        self._listener = tf.TransformListener()
+        self._timer = None
+        self._lock = threading.Lock()
+
+        # Side -> (elbow, hand) positions last sent to the scene
+        self._published = {}
+
+    def start(self):
+        """Will start updating the scene periodically."""
+        self._timer = rospy.Timer(rospy.Duration(1.0 / self._rate),
+                                  self.update)
+
+    def stop(self):
+        """Will stop updating the scene and remove the forearms from it."""
+        if self._timer is not None:
+            self._timer.shutdown()
+            self._timer = None
+
+        with self._lock:
+            removals = [removal_collision_object(self._object_name(side),
+                                                 self._updater.frame_id)
+                        for side in self._published]
+            self._published = {}
+
+        if len(removals) > 0:
+            self._updater.apply(removals, acknowledge=False)
+
+    def _object_name(self, side):
+        """Will return the name of the collision object of the forearm."""
+        return "customer_{}_forearm".format(side)
+
+    def _lookup(self, body_part):
+        """Will return the recent position of the body part or None."""
+        target = "cob_body_tracker/user_{}/{}".format(self._user_number,
+                                                      body_part)
+        source = self._updater.frame_id
+
+        try:
+            stamp = self._listener.getLatestCommonTime(source, target)
+            if (rospy.Time.now() - stamp).to_sec() > self._max_age:
+                return None
+
+            position, _ = self._listener.lookupTransform(source, target,
+                                                         stamp)
+        except (tf.Exception, tf.LookupException, tf.ConnectivityException,
+                tf.ExtrapolationException):
+            return None
+
+        return tuple(position)
+
+    def _forearm(self, side):
+        """Will return the (elbow, hand) positions of the side or None."""
+        elbow = self._lookup("{}_elbow".format(side))
+        hand = self._lookup("{}_hand".format(side))
+
+        if elbow is None or hand is None:
+            return None
+
+        return elbow, hand
+
+    def _forearm_object(self, side, elbow, hand):
+        """
+        Will return the collision object of the forearm, or None.
+
+        The cylinder goes from the elbow up to `hand_clearance` before the
+        hand; None is returned if the forearm is shorter than that.
+        """
+        length = _distance(elbow, hand) - self._hand_clearance
+        if length <= 0:
+            return None
+
+        ratio = length / _distance(elbow, hand)
+        end = [e + (h - e) * ratio for e, h in zip(elbow, hand)]
+
+        return cylinder_collision_object(self._object_name(side),
+                                         self._updater.frame_id,
+                                         segment_pose(elbow, end),
+                                         length,
+                                         self._radius)
+
+    def update(self, _=None):
+        """
+        Will send the forearms that moved (or disappeared) to the scene.
+
+        All the changes are sent as a single planning scene diff.
+        """
+        collision_objects = []
+
+        with self._lock:
+            for side in ["left", "right"]:
+                forearm = self._forearm(side)
+                previous = self._published.get(side)
+
+                if forearm is None:
+                    if previous is not None:
+                        collision_objects.append(removal_collision_object(
+                                                    self._object_name(side),
+                                                    self._updater.frame_id))
+                        del self._published[side]
+                    continue
+
+                if previous is not None and \
+                        _distance(forearm[0], previous[0]) < self._threshold \
+                        and _distance(forearm[1], previous[1]) < \
+                        self._threshold:
+                    continue
+
+                collision_object = self._forearm_object(side, *forearm)
+                if collision_object is None:
+                    # Forearm too short (e.g pointing to the camera)
+                    if previous is not None:
+                        collision_objects.append(removal_collision_object(
+                                                    self._object_name(side),
+                                                    self._updater.frame_id))
+                        del self._published[side]
+                    continue
+
+                collision_objects.append(collision_object)
+                self._published[side] = forearm
+
+        if len(collision_objects) > 0:
+            self._updater.apply(collision_objects, acknowledge=False)
@@ -11,19 +11,28 @@ environment that  Baxter can  be, we  define the obstacles around him and using
 the  Factory  Pattern   and  Template  design  pattern  we  are  able  to  have
 extensibility with a very nice way.
 
-If you need to define a new environment here are the steps:
+The  simplest  way to  define a new  environment is to export its obstacles from
+the MoveIt! Rviz plugin as a `.scene` file into the
+`configuration/moveit_scene_objects` directory. Every  `.scene` file found there
+is registered by its file name (e.g `robotics_lab_environment`), and the
+environment used by `moveit_controller.py` is selected by the `~environment`
+ROS parameter.
+
+If you need to define a new environment in code here are the steps:
 
 1. Define a  similar  class with the one listed below: `RoboticsLabEnvironment`
    but make sure the  obstacles  implemented in  `RoboticsLabEnvironment` match
    you own obstacles in  your  environment, and  make sure  you give a sensible
    name for the class.
-2. In `EnvironmentFactory`  class,  define a top-level attribute with  the name
-   of your new class (see the  one already there: `__robotics_lab_environment`)
-3. Implement your getter, as like `def get_robotics_lab_environment():` and use
-   similar logic to return your new class back.
-4. In `moveit_controller.py` find the line
-   `EnvironmentFactory.get_robotics_lab_environment()` and change it to match
-   your new getter method.
+2. In `EnvironmentFactory.initialize`  register your  new class  under a name
+   (see the one already there: `robotics_lab`).
+3. Set the `~environment` ROS parameter to that name.
+
+Environments  and  obstacles are immutable snapshots. Changing one (e.g adding
+an obstacle or  setting  the  frame of the obstacles) returns  a new,
+versioned environment which shares  the unchanged obstacles with the old one,
+hence  environments can be  handed  to other threads or processes  without
+copying them.
 
     Copyright (C)  2016/2017 The University of Leeds and Rafael Papallas
 
@@ -42,8 +51,19 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
 import copy
+import os
+from collections import namedtuple
 from geometry_msgs.msg import PoseStamped
 
+from scene_file import find_scene_files, load_scene
+
+# Directory with the `.scene` files of the project
+DEFAULT_SCENE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(
+                                                                    __file__)),
+                                       "..", "..", "..",
+                                       "configuration",
+                                       "moveit_scene_objects")
+
 
 class EnvironmentFactory:
     """
@@ -51,14 +71,76 @@ class EnvironmentFactory:
 
     In here are defined the getters for the different environments and is the
     class used in other scripts to generate the class environments required.
+
+    Environments are kept in a registry by name. Each environment is created
+    the first time it is requested and cached, hence switching between the
+    environments is cheap.
     """
 
     _robotics_lab_environment = None
 
+    # Name -> function creating the environment
+    _registry = {}
+
+    # Name -> environment already created
+    _environments = {}
+
     @staticmethod
-    def initialize():
-        """Initialise each environment."""
+    def initialize(scene_directory=DEFAULT_SCENE_DIRECTORY):
+        """
+        Initialise each environment.
+
+        Registers the environments defined in code as well as every `.scene`
+        file found in the given directory.
+        """
         EnvironmentFactory._robotics_lab_environment = RoboticsLabEnvironment()
+        EnvironmentFactory.register(
+                        "robotics_lab",
+                        lambda: EnvironmentFactory._robotics_lab_environment)
+
+        if scene_directory is not None and os.path.isdir(scene_directory):
+            for name, path in find_scene_files(scene_directory).items():
+                EnvironmentFactory.register_scene_file(name, path)
+
+    @staticmethod
+    def register(name, create):
+        """
+        Will register an environment under the given name.
+
+        - create: function (without arguments) returning the environment.
+        """
+        EnvironmentFactory._registry[name] = create
+        EnvironmentFactory._environments.pop(name, None)
+
+    @staticmethod
+    def register_scene_file(name, path):
+        """Will register the environment described by the `.scene` file."""
+        EnvironmentFactory.register(name, lambda: SceneFileEnvironment(path))
+
+    @staticmethod
+    def available_environments():
+        """Will return the names of the registered environments."""
+        return sorted(EnvironmentFactory._registry.keys())
+
+    @staticmethod
+    def get_environment(name):
+        """
+        Will return the environment registered under the given name.
+
+        Raises KeyError if there is no such environment.
+        """
+        environment = EnvironmentFactory._environments.get(name)
+
+        if environment is None:
+            if name not in EnvironmentFactory._registry:
+                raise KeyError("Unknown environment '{}', available: {}"
+                               .format(name, ", ".join(
+                                EnvironmentFactory.available_environments())))
+
+            environment = EnvironmentFactory._registry[name]()
+            EnvironmentFactory._environments[name] = environment
+
+        return environment.clone()
 
     @staticmethod
     def get_robotics_lab_environment():
@@ -66,10 +148,20 @@ class EnvironmentFactory:
         return EnvironmentFactory._robotics_lab_environment.clone()
 
 
-class Obstacle:
-    """This represent an obstacle in real world."""
+class Obstacle(namedtuple("Obstacle", ["name", "position", "size",
+                                       "orientation", "frame_id"])):
+    """
+    This represent an obstacle in real world.
+
+    Obstacles are immutable: the frame of an obstacle is changed by creating
+    a new obstacle (see `with_frame_id`). Hence the same obstacle can be
+    shared by any number of environments, threads or processes.
+    """
+
+    __slots__ = ()
 
-    def __init__(self, obstalce_name, x, y, z, shape_size):
+    def __new__(cls, obstalce_name, x, y, z, shape_size,
+                orientation=(0, 0, 0, 1), frame_id=None):
         """
         Will configure the obstacle details and set it's attributes.
 
@@ -77,55 +169,147 @@ class Obstacle:
         - x, y and z: is the position or pose of the obstacle in the world.
         - shape_size: is a triple tuple with height, width and depth of the
         object or obstacle.
+        - orientation: the (x, y, z, w) quaternion of the obstacle.
+        - frame_id: the frame of the pose. It is None by default because it
+        needs to be set for the specific scene, which is not available at the
+        time the obstacle is created.
+        """
+        return super(Obstacle, cls).__new__(cls,
+                                            obstalce_name,
+                                            (x, y, z),
+                                            tuple(shape_size),
+                                            tuple(orientation),
+                                            frame_id)
+
+    def __getnewargs__(self):
+        """Will return the arguments of `__new__`, used when pickling."""
+        return (self.name,) + self.position + (self.size,
+                                               self.orientation,
+                                               self.frame_id)
+
+    @property
+    def pose(self):
+        """
+        Will return the `PoseStamped` of the obstacle.
+
+        A new message is created every time, hence changing it does not change
+        the obstacle.
         """
-        self.name = obstalce_name
+        pose = PoseStamped()
+        pose.header.frame_id = self.frame_id
 
-        # The pose of where the obstacle is
-        self.pose = PoseStamped()
-        self.pose.pose.position.x = x
-        self.pose.pose.position.y = y
-        self.pose.pose.position.z = z
+        pose.pose.position.x, pose.pose.position.y, pose.pose.position.z = \
+            self.position
 
-        # Pose Header Frame ID is None because it needs to be set for the
-        # specific scene, which is not available at the time the obstacle
-        # is created.
-        self.pose.header.frame_id = None
+        pose.pose.orientation.x, pose.pose.orientation.y, \
+            pose.pose.orientation.z, pose.pose.orientation.w = \
+            self.orientation
 
-        # This is a triple tuple (h, w, z) representing the size of the
-        # obstacle
-        self.size = shape_size
+        return pose
 
-    def set_frame_id(self, id):
+    def with_frame_id(self, id):
         """
-        Will set the pose's header frame ID.
+        Will return a copy of the obstacle in the given frame.
 
         It is important, for  the  obstacle to appear in the MoveIt Rviz to set
         this to  `robot.get_planning_frame()`,  since we  don't  have this info
         in here,  we need  to set  this later.  Make sure  you  have  set  this
         otherwise you will not be able to visualise the obstacle in Rviz.
         """
-        self.pose.header.frame_id = id
+        if id == self.frame_id:
+            return self
+
+        return self._replace(frame_id=id)
 
 
 class Environment:
-    """This is the template class of the Template design pattern."""
+    """
+    This is the template class of the Template design pattern.
+
+    Environments are immutable snapshots: the `with_*` methods return a new
+    environment, with a higher version, that shares the unchanged obstacles
+    with this one. Hence a planner can hold on to an environment while the
+    scene moves on to another one.
+    """
+
+    # Obstacles represents a tuple of obstacles
+    _obstacles = ()
 
-    # Obstacles represents a list of obstacles
-    _obstacles = None
+    # Incremented every time a new environment is derived from this one
+    version = 0
 
     def clone(self):
         """
         Clone itself.
 
         Required  method  to  clone itself  when Factory  is used  to  get the
-        instance.
+        instance. Since environments are immutable, the clone is itself.
         """
-        pass
+        return self
 
     def get_obstacles(self):
-        """Will return the list with obstacles."""
+        """Will return the tuple with obstacles."""
         return self._obstacles
 
+    def get_obstacle(self, name):
+        """Will return the obstacle with the given name, or None."""
+        for obstacle in self._obstacles:
+            if obstacle.name == name:
+                return obstacle
+
+        return None
+
+    def with_obstacle(self, obstacle):
+        """
+        Will return a new environment with the given obstacle.
+
+        An obstacle with the same name is replaced (keeping its place).
+        """
+        obstacles = [obstacle if o.name == obstacle.name else o
+                     for o in self._obstacles]
+
+        if self.get_obstacle(obstacle.name) is None:
+            obstacles.append(obstacle)
+
+        return self._derive(obstacles)
+
+    def without_obstacle(self, name):
+        """Will return a new environment without the named obstacle."""
+        return self._derive([o for o in self._obstacles if o.name != name])
+
+    def with_frame_id(self, id):
+        """Will return a new environment with the obstacles in the frame."""
+        if all([o.frame_id == id for o in self._obstacles]):
+            return self
+
+        return self._derive([o.with_frame_id(id) for o in self._obstacles])
+
+    def _derive(self, obstacles):
+        """
+        Will return a new environment with the given obstacles.
+
+        The new environment is a shallow copy of this one: the obstacles are
+        immutable, hence they are shared rather than copied.
+        """
+        environment = copy.copy(self)
+        environment._obstacles = tuple(obstacles)
+        environment.version = self.version + 1
+
+        return environment
+
+    def __eq__(self, other):
+        """Environments are equal if they have the same obstacles."""
+        return isinstance(other, Environment) and \
+            self._obstacles == other._obstacles
+
+    def __ne__(self, other):
+        """See `__eq__`."""
+        return not self == other
+
+    def __hash__(self):
+        """Will return the hash of the obstacles."""
+        return hash(self._obstacles)
+
 
 class RoboticsLabEnvironment(Environment):
     """
@@ -139,15 +323,13 @@ class RoboticsLabEnvironment(Environment):
         """
         Default constructor.
 
-        Will initialise the obstacles attribute to empty list and will call the
-        method to create the obstacles.
+        Will call the method to create the obstacles.
         """
-        self._obstacles = []
-        self._create_obstalces()
+        self._obstacles = tuple(self._create_obstalces())
 
     def _create_obstalces(self):
         """
-        Generate and append the obstacles to the class.
+        Generate and return the obstacles of the class.
 
         In here are the obstacles relevant to this specific environment.
         """
@@ -157,33 +339,44 @@ class RoboticsLabEnvironment(Environment):
                                            z=0,
                                            shape_size=(4, 0.2, 3))
 
-        self._obstacles.append(side_wall)
-
         back_wall = Obstacle(obstalce_name="back_wall",
                                            x=-1,
                                            y=0,
                                            z=0,
                                            shape_size=(0.2, 4, 3))
 
-        self._obstacles.append(back_wall)
-
         table = Obstacle(obstalce_name="table",
                                        x=0.7,
                                        y=-0.1,
                                        z=-0.53,
                                        shape_size=(0.8, 1.2, 0.7))
 
-        self._obstacles.append(table)
-
         camera_tripod = Obstacle(obstalce_name="camera_tripod",
                                                x=0.6,
                                                y=-1.2,
                                                z=-0.54,
                                                shape_size=(1, 0.3, 1.8))
-
-        self._obstacles.append(camera_tripod)
         # width, length, height
 
-    def clone(self):
-        """Required method for the Template design pattern."""
-        return copy.copy(self)
+        return [side_wall, back_wall, table, camera_tripod]
+
+
+class SceneFileEnvironment(Environment):
+    """
+    This class represents an environment described by a `.scene` file.
+
+    The obstacles are created from the compiled scene (see scene_file.py),
+    which is cached, hence creating the environment again is cheap.
+    """
+
+    def __init__(self, path):
+        """Will create the obstacles from the given `.scene` file."""
+        self.path = path
+        self._obstacles = tuple([Obstacle(obstalce_name=name,
+                                          x=position[0],
+                                          y=position[1],
+                                          z=position[2],
+                                          shape_size=size,
+                                          orientation=orientation)
+                                 for name, size, position, orientation
+                                 in load_scene(path)])
@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+"""
+Motion Futures.
+
+Moving an arm or the gripper  of Baxter blocks  until the motion is completed.
+This module  allows  such operations to run in the background: each arm owns an
+`ArmExecutor` that  runs the  operations of  that arm one  after  the other in
+its  own  thread, and  every submitted  operation  returns a `MotionFuture`
+that can be waited on, cancelled or given completion callbacks.
+
+Example:
+
+    future = planner.move_hand_to_head_camera_async()
+    future.add_done_callback(lambda f: cashier.show_eyes_focusing())
+    ...  # Do something else while the arm moves
+    future.result()
+
+    Copyright (C)  2016/2017 The University of Leeds and Rafael Papallas
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# System-wide imports
+import threading
+import traceback
+import Queue
+
+# States of a future
+PENDING = "pending"
+RUNNING = "running"
+CANCELLED = "cancelled"
+FINISHED = "finished"
+
+# The future of the operation running on the current (executor) thread
+_current = threading.local()
+
+
+class MotionCancelledError(Exception):
+    """Raised when the result of a cancelled motion is requested."""
+
+    def __str__(self):
+        """String representation of the exception."""
+        return "The motion has been cancelled."
+
+
+class MotionTimeoutError(Exception):
+    """Raised when a motion did not complete within the given time."""
+
+    def __str__(self):
+        """String representation of the exception."""
+        return "The motion did not complete in time."
+
+
+def current_future():
+    """Will return the future of the operation running on this thread."""
+    return getattr(_current, "future", None)
+
+
+def raise_if_cancelled():
+    """
+    Will raise `MotionCancelledError` if the running operation is cancelled.
+
+    Operations made of several steps (e.g planning then executing) call it
+    between the steps, since stopping the arm only interrupts the current
+    step. Does nothing outside of an executor's thread.
+    """
+    future = current_future()
+    if future is not None and future.cancelled():
+        raise MotionCancelledError()
+
+
+class MotionFuture:
+    """
+    Handle to an operation submitted to an `ArmExecutor`.
+
+    The handle allows to wait for the operation, to register callbacks called
+    on completion and to cancel it.
+    """
+
+    def __init__(self, function, stop=None):
+        """
+        Default constructor.
+
+        - function: the operation to run.
+        - stop: function called to interrupt the operation if it is cancelled
+        while running (e.g stopping the arm).
+        """
+        self._function = function
+        self._stop = stop
+        self._state = PENDING
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+        self._condition = threading.Condition()
+
+    def running(self):
+        """Will return True if the operation is currently running."""
+        return self._state == RUNNING
+
+    def done(self):
+        """Will return True if the operation completed or was cancelled."""
+        return self._state in [CANCELLED, FINISHED]
+
+    def cancelled(self):
+        """Will return True if the operation was cancelled."""
+        return self._state == CANCELLED
+
+    def cancel(self):
+        """
+        Will cancel the operation.
+
+        A pending operation will never run. A running operation is interrupted
+        by its stop function (if any) and its next steps are skipped (see
+        `raise_if_cancelled`). Will return False if the operation was already
+        done or cannot be interrupted.
+        """
+        with self._condition:
+            if self._state == PENDING:
+                self._state = CANCELLED
+                self._condition.notify_all()
+            elif self._state == RUNNING and self._stop is not None:
+                self._state = CANCELLED
+            else:
+                return False
+
+            was_running = self._function is None
+
+        if was_running:
+            self._stop()
+        else:
+            self._invoke_callbacks()
+
+        return True
+
+    def result(self, timeout=None):
+        """
+        Will wait for the operation and return its result.
+
+        Will raise the exception of the operation if it failed,
+        `MotionCancelledError` if it was cancelled or `MotionTimeoutError` if
+        it did not complete within the timeout (in seconds).
+        """
+        self._wait(timeout)
+
+        if self._state == CANCELLED:
+            raise MotionCancelledError()
+
+        if self._exception is not None:
+            raise self._exception
+
+        return self._result
+
+    def exception(self, timeout=None):
+        """Will wait for the operation and return its exception or None."""
+        self._wait(timeout)
+
+        if self._state == CANCELLED:
+            raise MotionCancelledError()
+
+        return self._exception
+
+    def add_done_callback(self, callback):
+        """
+        Will call the callback with this future once it is done.
+
+        If the future is already done, the callback is called immediately.
+        Otherwise it is called from the thread of the executor, hence the
+        callback should not wait for another motion of the same arm.
+        """
+        with self._condition:
+            if not self.done():
+                self._callbacks.append(callback)
+                return
+
+        callback(self)
+
+    def _wait(self, timeout):
+        """Will block until the operation is done or the timeout expires."""
+        with self._condition:
+            if timeout is None:
+                while not self.done():
+                    self._condition.wait()
+            elif not self.done():
+                self._condition.wait(timeout)
+
+            if not self.done():
+                raise MotionTimeoutError()
+
+    def _run(self):
+        """Will run the operation. Called by the executor's thread."""
+        with self._condition:
+            if self._state != PENDING:
+                return
+
+            self._state = RUNNING
+            function, self._function = self._function, None
+
+        _current.future = self
+        try:
+            self._result = function()
+        except MotionCancelledError:
+            # Expected, the operation stopped at the cancellation
+            pass
+        except Exception as e:
+            traceback.print_exc()
+            self._exception = e
+        finally:
+            _current.future = None
+
+        with self._condition:
+            if self._state == RUNNING:
+                self._state = FINISHED
+            self._condition.notify_all()
+
+        self._invoke_callbacks()
+
+    def _invoke_callbacks(self):
+        """Will call the registered callbacks."""
+        for callback in self._callbacks:
+            try:
+                callback(self)
+            except Exception:
+                traceback.print_exc()
+
+
+class ArmExecutor:
+    """
+    Runs the operations of a single arm in the background, in order.
+
+    Since an arm can only do one thing at a time, the operations submitted
+    are queued and run one after the other in a single thread.
+    """
+
+    def __init__(self, name):
+        """Will start the thread of the executor."""
+        self._queue = Queue.Queue()
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+
+        self._thread = threading.Thread(target=self._work,
+                                        name="{}_arm_executor".format(name))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, function, stop=None):
+        """
+        Will queue the operation and return its `MotionFuture`.
+
+        - function: the operation to run (without arguments).
+        - stop: function interrupting the operation if cancelled.
+        """
+        future = MotionFuture(function, stop)
+
+        with self._lock:
+            self._pending += 1
+
+        self._queue.put(future)
+
+        return future
+
+    def is_busy(self):
+        """Will return True if an operation is running or queued."""
+        with self._lock:
+            return self._pending > 0
+
+    def is_executor_thread(self):
+        """Will return True if called from the thread of the executor."""
+        return threading.current_thread() is self._thread
+
+    def wait_until_idle(self, timeout=None):
+        """
+        Will block until all the submitted operations are done.
+
+        Will return immediately if called from the executor's thread (e.g
+        from a done callback), since waiting there would never complete.
+        """
+        if self.is_executor_thread():
+            return
+
+        with self._idle:
+            if timeout is None:
+                while self._pending > 0:
+                    self._idle.wait()
+            elif self._pending > 0:
+                self._idle.wait(timeout)
+
+    def shutdown(self):
+        """Will stop the thread once the queued operations are done."""
+        self._queue.put(None)
+
+    def _work(self):
+        """Main loop of the executor's thread."""
+        while True:
+            future = self._queue.get()
+
+            if future is None:
+                break
+
+            future._run()
+
+            with self._idle:
+                self._pending -= 1
+                if self._pending == 0:
+                    self._idle.notify_all()
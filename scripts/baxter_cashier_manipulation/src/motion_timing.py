@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+"""
+Motion Timing.
+
+This module  measures  where  the time of  a  transaction goes. Each  phase of a
+motion  (planning,  execution,  gripper  open/close,  cuff release  and scene
+setup) is  measured as  a "span"  tagged by the arm and the name of the motion,
+and is  recorded  into  a histogram. The  statistics  are available in-process
+through `MotionTimer.summary()`, can be dumped to a CSV file and can be
+published periodically on a ROS topic. When tracing is enabled (see
+baxter_cashier_manipulation/tracing.py), every span is also a trace event. The
+planning  and  execution  times  are  also  operational  metrics  (see
+baxter_cashier_manipulation/metrics.py).
+
+Example:
+
+    timer = MotionTimer()
+    with timer.span("planning", "left", "head_camera"):
+        plan = limb.plan()
+
+    Copyright (C)  2016/2017 The University of Leeds and Rafael Papallas
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# System-wide imports
+import csv
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+# Project specific imports
+from baxter_cashier_manipulation import metrics
+from baxter_cashier_manipulation import tracing
+from baxter_cashier_manipulation.metrics import Histogram
+
+# Phases of the motions also recorded as operational metrics (see
+# baxter_cashier_manipulation/metrics.py), by the name of the metric.
+METRIC_PHASES = {
+    "planning": "plan_time",
+    "execution": "execution_time",
+    "ik": "ik_time",
+}
+
+
+class MotionTimer:
+    """
+    Records timing spans of the motions of Baxter.
+
+    Spans are keyed by (phase, arm, motion) and each key gets its own
+    histogram. If a CSV file is given, every single span is also appended to
+    that file.
+    """
+
+    def __init__(self, csv_path=None, clock=time.time):
+        """
+        Default constructor.
+
+        - clock: function returning the current time in seconds (e.g the
+        time of a simulated clock).
+        """
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._publisher = None
+        self._timer = None
+
+        self._csv_file = None
+        self._csv_writer = None
+        if csv_path:
+            self._csv_file = open(csv_path, "a")
+            self._csv_writer = csv.writer(self._csv_file)
+
+    @contextmanager
+    def span(self, phase, arm, motion):
+        """Will measure the time spent within the `with` block."""
+        start = self._clock()
+        try:
+            yield
+        finally:
+            self.record(phase, arm, motion, self._clock() - start, start)
+
+    def record(self, phase, arm, motion, duration, started=None):
+        """Will record a span that has already been measured."""
+        key = (phase, str(arm), motion)
+
+        if phase in METRIC_PHASES:
+            metrics.observe(METRIC_PHASES[phase], duration)
+
+        if tracing.is_enabled():
+            tracing.complete(motion, phase,
+                             started if started is not None else
+                             self._clock() - duration,
+                             duration, arm=str(arm))
+
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+
+            histogram.add(duration)
+
+            if self._csv_writer is not None:
+                started = started if started is not None else self._clock()
+                self._csv_writer.writerow([started, phase, arm, motion,
+                                           duration])
+                self._csv_file.flush()
+
+    def histogram(self, phase, arm, motion):
+        """Will return the histogram of the given key or None."""
+        with self._lock:
+            return self._histograms.get((phase, str(arm), motion))
+
+    def summary(self):
+        """
+        Will return the statistics of every span recorded so far.
+
+        Returns a list of dictionaries, one per (phase, arm, motion).
+        """
+        with self._lock:
+            items = sorted(self._histograms.items())
+            summary = []
+            for (phase, arm, motion), histogram in items:
+                entry = histogram.to_dict()
+                entry.update({"phase": phase, "arm": arm, "motion": motion})
+                summary.append(entry)
+
+        return summary
+
+    def total_by_phase(self):
+        """Will return the total time spent per phase."""
+        totals = {}
+        for entry in self.summary():
+            totals[entry["phase"]] = totals.get(entry["phase"], 0) + \
+                entry["total"]
+
+        return totals
+
+    def start_publishing(self, topic, period=10.0):
+        """
+        Will publish the summary periodically on the given ROS topic.
+
+        The summary is published as JSON in a `std_msgs/String` message.
+        """
+        # Imported here so the timer can also be used without ROS.
+        import rospy
+        from std_msgs.msg import String
+
+        self._publisher = rospy.Publisher(topic, String, queue_size=1,
+                                          latch=True)
+
+        def publish(_):
+            self._publisher.publish(String(json.dumps(self.summary())))
+
+        self._timer = rospy.Timer(rospy.Duration(period), publish)
+
+    def close(self):
+        """Will stop publishing and close the CSV file."""
+        if self._timer is not None:
+            self._timer.shutdown()
+
+        with self._lock:
+            if self._csv_file is not None:
+                self._csv_file.close()
+                self._csv_file = None
+                self._csv_writer = None
@@ -31,6 +31,10 @@ import rospy
 from baxter_interface import Gripper, Limb
 from baxter_interface import CHECK_VERSION
 from baxter_core_msgs.msg import(DigitalIOState)
+from baxter_core_msgs.srv import SolvePositionIK, SolvePositionIKRequest
+
+# Other imports
+import numpy as np
 
 # MoveIt! Specific imports
 import moveit_commander
@@ -38,8 +42,25 @@ import moveit_msgs.msg
 from moveit_commander import MoveGroupCommander
 
 # Project specific imports
-from environment_factory import EnvironmentFactory
+from environment_factory import EnvironmentFactory, DEFAULT_SCENE_DIRECTORY
 from baxter_pose import BaxterPose
+from planner_racing import PlannerRace, PlannerStatistics
+from planner_racing import FIRST_VALID, is_valid_plan
+from motion_timing import MotionTimer
+from motion_futures import ArmExecutor, raise_if_cancelled
+from speed_profiles import load_speed_profiles, retime_trajectory
+from speed_profiles import MOTION_PROFILES, TRANSIT
+from planning_scene_updater import PlanningSceneUpdater
+from planning_scene_updater import obstacle_collision_object
+from planning_scene_updater import removal_collision_object
+from customer_arm_obstacles import CustomerArmObstacles
+from obstacle_index import ObstacleIndex, poses_to_points
+from baxter_cashier_manipulation import metrics
+from baxter_cashier_manipulation import tracing
+
+# Bounds (lower, upper) of the area Baxter can reach in x, y and z. The area is
+# exactly above the table.
+REACHABLE_AREA = [(0.3, 1), (-0.7, 0.5), (0, 0.5)]
 
 
 class MoveItArm:
@@ -50,9 +71,14 @@ class MoveItArm:
     been  packed  together  into  this  class  to make  the code more readable.
     """
 
-    def __init__(self, side_name):
-        """Will configure and initialise Baxter's hand."""
+    def __init__(self, side_name, timer=None):
+        """
+        Will configure and initialise Baxter's hand.
+
+        - timer: a `MotionTimer` to record the gripper timings to.
+        """
         self._side_name = side_name
+        self._timer = timer if timer is not None else MotionTimer()
 
         # This is the reference to Baxter's arm.
         self.limb = MoveGroupCommander("{}_arm".format(side_name))
@@ -62,16 +88,27 @@ class MoveItArm:
         # did was able to find a very good pose using Forward Kinematics,
         # so instead the Baxter SDK is used here to do these two jobs.
         self.gripper = Gripper(side_name, CHECK_VERSION)
-        self.gripper.calibrate()
+
+        # Calibration blocks for a few seconds, and the gripper keeps being
+        # calibrated until the robot is rebooted, so only do it when needed.
+        if not self.gripper.calibrated():
+            with self._timer.span("startup", side_name, "gripper_calibration"):
+                self.gripper.calibrate()
+
         self._limb = Limb(side_name)
 
         # This solver seems to be better for finding solution among obstacles
-        self.limb.set_planner_id("RRTConnectkConfigDefault")
+        self.planner_id = "RRTConnectkConfigDefault"
+        self.limb.set_planner_id(self.planner_id)
 
         # Error tollerance should be as low as possible for better accuracy.
         self.limb.set_goal_position_tolerance(0.01)
         self.limb.set_goal_orientation_tolerance(0.01)
 
+        # Plans are made at full speed and slowed down afterwards according
+        # to the speed profile of each motion (see speed_profiles.py).
+        self.limb.set_max_velocity_scaling_factor(1.0)
+
     def __str__(self):
         """
         String representation of the arm.
@@ -94,26 +131,82 @@ class MoveItArm:
         """Will open Baxter's gripper on his active hand."""
         # Block ensures that the function does not return until the operation
         # is completed.
-        self.gripper.open(block=True)
+        with self._timer.span("gripper_open", self._side_name, "gripper"):
+            self.gripper.open(block=True)
 
     def close_gripper(self):
         """Will close Baxter's gripper on his active hand."""
         # Block ensures that the function does not return until the operation
         # is completed.
-        self.gripper.close(block=True)
+        with self._timer.span("gripper_close", self._side_name, "gripper"):
+            self.gripper.close(block=True)
 
 
 class MoveItPlanner:
     """Will configure and initialise MoveIt to be used in cashier.py."""
 
-    def __init__(self):
-        """Initialise the arms of Baxter and setup environment obstacles."""
-        moveit_commander.roscpp_initialize(sys.argv)
-        self.robot = moveit_commander.RobotCommander()
+    def __init__(self, planner_racing=None):
+        """
+        Initialise the arms of Baxter and setup environment obstacles.
 
-        # Configure and setup both Baxter's hands.
-        self.left_arm = MoveItArm("left")
-        self.right_arm = MoveItArm("right")
+        - planner_racing: if True, every motion is planned by racing several
+        planners (see planner_racing.py). If None, the `~planner_racing` ROS
+        parameter decides.
+        """
+        if planner_racing is None:
+            planner_racing = rospy.get_param("~planner_racing", False)
+
+        # Timing spans of every phase of the motions. These can be dumped to
+        # a CSV file and are periodically published on a topic.
+        self.timer = MotionTimer(csv_path=rospy.get_param("~timing_csv", None))
+
+        # Speed profiles (transit, approach, grasp, handover) applied to the
+        # motions, optionally tuned through the `~speed_profiles` parameter.
+        self.speed_profiles = load_speed_profiles(
+                                rospy.get_param("~speed_profiles", {}))
+
+        # Planner statistics are kept even when racing is off, so the cache
+        # of which planner is the fastest per motion is always available.
+        self.planner_statistics = PlannerStatistics()
+
+        startup = time.time()
+
+        with self.timer.span("startup", "none", "roscpp_initialize"):
+            moveit_commander.roscpp_initialize(sys.argv)
+            self.robot = moveit_commander.RobotCommander()
+
+        # Each arm runs its asynchronous operations (see the `*_async`
+        # methods) in the background, one after the other.
+        self._executors = {"left": ArmExecutor("left"),
+                           "right": ArmExecutor("right")}
+
+        # Optionally race several planners for every motion
+        self._planner_races = None
+        if planner_racing:
+            mode = rospy.get_param("~planner_racing_mode", FIRST_VALID)
+            deadline = rospy.get_param("~planner_racing_deadline", 5.0)
+            planners = rospy.get_param("~racing_planners", None)
+
+            self._planner_races = {}
+            for side in ["left", "right"]:
+                self._planner_races[side] = PlannerRace(
+                                            side,
+                                            self.planner_statistics,
+                                            self.robot.get_planning_frame(),
+                                            planner_ids=planners,
+                                            deadline=deadline,
+                                            mode=mode)
+
+        # Configure and setup both Baxter's hands. The two arms (and their
+        # grippers) are initialised at the same time by their executors.
+        with self.timer.span("startup", "none", "arms"):
+            left_arm = self._executors["left"].submit(
+                                            self._arm_initialiser("left"))
+            right_arm = self._executors["right"].submit(
+                                            self._arm_initialiser("right"))
+
+            self.left_arm = left_arm.result()
+            self.right_arm = right_arm.result()
 
         # Active hand is  used to  keep a state of  which hand  has recently be
         # moved  from the  planner. For  example, a  user send  request to this
@@ -124,13 +217,38 @@ class MoveItPlanner:
         # and close of the gripper on that hand.
         self.active_hand = None
 
-        # Setup the environment. This will add obstacles to MoveIt world.
-        self.scene = moveit_commander.PlanningSceneInterface()
+        # Obstacles are sent to move_group in batches and acknowledged by it.
+        self.scene_updater = PlanningSceneUpdater(
+                                        self.robot.get_planning_frame())
+
+        # The environment in the scene and the names of its obstacles
+        self.environment = None
+        self._obstacle_names = []
 
-        # NOTE: Don't delete this; is required for obstacles to appear in Rviz
-        rospy.sleep(1)
+        # Handles of Baxter's IK services, by side, created on first use
+        self._ik_services = {}
 
-        self._create_scene()
+        # Minimum distance (in metres) of a target pose from the obstacles
+        self.obstacle_clearance = rospy.get_param("~obstacle_clearance", 0.05)
+
+        # Obstacles added before move_group is listening are lost and never
+        # appear in Rviz, hence wait for it to be ready.
+        with self.timer.span("startup", "none", "move_group_ready"):
+            self._wait_for_move_group()
+
+        with self.timer.span("scene_setup", "none", "environment"):
+            self._create_scene()
+
+        # Optionally keep the customer's forearms in the scene, so paths are
+        # not planned through them.
+        self.customer_arm_obstacles = None
+        if rospy.get_param("~customer_arm_obstacles", False):
+            self.customer_arm_obstacles = CustomerArmObstacles(
+                        self.scene_updater,
+                        rate=rospy.get_param("~customer_arm_rate", 5.0),
+                        threshold=rospy.get_param("~customer_arm_threshold",
+                                                  0.03))
+            self.customer_arm_obstacles.start()
 
         # We  create this  DisplayTrajectory  publisher which is  used below to
         # publish trajectories for RVIZ to visualize.
@@ -138,13 +256,59 @@ class MoveItPlanner:
                                          moveit_msgs.msg.DisplayTrajectory,
                                          queue_size=30)
 
+        self.timer.start_publishing("/baxter_cashier/motion_timings",
+                                    rospy.get_param("~timing_period", 10.0))
+
+        self.timer.record("startup", "none", "total", time.time() - startup)
+        self._report_startup_timings()
+
+    def _arm_initialiser(self, side_name):
+        """Will return a function initialising the arm of the given side."""
+        def initialise():
+            with self.timer.span("startup", side_name, "arm"):
+                return MoveItArm(side_name, self.timer)
+
+        return initialise
+
+    def _wait_for_move_group(self, timeout=30):
+        """
+        Will wait until move_group is ready to receive the obstacles.
+
+        Will wait for the planning scene service of move_group and for the
+        planning scene updater to be connected to it.
+        """
+        if not self.scene_updater.wait_until_connected(timeout):
+            rospy.logwarn("Planning scene is not connected to move_group")
+
+    def startup_timings(self):
+        """Will return the time (in seconds) taken by each startup phase."""
+        timings = {}
+        for entry in self.timer.summary():
+            if entry["phase"] == "startup":
+                name = entry["motion"]
+                if entry["arm"] != "none":
+                    name = "{}_{}".format(entry["arm"], name)
+
+                timings[name] = entry["total"]
+
+        return timings
+
+    def _report_startup_timings(self):
+        """Will log the time taken by each startup phase."""
+        timings = self.startup_timings()
+        report = ", ".join(["{}: {:.2f}s".format(name, timings[name])
+                            for name in sorted(timings)])
+
+        rospy.loginfo("MoveIt! planner startup timings: {}".format(report))
+
     def release_moveit_from_robot(self, side):
         pub = rospy.Publisher('/robot/digital_io/{}_lower_cuff/state'.format(side), DigitalIOState, queue_size=10)
 
-        timeout_start = time.time()
-        timeout = 1   # [seconds]
-        while time.time() < timeout_start + timeout:
-            pub.publish(1, True)
+        with self.timer.span("cuff_release", side, "cuff"):
+            timeout_start = time.time()
+            timeout = 1   # [seconds]
+            while time.time() < timeout_start + timeout:
+                pub.publish(1, True)
 
     def is_pose_within_reachable_area(self, pose):
         """
@@ -152,27 +316,75 @@ class MoveItPlanner:
 
             Given a pose, this method will check if the pose is within the
             robot's reachable area by doing boundary checks. The reachable area
-            is exactly above the table.
+            is exactly above the table. Poses inside or too close to an
+            obstacle of the environment are not reachable.
+        """
+        return bool(self.are_poses_within_reachable_area([pose])[0])
+
+    def are_poses_within_reachable_area(self, poses):
         """
-        upper_x = 1
-        lower_x = 0.3
+        Batch version of `is_pose_within_reachable_area`.
 
-        upper_y = 0.5
-        lower_y = -0.7
+        Will return a boolean NumPy array, with one value per pose.
+        """
+        points = poses_to_points(poses)
+        lower, upper = np.array(REACHABLE_AREA).T
+
+        within_area = np.all((points >= lower) & (points <= upper), axis=1)
+
+        return within_area & self.obstacle_index.are_clear(
+                                                points,
+                                                self.obstacle_clearance)
+
+    def solve_ik(self, poses, arm):
+        """
+        Will solve the inverse kinematics of the poses for the arm.
 
-        upper_z = 0.5
-        lower_z = 0
+        All the poses are sent to Baxter's IK service in a single request.
+        Will return, per pose, the joint positions (dict: joint name ->
+        position) or None if the arm can not reach the pose.
 
-        pose_x = pose.transformation_x
-        pose_y = pose.transformation_y
-        pose_z = pose.transformation_z
+        Will return None, rather than a list, if the IK service failed: the
+        reachability of the poses is then unknown.
+        """
+        side = str(arm)
+        if side not in self._ik_services:
+            name = "ExternalTools/{}/PositionKinematicsNode/IKService".format(
+                                                                        side)
+            rospy.wait_for_service(name)
+            self._ik_services[side] = rospy.ServiceProxy(name,
+                                                         SolvePositionIK)
+
+        request = SolvePositionIKRequest()
+        request.pose_stamp = [pose.get_pose_stamped() for pose in poses]
+
+        try:
+            with self.timer.span("ik", side, "batch"):
+                response = self._ik_services[side](request)
+        except rospy.ServiceException as e:
+            rospy.logwarn("IK service call failed: {}".format(e))
+            return None
+
+        return [dict(zip(joints.name, joints.position)) if valid else None
+                for valid, joints in zip(response.isValid, response.joints)]
+
+    def are_poses_reachable_by_arm(self, poses, arm):
+        """
+        Will check whether the arm can reach each of the poses.
+
+        Unlike `are_poses_within_reachable_area`, which checks the area of the
+        customer's hands, this solves the inverse kinematics of the poses (in
+        one batch). Will return a boolean NumPy array, with one value per pose,
+        or None if the IK service failed (see `solve_ik`).
+        """
+        if len(poses) == 0:
+            return np.zeros(0, dtype=bool)
 
-        if pose_z <= upper_z and pose_z >= lower_z:
-            if pose_y <= upper_y and pose_y >= lower_y:
-                if pose_x <= upper_x and pose_x >= lower_x:
-                    return True
+        solutions = self.solve_ik(poses, arm)
+        if solutions is None:
+            return None
 
-        return False
+        return np.array([joints is not None for joints in solutions])
 
     def _create_scene(self):
         """
@@ -184,27 +396,54 @@ class MoveItPlanner:
         one of those.
         """
         # Initialise the Factory of Environments
-        EnvironmentFactory.initialize()
+        EnvironmentFactory.initialize(
+                        rospy.get_param("~scene_directory",
+                                        DEFAULT_SCENE_DIRECTORY))
+
+        # Get the environment selected by  the `~environment` parameter (by
+        # default University of Leeds, Robotic's Lab) with the obstacles of it
+        # from the factory. This environment  object contains details about the
+        # obstacles  specifically for this  environment. Note the environment
+        # is a  physical  environment that  contains  obstacles like walls and
+        # table.
+        self.set_environment(rospy.get_param("~environment", "robotics_lab"))
+
+    def set_environment(self, name):
+        """
+        Will replace the obstacles of the scene with the given environment.
+
+        The obstacles of the previous environment (if any) are removed and the
+        new ones are added as a single planning scene diff.
+        """
+        frame_id = self.robot.get_planning_frame()
+        environment = EnvironmentFactory.get_environment(name).with_frame_id(
+                                                                    frame_id)
 
-        # Get  University  of  Leeds  (Robotic's  Lab)   environment  with  the
-        # obstacles  of it from the  factory. This  environment object contains
-        # details about the obstacles  specifically for this  environment. Note
-        # the  environment  is a physical  environment that  contains obstacles
-        # like walls and table.
-        environment = EnvironmentFactory.get_robotics_lab_environment()
+        collision_objects = []
+        for obstacle_name in self._obstacle_names:
+            collision_objects.append(removal_collision_object(obstacle_name,
+                                                              frame_id))
 
-        # For each obstacle in the environment add it to the scene
+        # All the obstacles of the environment are added to the scene at once
         for obstacle in environment.get_obstacles():
-            # Keep the table obstacle to be used later for pose elimination
-            if obstacle.name == "table":
-                self.table_obstacle = obstacle
+            collision_objects.append(obstacle_collision_object(obstacle,
+                                                               frame_id))
+
+        if not self.scene_updater.apply(collision_objects):
+            rospy.logwarn("move_group did not acknowledge the obstacles")
+
+        self.environment = environment
+        self._obstacle_names = [o.name for o in environment.get_obstacles()]
 
-            obstacle.set_frame_id(self.robot.get_planning_frame())
-            self.scene.add_box(obstacle.name, obstacle.pose, obstacle.size)
+        # Index of the obstacles used for pose elimination: targets inside or
+        # too close to an obstacle are rejected without planning.
+        self.obstacle_index = ObstacleIndex(environment.get_obstacles())
 
-    def move_hand_to_head_camera(self):
-        """Will move Baxter's active hand to head."""
-        if self.active_hand is None:
+    def move_hand_to_head_camera(self, arm=None):
+        """Will move Baxter's active hand (or the given arm) to head."""
+        arm = arm if arm is not None else self.active_hand
+
+        if arm is None:
             return
 
         # These are  static joint  configurations that lead Baxter's hand to be
@@ -226,21 +465,114 @@ class MoveItPlanner:
                       'right_e0': 2.33395176877,
                       'right_e1': 1.99149055787}
 
-        config = left_hand if self.active_hand.is_left() else right_hand
+        config = left_hand if arm.is_left() else right_hand
 
         # Move Baxter's hand there.
-        self.active_hand.limb.set_joint_value_target(config)
-        # self.active_hand.limb.plan()
-        self.active_hand.limb.go(wait=True)
-        self.release_moveit_from_robot(self.active_hand._side_name)
+        self._plan_and_execute(arm, "head_camera", config)
+
+    def move_to_position(self, baxter_pose, arm, motion_name="pose",
+                         profile=None):
+        """
+        Will move Baxter hand to the pose.
 
-    def move_to_position(self, baxter_pose, arm):
-        """Will move Baxter hand to the pose."""
+        - motion_name: name of the motion used to tag timings and planner
+        statistics (e.g "customer_hand", "banknote").
+        - profile: name of the speed profile of the motion. If None, the
+        profile is chosen by the motion name (see speed_profiles.py).
+        """
         self.active_hand = arm
-        self.active_hand.limb.clear_pose_targets()
-        self.active_hand.limb.set_pose_target(baxter_pose.get_pose())
-        self.active_hand.limb.go(wait=True)
-        self.release_moveit_from_robot(self.active_hand._side_name)
+        self._move_to_position(baxter_pose, arm, motion_name, profile)
+
+    def _move_to_position(self, baxter_pose, arm, motion_name, profile):
+        """See `move_to_position`, without changing the active hand."""
+        if profile is None:
+            profile = MOTION_PROFILES.get(motion_name, TRANSIT)
+        profile = self.speed_profiles[profile]
+
+        pose = baxter_pose.get_pose()
+
+        # Move at full speed up to the few last centimetres of the motion,
+        # unless the hand is already that close to the target.
+        approach = profile.approach_pose(pose)
+        if approach is not None and \
+                self._distance_from_hand(arm, pose) > \
+                2 * profile.approach_distance():
+            self._plan_and_execute(arm,
+                                   motion_name + "_approach",
+                                   approach,
+                                   release=False)
+
+        self._plan_and_execute(arm, motion_name, pose, profile)
+
+    def _distance_from_hand(self, arm, pose):
+        """Will return the distance between the end-effector and the pose."""
+        position = arm._limb.endpoint_pose()["position"]
+
+        return ((position.x - pose.position.x) ** 2 +
+                (position.y - pose.position.y) ** 2 +
+                (position.z - pose.position.z) ** 2) ** 0.5
+
+    def _plan_and_execute(self, arm, motion_name, target, profile=None,
+                          release=True):
+        """
+        Will plan and execute a motion of the arm to the target.
+
+        - motion_name: the kind of motion (e.g "pose", "neutral"), used to
+        learn which planner is the fastest for each kind of motion.
+        - target: either a joint configuration (dict) or a `Pose`.
+        - profile: the `SpeedProfile` the plan is retimed to (full speed if
+        None).
+        - release: whether to release the arm from MoveIt! afterwards.
+
+        Will return True if the motion was executed, False otherwise.
+        """
+        side = str(arm)
+        profile = profile or self.speed_profiles[TRANSIT]
+
+        # Any motion submitted asynchronously to this arm must complete first.
+        with tracing.span("wait_for_arm", "moveit", arm=side):
+            self._executors[side].wait_until_idle()
+
+        # An asynchronous motion cancelled meanwhile is not planned
+        raise_if_cancelled()
+
+        with self.timer.span("planning", side, motion_name):
+            if self._planner_races is None:
+                arm.limb.clear_pose_targets()
+                if isinstance(target, dict):
+                    arm.limb.set_joint_value_target(target)
+                else:
+                    arm.limb.set_pose_target(target)
+
+                start = time.time()
+                plan = arm.limb.plan()
+                self.planner_statistics.record(motion_name,
+                                               arm.planner_id,
+                                               time.time() - start,
+                                               is_valid_plan(plan))
+            else:
+                plan = self._planner_races[side].plan(motion_name, target)
+
+        succeeded = is_valid_plan(plan)
+
+        if succeeded:
+            # ... nor executed if cancelled while planning
+            raise_if_cancelled()
+
+            plan = retime_trajectory(plan, profile)
+
+            with self.timer.span("execution", side, motion_name):
+                arm.limb.execute(plan, wait=True)
+        else:
+            print("No plan found for {} motion".format(motion_name))
+            tracing.instant("no_plan", "moveit", arm=side,
+                            motion=motion_name)
+            metrics.increment("plan_failures")
+
+        if release:
+            self.release_moveit_from_robot(arm._side_name)
+
+        return succeeded
 
     def leave_banknote_to_the_table(self):
         """
@@ -271,12 +603,14 @@ class MoveItPlanner:
         # accordingly
         pose = pose_left if self.active_hand.is_left() else pose_right
 
-        self.move_to_position(pose, self.active_hand)
+        self.move_to_position(pose, self.active_hand, "table_drop")
         self.open_gripper()
         self.set_neutral_position_of_limb()
 
-    def set_neutral_position_of_limb(self):
-        """Will moves Baxter arm to neutral position."""
+    def set_neutral_position_of_limb(self, arm=None):
+        """Will moves Baxter arm (active or given) to neutral position."""
+        arm = arm if arm is not None else self.active_hand
+
         left_configuration = {'left_s0': 0.0,
                                            'left_s1': -0.55,
                                            'left_e0': 0.0,
@@ -292,11 +626,8 @@ class MoveItPlanner:
                                              'right_w0': 0.0,
                                              'right_w1': 1.26,
                                              'right_w2': 0.0}
-        config = left_configuration if self.active_hand.is_left() else right_configuration
-        self.active_hand.limb.set_joint_value_target(config)
-        # self.active_hand.limb.plan()
-        self.active_hand.limb.go(wait=True)
-        self.release_moveit_from_robot(self.active_hand._side_name)
+        config = left_configuration if arm.is_left() else right_configuration
+        self._plan_and_execute(arm, "neutral", config)
 
     def get_end_effector_current_pose(self, side_name):
         """
@@ -318,17 +649,98 @@ class MoveItPlanner:
 
         return BaxterPose(x, y, z, x2, y2, z2, w)
 
+    def get_joint_positions(self, arm):
+        """Will return the current joints of the arm (name -> position)."""
+        return arm._limb.joint_angles()
+
     def open_gripper(self):
         """Will open the gripper of the active hand."""
+        self._executors[str(self.active_hand)].wait_until_idle()
         self.active_hand.open_gripper()
 
     def close_gripper(self):
         """Will close the gripper of the active hand."""
+        self._executors[str(self.active_hand)].wait_until_idle()
         self.active_hand.close_gripper()
 
+    def is_arm_busy(self, arm):
+        """Will return True if the arm has asynchronous motions pending."""
+        return self._executors[str(arm)].is_busy()
+
+    def _submit(self, arm, function, stop):
+        """Will submit the operation to the executor of the arm."""
+        return self._executors[str(arm)].submit(function, stop)
+
+    def move_to_position_async(self, baxter_pose, arm, motion_name="pose",
+                               profile=None):
+        """
+        Asynchronous version of `move_to_position`.
+
+        Will return a `MotionFuture` of the motion. Cancelling the future
+        stops the arm.
+        """
+        self.active_hand = arm
+        return self._submit(arm,
+                            lambda: self._move_to_position(baxter_pose,
+                                                           arm,
+                                                           motion_name,
+                                                           profile),
+                            arm.limb.stop)
+
+    def move_hand_to_head_camera_async(self):
+        """
+        Asynchronous version of `move_hand_to_head_camera`.
+
+        Will return a `MotionFuture` of the motion, or None if there is no
+        active hand.
+        """
+        arm = self.active_hand
+        if arm is None:
+            return None
+
+        return self._submit(arm,
+                            lambda: self.move_hand_to_head_camera(arm),
+                            arm.limb.stop)
+
+    def set_neutral_position_of_limb_async(self):
+        """
+        Asynchronous version of `set_neutral_position_of_limb`.
+
+        Will return a `MotionFuture` of the motion of the active hand.
+        """
+        arm = self.active_hand
+        return self._submit(arm,
+                            lambda: self.set_neutral_position_of_limb(arm),
+                            arm.limb.stop)
+
+    def open_gripper_async(self):
+        """Asynchronous version of `open_gripper`, returns the future."""
+        arm = self.active_hand
+        return self._submit(arm, arm.open_gripper, arm.gripper.stop)
+
+    def close_gripper_async(self):
+        """Asynchronous version of `close_gripper`, returns the future."""
+        arm = self.active_hand
+        return self._submit(arm, arm.close_gripper, arm.gripper.stop)
+
+    def shutdown(self):
+        """Will stop the background workers and the timer."""
+        self.timer.close()
+
+        if self.customer_arm_obstacles is not None:
+            self.customer_arm_obstacles.stop()
+
+        for executor in self._executors.values():
+            executor.shutdown()
+
+        if self._planner_races is not None:
+            for race in self._planner_races.values():
+                race.shutdown()
+
 
 if __name__ == '__main__':
     rospy.init_node('move_group_python_interface_tutorial', anonymous=True)
+    tracing.set_process_name(rospy.get_name())
     planner = MoveItPlanner()
 
     # Command to test here
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+"""
+Obstacle Index.
+
+Spatial  index  over the  obstacles of an environment, used to reject target
+poses  that are  inside (or too close to) an  obstacle before asking MoveIt! to
+plan to them; such plans are bound to fail, but only after a slow search.
+
+Each  obstacle is  indexed by its axis-aligned  bounding box (AABB). Since the
+environments  have a handful of obstacles,  the boxes are kept in flat NumPy
+arrays and  every  query is  vectorised over  all the boxes  and all the query
+points at once, which is faster than walking a hierarchy of boxes.
+
+    Copyright (C)  2016/2017 The University of Leeds and Rafael Papallas
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Other imports
+import numpy as np
+
+
+def rotation_matrix(x, y, z, w):
+    """Will return the 3x3 rotation matrix of the (x, y, z, w) quaternion."""
+    return np.array([[1 - 2 * (y * y + z * z), 2 * (x * y - z * w),
+                      2 * (x * z + y * w)],
+                     [2 * (x * y + z * w), 1 - 2 * (x * x + z * z),
+                      2 * (y * z - x * w)],
+                     [2 * (x * z - y * w), 2 * (y * z + x * w),
+                      1 - 2 * (x * x + y * y)]])
+
+
+def poses_to_points(poses):
+    """Will return the positions of the `BaxterPose`s as an (N, 3) array."""
+    return np.array([[pose.transformation_x,
+                      pose.transformation_y,
+                      pose.transformation_z] for pose in poses],
+                    dtype=float).reshape(-1, 3)
+
+
+class ObstacleIndex:
+    """Axis-aligned bounding boxes of the obstacles of an environment."""
+
+    def __init__(self, obstacles):
+        """
+        Will build the index of the given obstacles.
+
+        - obstacles: the `Obstacle`s of an environment (see
+        environment_factory.py).
+        """
+        self.names = []
+        centres = []
+        half_extents = []
+
+        for obstacle in obstacles:
+            position = obstacle.pose.pose.position
+            orientation = obstacle.pose.pose.orientation
+
+            # The half extents of the bounding box of a rotated box are the
+            # half sizes projected on each axis.
+            rotation = rotation_matrix(orientation.x, orientation.y,
+                                       orientation.z, orientation.w)
+            half_size = np.array(obstacle.size, dtype=float) / 2.0
+
+            self.names.append(obstacle.name)
+            centres.append([position.x, position.y, position.z])
+            half_extents.append(np.abs(rotation).dot(half_size))
+
+        centres = np.array(centres, dtype=float).reshape(-1, 3)
+        half_extents = np.array(half_extents, dtype=float).reshape(-1, 3)
+
+        self._minimum = centres - half_extents
+        self._maximum = centres + half_extents
+
+    def distances(self, points):
+        """
+        Will return the distance of each point to each obstacle.
+
+        - points: (N, 3) array of points.
+
+        Returns an (N, M) array for M obstacles, with zero for the points
+        inside an obstacle.
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 1, 3)
+
+        outside = np.maximum(np.maximum(self._minimum - points,
+                                        points - self._maximum), 0)
+
+        return np.sqrt((outside ** 2).sum(axis=2))
+
+    def clearances(self, points):
+        """Will return the distance of each point to its closest obstacle."""
+        if len(self.names) == 0:
+            return np.full(len(np.asarray(points).reshape(-1, 3)), np.inf)
+
+        return self.distances(points).min(axis=1)
+
+    def are_clear(self, points, clearance=0.0):
+        """
+        Will check which points are clear of the obstacles.
+
+        Returns a boolean array, True for the points further than
+        `clearance` metres from every obstacle.
+        """
+        return self.clearances(points) > clearance
+
+    def is_pose_clear(self, pose, clearance=0.0):
+        """Will return True if the `BaxterPose` is clear of the obstacles."""
+        return bool(self.are_clear(poses_to_points([pose]), clearance)[0])
+
+    def are_poses_clear(self, poses, clearance=0.0):
+        """Will check a batch of `BaxterPose`s, see `are_clear`."""
+        return self.are_clear(poses_to_points(poses), clearance)
+
+    def colliding_obstacles(self, pose, clearance=0.0):
+        """Will return the names of the obstacles too close to the pose."""
+        distances = self.distances(poses_to_points([pose]))[0]
+
+        return [name for name, distance in zip(self.names, distances)
+                if distance <= clearance]
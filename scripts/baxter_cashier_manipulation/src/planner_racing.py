@@ -0,0 +1,377 @@
+#!/usr/bin/env python
+"""
+Planner Racing.
+
+A single  OMPL  planner  (like  RRTConnect)  will  sometimes  draw  a bad sample
+and  take a  very  long  time to find a plan, or  fail  altogether. This module
+allows the  project to  "race"  several  planners against  the same  motion: a
+number of worker threads, each calling the planning service of move_group
+(`plan_kinematic_path`) with a different planner, plan the same motion at the
+same time and the first valid plan (or the best plan found within a deadline)
+is used. The outcome of every planning attempt is recorded, so the project
+learns which planner is the fastest for each kind of motion.
+
+The planning  happens  inside  move_group, the workers only wait for its
+responses, hence threads are enough. Unlike the goals of the move_group
+action, which preempt each other, every service call is a complete attempt of
+its planner. move_group serves the calls at the same time if it runs several
+spinner threads, otherwise one after the other. Calls that fail to reach the
+service are not recorded as failures of the planner.
+
+    Copyright (C)  2016/2017 The University of Leeds and Rafael Papallas
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# System-wide imports
+import itertools
+import threading
+import time
+import Queue
+
+# ROS-wide imports
+import rospy
+from shape_msgs.msg import SolidPrimitive
+
+# MoveIt! Specific imports
+from moveit_msgs.msg import Constraints, JointConstraint, MoveItErrorCodes
+from moveit_msgs.msg import OrientationConstraint, PositionConstraint
+from moveit_msgs.srv import GetMotionPlan, GetMotionPlanRequest
+
+# Racing modes: either use the first valid plan or the best plan (shortest
+# trajectory) found before the deadline.
+FIRST_VALID = "first"
+BEST_WITHIN_DEADLINE = "best"
+
+# Planners raced by default. These are all configured by baxter_moveit_config.
+DEFAULT_PLANNERS = ["RRTConnectkConfigDefault",
+                    "BKPIECEkConfigDefault",
+                    "LBKPIECEkConfigDefault",
+                    "ESTkConfigDefault"]
+
+# The planning service of move_group (plans without executing)
+PLAN_SERVICE = "/plan_kinematic_path"
+
+# Tolerance (in metres and radians) of the goal, as set on the commanders
+GOAL_TOLERANCE = 0.01
+
+
+def is_valid_plan(trajectory):
+    """Will return True if the trajectory contains at least one point."""
+    return trajectory is not None and \
+        len(trajectory.joint_trajectory.points) > 0
+
+
+def plan_duration(trajectory):
+    """Will return the duration (in seconds) of the planned trajectory."""
+    return trajectory.joint_trajectory.points[-1].time_from_start.to_sec()
+
+
+def goal_constraints(side_name, target, frame_id, tolerance=GOAL_TOLERANCE):
+    """
+    Will return the `Constraints` of the goal of a motion.
+
+    - target: either a joint configuration (dict) or a `Pose` of the gripper.
+    - frame_id: the planning frame, in which the pose is expressed.
+    """
+    constraints = Constraints()
+
+    if isinstance(target, dict):
+        for name, position in target.items():
+            joint = JointConstraint()
+            joint.joint_name = name
+            joint.position = position
+            joint.tolerance_above = tolerance
+            joint.tolerance_below = tolerance
+            joint.weight = 1.0
+            constraints.joint_constraints.append(joint)
+
+        return constraints
+
+    link_name = "{}_gripper".format(side_name)
+
+    # The gripper within a sphere around the target position
+    region = SolidPrimitive()
+    region.type = SolidPrimitive.SPHERE
+    region.dimensions = [tolerance]
+
+    position = PositionConstraint()
+    position.header.frame_id = frame_id
+    position.link_name = link_name
+    position.constraint_region.primitives = [region]
+    position.constraint_region.primitive_poses = [target]
+    position.weight = 1.0
+
+    orientation = OrientationConstraint()
+    orientation.header.frame_id = frame_id
+    orientation.link_name = link_name
+    orientation.orientation = target.orientation
+    orientation.absolute_x_axis_tolerance = tolerance
+    orientation.absolute_y_axis_tolerance = tolerance
+    orientation.absolute_z_axis_tolerance = tolerance
+    orientation.weight = 1.0
+
+    constraints.position_constraints = [position]
+    constraints.orientation_constraints = [orientation]
+
+    return constraints
+
+
+class PlannerStatistics:
+    """
+    Keeps track of how each planner performs for each motion.
+
+    Every planning attempt is recorded against the name of the motion (e.g.
+    "head_camera", "neutral" or "pose") and the planner that attempted it, so
+    the planners can be ranked from the fastest to the slowest per motion.
+    """
+
+    def __init__(self):
+        """Default constructor."""
+        self._lock = threading.Lock()
+
+        # (motion_name, planner_id) -> [attempts, successes, total time]
+        self._records = {}
+
+    def record(self, motion_name, planner_id, planning_time, succeeded):
+        """Will record the outcome of a single planning attempt."""
+        with self._lock:
+            record = self._records.setdefault((motion_name, planner_id),
+                                              [0, 0, 0.0])
+            record[0] += 1
+
+            if succeeded:
+                record[1] += 1
+                record[2] += planning_time
+
+    def success_rate(self, motion_name, planner_id):
+        """Will return the ratio of successful attempts, None if unknown."""
+        with self._lock:
+            record = self._records.get((motion_name, planner_id))
+
+        if record is None:
+            return None
+
+        return record[1] / float(record[0])
+
+    def mean_planning_time(self, motion_name, planner_id):
+        """Will return the mean time of the successful attempts or None."""
+        with self._lock:
+            record = self._records.get((motion_name, planner_id))
+
+        if record is None or record[1] == 0:
+            return None
+
+        return record[2] / record[1]
+
+    def rank_planners(self, motion_name, planner_ids):
+        """
+        Will rank the given planners for the motion from best to worst.
+
+        Planners never tried on this motion come first, so every planner gets
+        a chance to be measured. The rest are ranked by their expected time to
+        a valid plan (mean planning time over success rate). Planners that
+        never succeeded come last.
+        """
+        def expected_time(planner_id):
+            rate = self.success_rate(motion_name, planner_id)
+            if rate is None:
+                return -1
+
+            mean = self.mean_planning_time(motion_name, planner_id)
+            if mean is None:
+                return float("inf")
+
+            return mean / rate
+
+        return sorted(planner_ids, key=expected_time)
+
+
+class PlannerRace:
+    """Races several planners of one of Baxter's arms against a target."""
+
+    def __init__(self, side_name, statistics, frame_id, planner_ids=None,
+                 deadline=5.0, mode=FIRST_VALID, max_parallel=None):
+        """
+        Will start one worker thread per planner.
+
+        - statistics: a `PlannerStatistics` instance (can be shared between
+        the two arms).
+        - frame_id: the planning frame, in which the poses are expressed.
+        - deadline: maximum time in seconds to wait for plans.
+        - mode: either FIRST_VALID or BEST_WITHIN_DEADLINE.
+        - max_parallel: how many of the best ranked planners to race for each
+        motion (all of them if None).
+        """
+        self._side_name = side_name
+        self._statistics = statistics
+        self._frame_id = frame_id
+        self._planner_ids = planner_ids or DEFAULT_PLANNERS
+        self._deadline = deadline
+        self._mode = mode
+        self._max_parallel = max_parallel or len(self._planner_ids)
+        self._request_ids = itertools.count()
+
+        # request id -> [motion name, number of results still to arrive]
+        self._lock = threading.Lock()
+        self._outstanding = {}
+
+        self._results = Queue.Queue()
+        self._tasks = {}
+        self._workers = []
+
+        for planner_id in self._planner_ids:
+            tasks = Queue.Queue()
+            worker = threading.Thread(target=self._work,
+                                      args=(planner_id, tasks))
+            worker.daemon = True
+            worker.start()
+
+            self._tasks[planner_id] = tasks
+            self._workers.append(worker)
+
+    def _work(self, planner_id, tasks):
+        """
+        Will plan the motions sent to the planner, until told to stop.
+
+        Each worker calls the planning service through its own connection
+        and sends back (request id, planner, planning time, trajectory). The
+        planning time is None if the service could not be called.
+        """
+        plan_service = rospy.ServiceProxy(PLAN_SERVICE, GetMotionPlan)
+
+        while True:
+            task = tasks.get()
+
+            # None is the signal to stop the worker
+            if task is None:
+                break
+
+            request_id, request = task
+
+            start = time.time()
+            try:
+                rospy.wait_for_service(PLAN_SERVICE, self._deadline)
+                response = plan_service(request).motion_plan_response
+            except (rospy.ROSException, rospy.ServiceException) as e:
+                print("Planner {} not called: {}".format(planner_id, e))
+                self._results.put((request_id, planner_id, None, None))
+                continue
+            elapsed = time.time() - start
+
+            trajectory = None
+            if response.error_code.val == MoveItErrorCodes.SUCCESS:
+                trajectory = response.trajectory
+
+            self._results.put((request_id, planner_id, elapsed, trajectory))
+
+    def _request(self, planner_id, target):
+        """Will return the planning request of the target for the planner."""
+        request = GetMotionPlanRequest()
+
+        motion = request.motion_plan_request
+        motion.group_name = "{}_arm".format(self._side_name)
+        motion.goal_constraints = [goal_constraints(self._side_name,
+                                                    target,
+                                                    self._frame_id)]
+        motion.planner_id = planner_id
+        motion.num_planning_attempts = 1
+        motion.allowed_planning_time = self._deadline
+
+        # Plan from the current state of the robot
+        motion.start_state.is_diff = True
+
+        return request
+
+    def plan(self, motion_name, target):
+        """
+        Will race the planners and return the winning plan or None.
+
+        - motion_name: name of the kind of motion used to learn which planner
+        is the fastest for it.
+        - target: either a joint configuration (dict) or a `Pose`.
+        """
+        planners = self._statistics.rank_planners(motion_name,
+                                                  self._planner_ids)
+        planners = planners[:self._max_parallel]
+
+        request_id = next(self._request_ids)
+        with self._lock:
+            self._outstanding[request_id] = [motion_name, len(planners)]
+
+        for planner_id in planners:
+            self._tasks[planner_id].put((request_id,
+                                         self._request(planner_id, target)))
+
+        best = None
+        pending = len(planners)
+        deadline = time.time() + self._deadline
+
+        while pending > 0:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+
+            try:
+                result = self._results.get(timeout=remaining)
+            except Queue.Empty:
+                break
+
+            trajectory = self._record(result)
+
+            # Results of earlier races arrive late; they are only recorded.
+            if result[0] != request_id:
+                continue
+
+            pending -= 1
+
+            if trajectory is None:
+                continue
+
+            if self._mode == FIRST_VALID:
+                return trajectory
+
+            if best is None or plan_duration(trajectory) < plan_duration(best):
+                best = trajectory
+
+        return best
+
+    def _record(self, result):
+        """Will record the result to the statistics and return the plan."""
+        request_id, planner_id, elapsed, trajectory = result
+
+        with self._lock:
+            outstanding = self._outstanding[request_id]
+            motion_name = outstanding[0]
+            outstanding[1] -= 1
+            if outstanding[1] == 0:
+                del self._outstanding[request_id]
+
+        if not is_valid_plan(trajectory):
+            trajectory = None
+
+        # The planner was not called, nothing is learnt about it
+        if elapsed is not None:
+            self._statistics.record(motion_name, planner_id, elapsed,
+                                    trajectory is not None)
+
+        return trajectory
+
+    def shutdown(self):
+        """Will stop the worker threads."""
+        for tasks in self._tasks.values():
+            tasks.put(None)
+
+        for worker in self._workers:
+            worker.join(1)
@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+"""
+Planning Scene Updater.
+
+Adding  obstacles  one by one through  `PlanningSceneInterface.add_box` gives
+no  confirmation that the obstacles  have  reached  move_group: if it  is not
+ready yet  they are silently lost. This  module sends any number of obstacles
+(or  removals)  to  move_group as a  single  planning  scene diff and waits for
+move_group to acknowledge them:
+
+- If move_group provides the `apply_planning_scene` service, the diff is sent
+  through it and the response is the acknowledgement.
+- Otherwise (or if the service call fails) the diff is published on the
+  `planning_scene` topic and the scene monitor is queried until the objects
+  appear in the world with the given geometry (or disappear from it). The
+  geometry is compared, not only the names, since objects left by an earlier
+  run have the same names.
+
+    Copyright (C)  2016/2017 The University of Leeds and Rafael Papallas
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# System-wide imports
+import time
+
+# ROS-wide imports
+import rospy
+from shape_msgs.msg import SolidPrimitive
+
+# MoveIt! Specific imports
+from moveit_msgs.msg import CollisionObject, PlanningScene
+from moveit_msgs.msg import PlanningSceneComponents
+from moveit_msgs.srv import GetPlanningScene
+
+try:
+    from moveit_msgs.srv import ApplyPlanningScene
+except ImportError:
+    # Older versions of MoveIt! do not provide this service
+    ApplyPlanningScene = None
+
+
+def box_collision_object(name, frame_id, pose, size):
+    """
+    Will create a box `CollisionObject` to be added to the scene.
+
+    - pose: the `Pose` of the centre of the box.
+    - size: (x, y, z) dimensions of the box.
+    """
+    collision_object = CollisionObject()
+    collision_object.id = name
+    collision_object.header.frame_id = frame_id
+    collision_object.operation = CollisionObject.ADD
+
+    box = SolidPrimitive()
+    box.type = SolidPrimitive.BOX
+    box.dimensions = list(size)
+
+    collision_object.primitives = [box]
+    collision_object.primitive_poses = [pose]
+
+    return collision_object
+
+
+def cylinder_collision_object(name, frame_id, pose, height, radius):
+    """
+    Will create a cylinder `CollisionObject` to be added to the scene.
+
+    - pose: the `Pose` of the centre of the cylinder, whose axis is the z
+    axis of the pose.
+    """
+    collision_object = CollisionObject()
+    collision_object.id = name
+    collision_object.header.frame_id = frame_id
+    collision_object.operation = CollisionObject.ADD
+
+    cylinder = SolidPrimitive()
+    cylinder.type = SolidPrimitive.CYLINDER
+    cylinder.dimensions = [height, radius]
+
+    collision_object.primitives = [cylinder]
+    collision_object.primitive_poses = [pose]
+
+    return collision_object
+
+
+def obstacle_collision_object(obstacle, frame_id):
+    """Will create the `CollisionObject` of an environment's obstacle."""
+    return box_collision_object(obstacle.name,
+                                frame_id,
+                                obstacle.pose.pose,
+                                obstacle.size)
+
+
+def _same_values(values, other_values, tolerance):
+    """Will return True if the two lists of numbers are (nearly) equal."""
+    return len(values) == len(other_values) and \
+        all([abs(a - b) <= tolerance for a, b in zip(values, other_values)])
+
+
+def _same_pose(pose, other_pose, tolerance):
+    """Will return True if the two `Pose`s are (nearly) equal."""
+    position = [pose.position.x, pose.position.y, pose.position.z]
+    other_position = [other_pose.position.x,
+                      other_pose.position.y,
+                      other_pose.position.z]
+
+    orientation = [pose.orientation.x, pose.orientation.y,
+                   pose.orientation.z, pose.orientation.w]
+    other_orientation = [other_pose.orientation.x, other_pose.orientation.y,
+                         other_pose.orientation.z, other_pose.orientation.w]
+
+    # q and -q are the same rotation
+    alignment = abs(sum([a * b for a, b in zip(orientation,
+                                                other_orientation)]))
+
+    return _same_values(position, other_position, tolerance) and \
+        alignment >= 1 - tolerance
+
+
+def same_geometry(collision_object, other_object, tolerance=1e-3):
+    """
+    Will return True if the two `CollisionObject`s have the same geometry.
+
+    The primitives (type and dimensions) and their poses are compared.
+    """
+    if len(collision_object.primitives) != len(other_object.primitives) or \
+            len(collision_object.primitive_poses) != \
+            len(other_object.primitive_poses):
+        return False
+
+    for primitive, other in zip(collision_object.primitives,
+                                other_object.primitives):
+        if primitive.type != other.type or \
+                not _same_values(primitive.dimensions, other.dimensions,
+                                 tolerance):
+            return False
+
+    for pose, other in zip(collision_object.primitive_poses,
+                           other_object.primitive_poses):
+        if not _same_pose(pose, other, tolerance):
+            return False
+
+    return True
+
+
+def removal_collision_object(name, frame_id):
+    """Will create a `CollisionObject` removing the object from the scene."""
+    collision_object = CollisionObject()
+    collision_object.id = name
+    collision_object.header.frame_id = frame_id
+    collision_object.operation = CollisionObject.REMOVE
+
+    return collision_object
+
+
+class PlanningSceneUpdater:
+    """Applies batches of collision objects to the planning scene."""
+
+    def __init__(self, frame_id):
+        """
+        Default constructor.
+
+        - frame_id: the planning frame, in which the objects are expressed.
+        """
+        self.frame_id = frame_id
+
+        self._publisher = rospy.Publisher("/planning_scene",
+                                          PlanningScene,
+                                          queue_size=10)
+
+        self._get_scene = rospy.ServiceProxy("/get_planning_scene",
+                                             GetPlanningScene)
+
+        # The service of move_group applying the diffs, resolved once
+        # move_group is up (see `wait_until_connected`).
+        self._apply_scene = None
+
+    def wait_until_connected(self, timeout=30):
+        """
+        Will wait until move_group is able to receive planning scene diffs.
+
+        Will return True if move_group is ready, False on timeout.
+        """
+        deadline = time.time() + timeout
+
+        try:
+            rospy.wait_for_service("/get_planning_scene", timeout)
+        except rospy.ROSException:
+            return False
+
+        # Prefer the service of move_group, if available, since the response
+        # acknowledges that the diff has been applied. move_group advertises
+        # it with `/get_planning_scene`, hence it is only briefly waited for.
+        if self._apply_scene is None and ApplyPlanningScene is not None:
+            try:
+                rospy.wait_for_service("/apply_planning_scene",
+                                       max(min(deadline - time.time(), 1.0),
+                                           0.01))
+                self._apply_scene = rospy.ServiceProxy("/apply_planning_scene",
+                                                       ApplyPlanningScene)
+            except rospy.ROSException:
+                pass
+
+        if self._apply_scene is not None:
+            return True
+
+        while self._publisher.get_num_connections() == 0:
+            if time.time() > deadline or rospy.is_shutdown():
+                return False
+            rospy.sleep(0.01)
+
+        return True
+
+    def apply(self, collision_objects, timeout=5.0, acknowledge=True):
+        """
+        Will apply the collision objects to the scene as a single diff.
+
+        - collision_objects: list of `CollisionObject` (additions and
+        removals).
+        - timeout: maximum time in seconds to wait for the acknowledgement.
+        - acknowledge: if False, the diff is only published (used for
+        frequent updates, where the next update supersedes this one).
+
+        Will return True once move_group acknowledged the diff, False if it
+        did not within the timeout.
+        """
+        scene = PlanningScene()
+        scene.is_diff = True
+        scene.world.collision_objects = collision_objects
+
+        if not acknowledge:
+            self._publisher.publish(scene)
+            return True
+
+        if self._apply_scene is not None:
+            try:
+                return self._apply_scene(scene).success
+            except rospy.ServiceException as e:
+                # Published instead, and checked in the world
+                rospy.logwarn("apply_planning_scene failed: {}".format(e))
+
+        self._publisher.publish(scene)
+
+        added = dict([(o.id, o) for o in collision_objects
+                      if o.operation == CollisionObject.ADD])
+        # Objects removed and added again (e.g when replacing them) are
+        # expected to be in the world.
+        removed = set([o.id for o in collision_objects
+                       if o.operation == CollisionObject.REMOVE]) - \
+            set(added.keys())
+
+        return self._wait_for_world(added, removed, timeout)
+
+    def _is_applied(self, world_objects, added, removed):
+        """Will return True if the world reflects the added/removed objects."""
+        world = dict([(o.id, o) for o in world_objects])
+
+        if removed & set(world.keys()):
+            return False
+
+        return all([name in world and same_geometry(expected, world[name])
+                    for name, expected in added.items()])
+
+    def _wait_for_world(self, added, removed, timeout):
+        """
+        Will wait until the world contains (or not) the given objects.
+
+        - added: name -> `CollisionObject` expected in the world, with the
+        same geometry.
+        - removed: names of the objects expected not to be in the world.
+        """
+        components = PlanningSceneComponents()
+        components.components = PlanningSceneComponents.WORLD_OBJECT_GEOMETRY
+
+        deadline = time.time() + timeout
+        while not rospy.is_shutdown():
+            try:
+                world_objects = self._get_scene(components).scene.world \
+                                    .collision_objects
+            except rospy.ServiceException:
+                world_objects = None
+
+            if world_objects is not None and \
+                    self._is_applied(world_objects, added, removed):
+                return True
+
+            if time.time() > deadline:
+                return False
+
+            rospy.sleep(0.005)
+
+        return False
@@ -0,0 +1,389 @@
+#!/usr/bin/env python
+"""
+ROS Backend.
+
+The  `Cashier`  does not  talk  to  the  robot directly, but  through a backend
+providing:
+
+- planner: moves Baxter's arms (`MoveItPlanner`).
+- perception: the customer's hands and the banknote recognition.
+- display: the images shown on Baxter's head screen.
+- clock: the time, sleeps and rates used by the interaction.
+
+This is the  backend of the real robot, using ROS, MoveIt! and the perception
+services. See simulation.py for the backend used to run the cashier without
+the robot.
+
+    Copyright (C)  2016/2017 The University of Leeds and Rafael Papallas
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# System specific imports
+import copy
+import threading
+
+from baxter_interface import CameraController
+
+# ROS specific imports
+import rospy
+import cv2
+import cv_bridge
+import rospkg
+
+from sensor_msgs.msg import (Image,)
+
+# Project specific imports
+from baxter_cashier_manipulation.srv import GetUserPose
+from baxter_cashier_manipulation.srv import RecogniseBanknote
+from baxter_pose import BaxterPose
+from moveit_controller import MoveItPlanner
+from baxter_cashier_manipulation import tracing
+
+
+class ImageGenerator:
+    """
+        This class create dynamic images on the fly. Using some image templates
+        it will write text on the image using OpenCV library. The images are
+        the amount due and change due images that are displayed on Baxter's
+        head screen.
+    """
+    def __init__(self):
+        """
+            Constructor that load the templates and some other constant
+            variables.
+        """
+        rospack = rospkg.RosPack()
+        path = rospack.get_path('baxter_cashier_manipulation')
+        full_path = path + "/img/"
+
+        self.template_amount_due = cv2.imread(full_path + 'amount_due_template.png')
+        self.template_change_due = cv2.imread(full_path + 'change_due_template.png')
+        self.thank_you_image = cv2.imread(full_path + 'thank_you_message.png')
+
+        # Vertical banknotes
+        self.five_bill = cv2.imread(full_path + 'five_bill_vertical.png')
+        self.one_bill = cv2.imread(full_path + 'one_bill_vertical.png')
+
+        # Reise the banknotes to smaller so they can fit
+        self.five_bill = cv2.resize(self.five_bill, (100, 180))
+        self.one_bill = cv2.resize(self.one_bill, (100, 180))
+
+        self.font = cv2.FONT_HERSHEY_SIMPLEX
+        self.x_offset = 30
+        self.y_offset = 350
+
+    def generate_change_due(self, change_due):
+        """Generates the change due screen with the change due value on it."""
+        if change_due == 0:
+            return self.thank_you_image
+
+        img = copy.deepcopy(self.template_change_due)
+        cv2.putText(img, str(change_due), (650, 323), self.font, 2, (0, 0, 0), 3)
+        return img
+
+    def generate_amount_due(self, amount_due, banknotes_given):
+        """
+            Generates the amount due with the banknotes given so far appended
+            on it.
+        """
+        def get_image_from_number(number):
+            return self.five_bill if number == 5 else self.one_bill
+
+        self.x_offset = 30
+        img = copy.deepcopy(self.template_amount_due)
+        cv2.putText(img, str(amount_due), (650, 130), self.font, 2, (0, 0, 0), 3)
+
+        for number in banknotes_given:
+            banknote_image = copy.deepcopy(get_image_from_number(number))
+            img[self.y_offset:self.y_offset+banknote_image.shape[0], self.x_offset:self.x_offset+banknote_image.shape[1]] = banknote_image
+            self.x_offset += 120
+
+        return img
+
+
+class RosClock:
+    """The wall clock, as used by ROS."""
+
+    def now(self):
+        """
+        Will return the current time in seconds.
+
+        This is the ROS time, the time of the stamps of the sensor data.
+        """
+        return rospy.get_time()
+
+    def sleep(self, seconds):
+        """Will sleep for the given seconds."""
+        with tracing.span("sleep", "clock", seconds=seconds):
+            rospy.sleep(seconds)
+
+    def rate(self, hz):
+        """Will return a rate (with a `sleep` method) of the given frequency."""
+        return rospy.Rate(hz)
+
+
+class RosDisplay:
+    """Shows images to Baxter's head screen."""
+
+    def __init__(self):
+        """Default constructor."""
+        self.image_generator = ImageGenerator()
+
+        # Publisher of the screen and the key of the screen shown (if any),
+        # used to avoid showing the same screen again.
+        self._display = rospy.Publisher('/robot/xdisplay',
+                                        Image,
+                                        latch=True,
+                                        queue_size=2)
+        self._screen = None
+
+        # Set while the banknote is being recognised
+        self._reading = threading.Event()
+
+    def show_amount_due(self, amount_due, banknotes_given):
+        """Will show the amount due, with the banknotes given so far."""
+        self._show_screen(("amount_due", amount_due, tuple(banknotes_given)),
+                          lambda: self.image_generator.generate_amount_due(
+                                            amount_due=amount_due,
+                                            banknotes_given=banknotes_given))
+
+    def show_change_due(self, change_due):
+        """Will show the change due, or the thank you message if zero."""
+        self._show_screen(("change_due", change_due),
+                          lambda: self.image_generator.generate_change_due(
+                                                    change_due=change_due))
+
+    def show_image(self, image_path):
+        """Will show the image file (from the `img` directory)."""
+        self.show_image_to_baxters_head_screen(image_path)
+
+    def show_eyes_normal(self):
+        """Will show normal eyes to Baxter's screen."""
+        self.show_image_to_baxters_head_screen("normal_eyes.png")
+
+    def show_eyes_focusing(self):
+        """Will show focusing eyes to Baxter's screen."""
+        self.show_image_to_baxters_head_screen("looking_eyes.png")
+
+    def show_eyes_focusing_left(self):
+        """Will show focusing eyes looking to left to Baxter's screen."""
+        self.show_image_to_baxters_head_screen("looking_left_eyes.png")
+
+    def show_eyes_focusing_right(self):
+        """Will show focusing eyes looking to right to Baxter's screen."""
+        self.show_image_to_baxters_head_screen("looking_right_eyes.png")
+
+    def start_reading_animation(self):
+        """
+        Will start moving the eyes, until `stop_reading_animation`.
+
+        Shows that the robot is not stuck but is instead "thinking" (because
+        eyes are moving) while the banknote is being recognised.
+        """
+        self._reading.set()
+
+        thread = threading.Thread(target=self._make_eyes_animated)
+        thread.daemon = True
+        thread.start()
+
+    def stop_reading_animation(self):
+        """Will stop moving the eyes."""
+        self._reading.clear()
+
+    def _make_eyes_animated(self):
+        """Will create the illusion that the eyes are moving."""
+        funcs = [self.show_eyes_focusing,
+                 self.show_eyes_focusing_right,
+                 self.show_eyes_focusing_left,
+                 self.show_eyes_focusing_right,
+                 self.show_eyes_focusing_left]
+
+        while self._reading.is_set():
+            for func in funcs:
+                func()
+
+    def _show_screen(self, key, generate_image):
+        """
+        Will show the screen identified by the key, unless already shown.
+
+        - generate_image: function returning the image of the screen, called
+        only if the screen has changed.
+        """
+        if key == self._screen:
+            return
+
+        self.show_image_to_baxters_head_screen(image_path=None,
+                                               image=generate_image())
+        self._screen = key
+
+    def show_image_to_baxters_head_screen(self, image_path, image=None):
+        """Will show an image to Baxter's screen."""
+        # Whatever is shown now replaces the last screen
+        self._screen = None
+
+        if image_path:
+            rospack = rospkg.RosPack()
+            path = rospack.get_path('baxter_cashier_manipulation')
+            img = cv2.imread(path + "/img/" + image_path)
+
+        if image is not None:
+            img = image
+
+        with tracing.span("display_publish", "display", image=image_path):
+            msg = cv_bridge.CvBridge().cv2_to_imgmsg(img, encoding="bgr8")
+            self._display.publish(msg)
+
+            # Sleep to allow for image to be published
+            rospy.sleep(1)
+
+
+class RosPerception:
+    """The customer's hands and the banknotes, from the perception services."""
+
+    def __init__(self, camera_topic="/cameras/head_camera/image"):
+        """
+        Default constructor.
+
+        - camera_topic: the camera topic to be used for money recognition
+        (Baxter's head camera or RGB-D camera)
+        """
+        self._money_recognition_camera_topic = camera_topic
+
+        # Service handles, created on first use
+        self._get_user_pose = None
+        self._recognise_banknote = None
+
+        # Stamp of the last pose received of each hand. The next pose of the
+        # hand must be newer, hence the same pose is never returned twice.
+        self._last_stamps = {"left": rospy.Time(0), "right": rospy.Time(0)}
+
+    def recognise_banknote(self):
+        """"Will do the money recognition and will return the detected amount.
+
+        This will either return a correct amount like 1 or 5 but also -1 if
+        nothing detected.
+        """
+        # This blocks until the service 'recognise_banknote' is available
+        if self._recognise_banknote is None:
+            with tracing.span("wait_for_service", "service",
+                              service="recognise_banknote"):
+                rospy.wait_for_service('recognise_banknote')
+
+            # Handle for calling the service
+            self._recognise_banknote = rospy.ServiceProxy('recognise_banknote',
+                                                          RecogniseBanknote)
+
+        try:
+            # Use the handle as any other normal function
+            with tracing.span("recognise_banknote", "service"):
+                value = self._recognise_banknote(
+                                        self._money_recognition_camera_topic)
+            return value.banknote_amount
+        except rospy.ServiceException as e:
+            print("Service call failed: %s" % e)
+
+        return None
+
+    def get_hand_poses(self):
+        """
+        Will return the user's hand-pose from space.
+
+        Each pose is created at the time it was observed by the skeleton
+        tracker. The service returns at once: if there is no pose newer than
+        the last one, the pose is empty and created at time zero (outdated).
+        """
+        # This blocks until the service 'get_user_pose' is available
+        if self._get_user_pose is None:
+            with tracing.span("wait_for_service", "service",
+                              service="get_user_pose"):
+                rospy.wait_for_service('get_user_pose')
+
+            # Handle for calling the service
+            self._get_user_pose = rospy.ServiceProxy('get_user_pose',
+                                                     GetUserPose)
+
+        try:
+            # Use the handle as any other normal function
+            # IMPORTANT: Note that for some reason the Skeelton Tracker library
+            # identifies the left hand as the right and the right as left,
+            # hence an easy and quick fix was to request the opposite hand here
+            with tracing.span("get_user_pose", "service", hand="left"):
+                left_hand = self._get_user_pose(
+                                    user_number=1,
+                                    body_part='right_hand',
+                                    newer_than=self._last_stamps["left"])
+            with tracing.span("get_user_pose", "service", hand="right"):
+                right_hand = self._get_user_pose(
+                                    user_number=1,
+                                    body_part='left_hand',
+                                    newer_than=self._last_stamps["right"])
+        except rospy.ServiceException as e:
+            print("Service call failed: %s" % e)
+
+            # No hands seen
+            return BaxterPose(0, 0, 0, 0, 0, 0, 0, 0), \
+                BaxterPose(0, 0, 0, 0, 0, 0, 0, 0)
+
+        return self._to_pose("left", left_hand), \
+            self._to_pose("right", right_hand)
+
+    def _to_pose(self, hand, response):
+        """Will return the pose of the hand from the service response."""
+        if response.stamp.is_zero():
+            # The hand was not observed (or not since the last pose)
+            return BaxterPose(0, 0, 0, 0, 0, 0, 0, 0)
+
+        self._last_stamps[hand] = response.stamp
+
+        x1, y1, z1 = response.transformation
+        x2, y2, z2, w = response.rotation
+
+        return BaxterPose(x1, y1, z1, x2, y2, z2, w, response.stamp.to_sec())
+
+
+class RosBackend:
+    """The backend of the real robot."""
+
+    def __init__(self):
+        """Will setup Baxter's arms, the perception and the screen."""
+        self.clock = RosClock()
+
+        # Baxter's libms configured
+        self.planner = MoveItPlanner()
+
+        self.perception = RosPerception()
+        self.display = RosDisplay()
+
+    def get_param(self, name, default):
+        """Will return the value of the (private) ROS parameter."""
+        return rospy.get_param(name, default)
+
+    def is_shutdown(self):
+        """Will return True once the node is shutting down."""
+        return rospy.is_shutdown()
+
+    def enable_head_camera(self):
+        """
+        Will disable some Baxter's cameras and enable the head camera.
+
+        Baxter can only have two cameras open at a time.
+        """
+        try:
+            left_hand_camera = CameraController('left_hand_camera')
+            head_camera = CameraController('head_camera')
+            left_hand_camera.close()
+            head_camera.open()
+        except:
+            pass
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+"""
+Scene File Parser.
+
+Parses  the  MoveIt!  `.scene` files  (as  exported  from  the  MoveIt!  Rviz
+plugin) found in `configuration/moveit_scene_objects`. The format is:
+
+    scene_name
+    * object_name
+    number_of_shapes
+    shape_type (only box is supported)
+    dimensions (x y z)
+    position (x y z)
+    orientation (x y z w)
+    colour (r g b a, optional)
+    ...
+    .
+
+Parsing  a file  results in a compact, "compiled" form of the scene: a tuple of
+`(name, size, position, orientation)` tuples. Compiled scenes are cached by the
+path and modification time of the file, hence loading the same file again is
+free, and a file is parsed again only if it has changed.
+
+    Copyright (C)  2016/2017 The University of Leeds and Rafael Papallas
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# System-wide imports
+import os
+import threading
+
+# Compiled scenes: absolute path -> (modification time, compiled scene)
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+class SceneFileError(Exception):
+    """
+    Scene File Error.
+
+    Raised when a `.scene` file is malformed or uses unsupported shapes.
+    """
+
+    def __init__(self, path, message):
+        """Default constructor accepting the file and the problem."""
+        self.path = path
+        self.message = message
+
+    def __str__(self):
+        """String representation of the exception."""
+        return "Invalid scene file {}: {}".format(self.path, self.message)
+
+
+def _numbers(line, count, path):
+    """Will parse exactly `count` numbers from the line."""
+    values = line.split()
+
+    if len(values) != count:
+        raise SceneFileError(path, "expected {} numbers in '{}'".format(
+                                                                count, line))
+
+    try:
+        return tuple([float(v) for v in values])
+    except ValueError:
+        raise SceneFileError(path, "expected numbers in '{}'".format(line))
+
+
+def _is_colour(line):
+    """Will return True if the line is a (r g b a) colour line."""
+    values = line.split()
+
+    if len(values) != 4:
+        return False
+
+    try:
+        [float(v) for v in values]
+    except ValueError:
+        return False
+
+    return True
+
+
+def parse_scene(path):
+    """
+    Will parse the `.scene` file and return the compiled scene.
+
+    The compiled scene is a tuple of `(name, size, position, orientation)`
+    tuples, one per box of the scene. Objects made of more than one box will
+    result in one entry per box, named `object_name_i` for the i-th box.
+    """
+    with open(path) as f:
+        lines = [line.strip() for line in f if line.strip()]
+
+    obstacles = []
+
+    # The first line is the name of the scene.
+    i = 1
+    while i < len(lines) and lines[i] != ".":
+        if not lines[i].startswith("*"):
+            raise SceneFileError(path, "expected an object at '{}'".format(
+                                                                    lines[i]))
+
+        name = lines[i][1:].strip()
+        try:
+            number_of_shapes = int(lines[i + 1])
+        except (IndexError, ValueError):
+            raise SceneFileError(path, "expected the number of shapes of "
+                                       "'{}'".format(name))
+        i += 2
+
+        if i + 4 * number_of_shapes > len(lines):
+            raise SceneFileError(path, "'{}' is truncated".format(name))
+
+        for shape in range(number_of_shapes):
+            if lines[i] != "box":
+                raise SceneFileError(path, "unsupported shape '{}'".format(
+                                                                    lines[i]))
+
+            size = _numbers(lines[i + 1], 3, path)
+            position = _numbers(lines[i + 2], 3, path)
+            orientation = _numbers(lines[i + 3], 4, path)
+            i += 4
+
+            # Newer versions of MoveIt! also store the colour of each shape
+            if i < len(lines) and _is_colour(lines[i]):
+                i += 1
+
+            shape_name = name
+            if number_of_shapes > 1:
+                shape_name = "{}_{}".format(name, shape)
+
+            obstacles.append((shape_name, size, position, orientation))
+
+    return tuple(obstacles)
+
+
+def load_scene(path):
+    """
+    Will return the compiled scene of the file, using the cache if possible.
+
+    The file is parsed again only if it was modified since it was cached.
+    """
+    path = os.path.abspath(path)
+    modified = os.path.getmtime(path)
+
+    with _cache_lock:
+        cached = _cache.get(path)
+
+    if cached is not None and cached[0] == modified:
+        return cached[1]
+
+    compiled = parse_scene(path)
+
+    with _cache_lock:
+        _cache[path] = (modified, compiled)
+
+    return compiled
+
+
+def find_scene_files(directory):
+    """
+    Will return the `.scene` files of the directory.
+
+    Returns a dictionary from the name of each scene (the file name without
+    the extension) to the path of the file.
+    """
+    scenes = {}
+
+    for file_name in sorted(os.listdir(directory)):
+        name, extension = os.path.splitext(file_name)
+        if extension == ".scene":
+            scenes[name] = os.path.join(directory, file_name)
+
+    return scenes
@@ -0,0 +1,620 @@
+#!/usr/bin/env python
+"""
+Simulation Backend.
+
+Runs the `Cashier` without the robot, ROS or the perception nodes, so changes
+to the interaction (and its throughput) can be tried on any Linux box:
+
+- `SimulatedPlanner`: fake arms whose motions take a configurable time. Like
+  the arms of `MoveItPlanner`, each arm does one motion at a time and the
+  asynchronous motions run while the cashier carries on.
+- `ScriptedCustomer`: a customer showing a hand and handing banknotes over,
+  following a script.
+- `FakeRecogniser`: recognises the banknotes, failing when scripted to.
+- `SimulatedDisplay`: records the screens instead of showing them.
+
+The  simulation  runs  either on a `SimulatedClock`, where  sleeping  only
+moves the time forward (hence long runs finish in seconds), or on a
+`WallClock`, sped up by a factor.
+
+Example:
+
+    python simulation.py --amount 7 --notes 5,1,1
+
+    Copyright (C)  2016/2017 The University of Leeds and Rafael Papallas
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# System-wide imports
+import argparse
+import copy
+import json
+import random
+import time
+
+# Project specific imports
+from baxter_pose import BaxterPose
+from cashier import Cashier
+from motion_futures import MotionCancelledError, MotionTimeoutError
+from motion_timing import MotionTimer
+from table_inventory import TableInventory, TableLayout
+
+# Time in seconds taken by each motion (planning and execution), by motion
+# name (see speed_profiles.py).
+DEFAULT_MOTION_DURATIONS = {
+    "pose": 2.0,
+    "head_camera": 2.5,
+    "neutral": 2.0,
+    "banknote_above": 2.0,
+    "table_drop": 2.5,
+    "calibration": 2.0,
+    "banknote": 1.0,
+    "customer_hand": 3.0,
+    "gripper": 0.5,
+}
+
+# Same area as `REACHABLE_AREA` of moveit_controller.py
+REACHABLE_AREA = [(0.3, 1), (-0.7, 0.5), (0, 0.5)]
+
+
+def empty_pose(created):
+    """Will return an empty pose (a hand not seen) created at the time."""
+    return BaxterPose(0, 0, 0, 0, 0, 0, 0, created)
+
+
+class SimulatedClock:
+    """
+    A clock where sleeping only moves the time forward.
+
+    The simulation runs as fast as the code allows. It is meant to be used by
+    a single thread.
+    """
+
+    def __init__(self, start=0.0):
+        """Will start the clock at the given time."""
+        self._now = start
+
+    def now(self):
+        """Will return the current time in seconds."""
+        return self._now
+
+    def sleep(self, seconds):
+        """Will move the time forward."""
+        if seconds > 0:
+            self._now += seconds
+
+    def rate(self, hz):
+        """Will return a rate (with a `sleep` method) of the given frequency."""
+        return Rate(self, hz)
+
+
+class WallClock:
+    """The real time, sped up by a factor."""
+
+    def __init__(self, speed=1.0):
+        """Default constructor, `speed` times faster than real time."""
+        self.speed = speed
+        self._start = time.time()
+
+    def now(self):
+        """Will return the current (sped up) time in seconds."""
+        return self._start + (time.time() - self._start) * self.speed
+
+    def sleep(self, seconds):
+        """Will sleep for the given (sped up) seconds."""
+        if seconds > 0:
+            time.sleep(seconds / self.speed)
+
+    def rate(self, hz):
+        """Will return a rate (with a `sleep` method) of the given frequency."""
+        return Rate(self, hz)
+
+
+class Rate:
+    """Sleeps to keep a loop running at a frequency, like `rospy.Rate`."""
+
+    def __init__(self, clock, hz):
+        """Default constructor."""
+        self._clock = clock
+        self._period = 1.0 / hz
+        self._last = clock.now()
+
+    def sleep(self):
+        """Will sleep until the next period."""
+        self._last = max(self._last + self._period, self._clock.now())
+        self._clock.sleep(self._last - self._clock.now())
+
+
+class SimulatedArm:
+    """A fake arm of Baxter."""
+
+    def __init__(self, side_name):
+        """Default constructor."""
+        self._side_name = side_name
+
+        # Time at which the pending motions of the arm will be complete
+        self.busy_until = 0.0
+
+    def __str__(self):
+        """String representation of the arm."""
+        return self._side_name
+
+    def is_left(self):
+        """Will return True if this is the left arm."""
+        return self._side_name == "left"
+
+    def is_right(self):
+        """Will return True if this is the right arm."""
+        return self._side_name == "right"
+
+
+class SimulatedMotion:
+    """
+    The future of an asynchronous simulated motion.
+
+    Has the same interface as `MotionFuture` (see motion_futures.py).
+    """
+
+    def __init__(self, clock, arm, finish):
+        """Default constructor."""
+        self._clock = clock
+        self._arm = arm
+        self._finish = finish
+        self._cancelled = False
+
+    def done(self):
+        """Will return True if the motion is complete or cancelled."""
+        return self._cancelled or self._clock.now() >= self._finish
+
+    def cancelled(self):
+        """Will return True if the motion was cancelled."""
+        return self._cancelled
+
+    def cancel(self):
+        """Will stop the arm where it is."""
+        if self.done():
+            return False
+
+        self._cancelled = True
+        self._arm.busy_until = self._clock.now()
+        return True
+
+    def result(self, timeout=None):
+        """Will wait for the motion to complete, see `MotionFuture.result`."""
+        if self._cancelled:
+            raise MotionCancelledError()
+
+        remaining = self._finish - self._clock.now()
+
+        if timeout is not None and remaining > timeout:
+            self._clock.sleep(timeout)
+            raise MotionTimeoutError()
+
+        self._clock.sleep(remaining)
+        return True
+
+
+class SimulatedPlanner:
+    """
+    Fake version of `MoveItPlanner`.
+
+    Every motion takes the time of its name (see DEFAULT_MOTION_DURATIONS),
+    recorded as the "execution" phase of the timer.
+    """
+
+    def __init__(self, clock, durations=None, reachable_area=None):
+        """
+        Default constructor.
+
+        - durations: time of each motion by name, overriding the defaults.
+        - reachable_area: ((x_min, x_max), (y_min, y_max), (z_min, z_max)).
+        """
+        self.clock = clock
+        self.durations = dict(DEFAULT_MOTION_DURATIONS)
+        self.durations.update(durations or {})
+        self.reachable_area = reachable_area or REACHABLE_AREA
+
+        self.timer = MotionTimer(clock=clock.now)
+
+        self.left_arm = SimulatedArm("left")
+        self.right_arm = SimulatedArm("right")
+        self.active_hand = None
+
+        # Number of motions done, by name
+        self.motions = {}
+
+    def _start(self, arm, motion_name):
+        """
+        Will queue the motion after the pending motions of the arm.
+
+        Returns the time at which the motion will be complete.
+        """
+        duration = self.durations.get(motion_name, self.durations["pose"])
+        start = max(self.clock.now(), arm.busy_until)
+
+        arm.busy_until = start + duration
+        self.motions[motion_name] = self.motions.get(motion_name, 0) + 1
+        self.timer.record("execution", arm, motion_name, duration, start)
+
+        return arm.busy_until
+
+    def _run(self, arm, motion_name):
+        """Will do the motion, waiting for it to complete."""
+        self.clock.sleep(self._start(arm, motion_name) - self.clock.now())
+
+    def _submit(self, arm, motion_name):
+        """Will start the motion in the background and return its future."""
+        return SimulatedMotion(self.clock, arm, self._start(arm, motion_name))
+
+    def is_arm_busy(self, arm):
+        """Will return True if the arm has motions pending."""
+        return arm.busy_until > self.clock.now()
+
+    def is_pose_within_reachable_area(self, pose):
+        """Will check if the pose is within the reachable area."""
+        values = [pose.transformation_x,
+                  pose.transformation_y,
+                  pose.transformation_z]
+
+        return all([low <= value <= high for value, (low, high)
+                    in zip(values, self.reachable_area)])
+
+    def are_poses_reachable_by_arm(self, poses, arm):
+        """The simulated arms reach the whole table."""
+        return [True] * len(poses)
+
+    def _joints(self, pose):
+        """
+        Will return the "joints" of the arm at the pose.
+
+        The simulated arms have no kinematics, their joints are the position
+        of the end-effector.
+        """
+        return {"x": pose.transformation_x,
+                "y": pose.transformation_y,
+                "z": pose.transformation_z}
+
+    def solve_ik(self, poses, arm):
+        """Will return the joints reaching each of the poses."""
+        return [self._joints(pose) for pose in poses]
+
+    def get_joint_positions(self, arm):
+        """Will return the joints of the arm, at its fixed pose."""
+        return self._joints(self.get_end_effector_current_pose(str(arm)))
+
+    def get_end_effector_current_pose(self, side_name):
+        """Will return a fixed pose of the end-effector."""
+        return BaxterPose(0.6, 0.3 if side_name == "left" else -0.3, 0.0,
+                          0, 1, 0, 0)
+
+    def move_to_position(self, baxter_pose, arm, motion_name="pose",
+                         profile=None):
+        """Will move Baxter hand to the pose."""
+        self.active_hand = arm
+        self._run(arm, motion_name)
+
+    def move_to_position_async(self, baxter_pose, arm, motion_name="pose",
+                               profile=None):
+        """Asynchronous version of `move_to_position`."""
+        self.active_hand = arm
+        return self._submit(arm, motion_name)
+
+    def move_hand_to_head_camera(self, arm=None):
+        """Will move Baxter's active hand (or the given arm) to head."""
+        self._run(arm or self.active_hand, "head_camera")
+
+    def leave_banknote_to_the_table(self):
+        """Will leave the banknote to the table."""
+        self._run(self.active_hand, "table_drop")
+        self._run(self.active_hand, "gripper")
+        self._run(self.active_hand, "neutral")
+
+    def set_neutral_position_of_limb(self, arm=None):
+        """Will moves Baxter arm (active or given) to neutral position."""
+        self._run(arm or self.active_hand, "neutral")
+
+    def set_neutral_position_of_limb_async(self):
+        """Asynchronous version of `set_neutral_position_of_limb`."""
+        return self._submit(self.active_hand, "neutral")
+
+    def open_gripper(self):
+        """Will open the gripper of the active hand."""
+        self._run(self.active_hand, "gripper")
+
+    def close_gripper(self):
+        """Will close the gripper of the active hand."""
+        self._run(self.active_hand, "gripper")
+
+    def shutdown(self):
+        """Nothing to stop, here for `MoveItPlanner` compatibility."""
+        pass
+
+
+class ScriptedCustomer:
+    """
+    A customer handing banknotes over, one at a time.
+
+    The hand of the customer appears `arrival_delay` seconds after the start
+    and after each banknote has been taken, as long as the customer has
+    banknotes left.
+    """
+
+    def __init__(self, clock, notes, hand_pose=None, side="left",
+                 arrival_delay=1.0, unreachable_for=0.0):
+        """
+        Default constructor.
+
+        - notes: the values of the banknotes, in the order handed over.
+        - hand_pose: the `BaxterPose` of the hand.
+        - side: which of the two hands ("left" or "right") is shown.
+        - unreachable_for: for this many seconds, from the start, the hand is
+        shown out of Baxter's reach.
+        """
+        self.clock = clock
+        self.notes = list(notes)
+        self.hand_pose = hand_pose or BaxterPose(0.7, 0.1, 0.2, 0, 1, 0, 0)
+        self.unreachable_pose = BaxterPose(1.5, 0.1, 0.2, 0, 1, 0, 0)
+        self.side = side
+        self.arrival_delay = arrival_delay
+
+        self._hand_shown_at = clock.now() + arrival_delay
+        self._reachable_at = clock.now() + unreachable_for
+
+    def get_hand_poses(self):
+        """Will return the (left, right) poses, empty if not shown."""
+        now = self.clock.now()
+        empty = empty_pose(now)
+
+        if len(self.notes) == 0 or now < self._hand_shown_at:
+            return empty, empty
+
+        pose = copy.copy(self.hand_pose if now >= self._reachable_at else
+                         self.unreachable_pose)
+        pose.created = now
+
+        return (pose, empty) if self.side == "left" else (empty, pose)
+
+    def take_note(self):
+        """Will return the next banknote (or None) and pull the hand back."""
+        self._hand_shown_at = self.clock.now() + self.arrival_delay
+
+        return self.notes.pop(0) if len(self.notes) > 0 else None
+
+    def return_note(self, note):
+        """Will take back a banknote, to be handed over again."""
+        self.notes.insert(0, note)
+
+
+class FakeRecogniser:
+    """Recognises banknotes, failing when scripted to."""
+
+    def __init__(self, clock, duration=1.0, failures=(), failure_rate=0.0,
+                 seed=0):
+        """
+        Default constructor.
+
+        - duration: time in seconds taken by each recognition.
+        - failures: the recognitions (counting from zero) that fail.
+        - failure_rate: probability of any other recognition to fail.
+        """
+        self.clock = clock
+        self.duration = duration
+        self.failures = set(failures)
+        self.failure_rate = failure_rate
+        self.recognitions = 0
+
+        self._random = random.Random(seed)
+
+    def recognise(self, note):
+        """Will return the value of the banknote, or -1 if not recognised."""
+        self.clock.sleep(self.duration)
+
+        attempt = self.recognitions
+        self.recognitions += 1
+
+        if note is None or attempt in self.failures or \
+                self._random.random() < self.failure_rate:
+            return -1
+
+        return note
+
+
+class SimulatedPerception:
+    """The customer's hands and banknotes, from a scripted customer."""
+
+    def __init__(self, customer, recogniser):
+        """Default constructor."""
+        self.customer = customer
+        self.recogniser = recogniser
+
+    def get_hand_poses(self):
+        """Will return the customer's (left, right) hand poses."""
+        return self.customer.get_hand_poses()
+
+    def recognise_banknote(self):
+        """
+        Will recognise the banknote taken from the customer.
+
+        A banknote that is not recognised is handed back to the customer.
+        """
+        note = self.customer.take_note()
+        value = self.recogniser.recognise(note)
+
+        if value == -1 and note is not None:
+            self.customer.return_note(note)
+
+        return value
+
+
+class SimulatedDisplay:
+    """Records the screens shown, instead of showing them."""
+
+    def __init__(self, clock):
+        """Default constructor."""
+        self.clock = clock
+
+        # (time, screen) of every screen shown
+        self.screens = []
+
+    def _show(self, screen):
+        """Will record the screen, unless it is already shown."""
+        if len(self.screens) == 0 or self.screens[-1][1] != screen:
+            self.screens.append((self.clock.now(), screen))
+
+    def show_amount_due(self, amount_due, banknotes_given):
+        """Will show the amount due, with the banknotes given so far."""
+        self._show(("amount_due", amount_due, tuple(banknotes_given)))
+
+    def show_change_due(self, change_due):
+        """Will show the change due, or the thank you message if zero."""
+        self._show(("change_due", change_due))
+
+    def show_image(self, image_path):
+        """Will show the image file."""
+        self._show(("image", image_path))
+
+    def show_eyes_normal(self):
+        """Will show normal eyes."""
+        self.show_image("normal_eyes.png")
+
+    def start_reading_animation(self):
+        """Will show the eyes moving."""
+        self.show_image("looking_eyes.png")
+
+    def stop_reading_animation(self):
+        """Nothing to stop, the eyes are not animated."""
+        pass
+
+
+class SimulationBackend:
+    """Backend of the `Cashier` running without the robot."""
+
+    def __init__(self, customer_notes, clock=None, durations=None,
+                 recogniser_failures=(), failure_rate=0.0,
+                 recognition_duration=1.0, hand_pose=None, hand_side="left",
+                 arrival_delay=1.0, unreachable_for=0.0, params=None,
+                 seed=0, time_limit=None):
+        """
+        Default constructor.
+
+        - customer_notes: the banknotes the customer hands over.
+        - clock: `SimulatedClock` (default) or `WallClock`.
+        - durations: time of the motions, see `SimulatedPlanner`.
+        - recogniser_failures, failure_rate and recognition_duration: see
+        `FakeRecogniser`.
+        - hand_pose, hand_side, arrival_delay and unreachable_for: see
+        `ScriptedCustomer`.
+        - params: values of the ROS parameters of the cashier (e.g
+        "~state_timeouts").
+        - time_limit: the backend shuts down after this many seconds.
+        """
+        self.clock = clock or SimulatedClock()
+        self.planner = SimulatedPlanner(self.clock, durations)
+        self.customer = ScriptedCustomer(self.clock,
+                                         customer_notes,
+                                         hand_pose,
+                                         hand_side,
+                                         arrival_delay,
+                                         unreachable_for)
+        self.recogniser = FakeRecogniser(self.clock,
+                                         recognition_duration,
+                                         recogniser_failures,
+                                         failure_rate,
+                                         seed)
+        self.perception = SimulatedPerception(self.customer, self.recogniser)
+        self.display = SimulatedDisplay(self.clock)
+
+        self._params = params or {}
+        self._shutdown = False
+
+        self._deadline = None
+        if time_limit is not None:
+            self._deadline = self.clock.now() + time_limit
+
+    def get_param(self, name, default):
+        """Will return the value of the parameter."""
+        return self._params.get(name, default)
+
+    def is_shutdown(self):
+        """Will return True once shut down or out of time."""
+        if self._deadline is not None and self.clock.now() > self._deadline:
+            return True
+
+        return self._shutdown
+
+    def shutdown(self):
+        """Will stop the cashier."""
+        self._shutdown = True
+
+    def enable_head_camera(self):
+        """There are no cameras in the simulation."""
+        pass
+
+    def table_inventory(self, ones=10, fives=4):
+        """
+        Will return the banknotes on the table.
+
+        Each side of the table has a row of ones and a row of fives, laid out
+        as the calibration of the table saves them.
+        """
+        layouts = []
+
+        for side, y in [("left", 0.3), ("right", -0.3)]:
+            layouts.append(TableLayout(side, 1,
+                                       BaxterPose(0.6, y, -0.1, 0, 1, 0, 0),
+                                       columns=ones))
+            layouts.append(TableLayout(side, 5,
+                                       BaxterPose(0.75, y, -0.1, 0, 1, 0, 0),
+                                       columns=fives))
+
+        return TableInventory.from_layouts(layouts)
+
+
+def create_cashier(backend):
+    """Will create a `Cashier` using the simulation, without calibration."""
+    return Cashier(backend, inventory=backend.table_inventory())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Runs the cashier headless")
+    parser.add_argument("--amount", type=int, default=6,
+                        help="The amount due")
+    parser.add_argument("--notes", default="5,1",
+                        help="The banknotes the customer hands over")
+    parser.add_argument("--failures", default="",
+                        help="The recognitions (from 0) that fail")
+    parser.add_argument("--speed", type=float, default=None,
+                        help="Run on the wall clock, this many times faster "
+                             "than real time (default: simulated clock)")
+
+    args = parser.parse_args()
+
+    notes = [int(v) for v in args.notes.split(",") if v]
+    failures = [int(v) for v in args.failures.split(",") if v]
+    clock = WallClock(args.speed) if args.speed else SimulatedClock()
+
+    backend = SimulationBackend(notes, clock=clock,
+                                recogniser_failures=failures)
+    cashier = create_cashier(backend)
+
+    started = clock.now()
+    cashier.amount_due = args.amount
+    cashier.interact_with_customer()
+
+    print(json.dumps({"simulated_seconds": clock.now() - started,
+                      "amount_due": cashier.amount_due,
+                      "banknotes_given": cashier.banknotes_given,
+                      "timings": backend.planner.timer.total_by_phase()},
+                     indent=2, sort_keys=True))
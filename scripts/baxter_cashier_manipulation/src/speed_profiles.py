@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+"""
+Speed Profiles.
+
+Not every motion of Baxter needs the same care: long free-space motions (e.g
+moving the hand to the head camera or to the neutral position) can run at full
+speed, while  the last  centimetres  before grasping a banknote from the table
+or from  the customer's hand  need  to be slow and precise. This module defines
+named speed profiles and the  retiming of planned trajectories  to them.
+
+A profile  with an approach offset splits a motion in two: the arm moves at full
+speed  to  a pose  offset  from  the  target, and  only the  final  few
+centimetres from there to the target are slowed down.
+
+    Copyright (C)  2016/2017 The University of Leeds and Rafael Papallas
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# System-wide imports
+import copy
+import math
+
+# ROS-wide imports
+import rospy
+
+# Names of the profiles
+TRANSIT = "transit"
+APPROACH = "approach"
+GRASP = "grasp"
+HANDOVER = "handover"
+
+
+class SpeedProfile:
+    """Velocity and acceleration scaling of a kind of motion."""
+
+    def __init__(self, name, velocity_scaling, acceleration_scaling,
+                 approach_offset=None):
+        """
+        Default constructor.
+
+        - velocity_scaling and acceleration_scaling: factors in (0, 1] of the
+        maximum joint velocities and accelerations.
+        - approach_offset: (x, y, z) offset in metres, relative to the target,
+        of the pose from where the motion slows down. None means the entire
+        motion runs with this profile.
+        """
+        self.name = name
+        self.velocity_scaling = velocity_scaling
+        self.acceleration_scaling = acceleration_scaling
+        self.approach_offset = approach_offset
+
+    def time_scaling(self):
+        """
+        Will return the factor used to scale the time of a trajectory.
+
+        Slowing a trajectory down by a factor `s` scales the velocities by `s`
+        and the accelerations by `s^2`, hence both limits are respected with
+        the smallest of the two factors.
+        """
+        return min(self.velocity_scaling,
+                   math.sqrt(self.acceleration_scaling))
+
+    def approach_distance(self):
+        """Will return the length of the slow part of the motion."""
+        if self.approach_offset is None:
+            return 0.0
+
+        return math.sqrt(sum([v ** 2 for v in self.approach_offset]))
+
+    def approach_pose(self, pose):
+        """
+        Will return the pose from where the motion slows down, or None.
+
+        - pose: the target `Pose` of the motion.
+        """
+        if self.approach_offset is None:
+            return None
+
+        x, y, z = self.approach_offset
+
+        approach = copy.deepcopy(pose)
+        approach.position.x += x
+        approach.position.y += y
+        approach.position.z += z
+
+        return approach
+
+
+# Default profiles. The approach and the grasp are approached from above
+# (banknotes on the table) and the handover from Baxter's side (customer's
+# hand).
+DEFAULT_SPEED_PROFILES = {
+    TRANSIT: SpeedProfile(TRANSIT, 1.0, 1.0),
+    APPROACH: SpeedProfile(APPROACH, 0.6, 0.5, approach_offset=(0, 0, 0.05)),
+    GRASP: SpeedProfile(GRASP, 0.2, 0.2, approach_offset=(0, 0, 0.05)),
+    HANDOVER: SpeedProfile(HANDOVER, 0.35, 0.3,
+                           approach_offset=(-0.05, 0, 0)),
+}
+
+# The profile used by each of the motions of the project.
+MOTION_PROFILES = {
+    "pose": TRANSIT,
+    "head_camera": TRANSIT,
+    "neutral": TRANSIT,
+    "banknote_above": APPROACH,
+    "table_drop": APPROACH,
+    "calibration": APPROACH,
+    "banknote": GRASP,
+    "customer_hand": HANDOVER,
+}
+
+
+def load_speed_profiles(overrides):
+    """
+    Will return the default profiles updated with the given overrides.
+
+    - overrides: dictionary (e.g from the `~speed_profiles` ROS parameter)
+    from profile name to a dictionary with any of the keys
+    "velocity_scaling", "acceleration_scaling" and "approach_offset".
+    """
+    profiles = dict(DEFAULT_SPEED_PROFILES)
+
+    for name, values in overrides.items():
+        default = profiles.get(name, profiles[TRANSIT])
+        profiles[name] = SpeedProfile(
+                    name,
+                    values.get("velocity_scaling",
+                               default.velocity_scaling),
+                    values.get("acceleration_scaling",
+                               default.acceleration_scaling),
+                    values.get("approach_offset", default.approach_offset))
+
+    return profiles
+
+
+def retime_trajectory(trajectory, profile):
+    """
+    Will slow the planned trajectory down according to the profile.
+
+    The trajectory (a `RobotTrajectory`) is changed in place and returned.
+    """
+    scaling = profile.time_scaling()
+
+    if scaling >= 1.0:
+        return trajectory
+
+    for point in trajectory.joint_trajectory.points:
+        seconds = point.time_from_start.to_sec() / scaling
+        point.time_from_start = rospy.Duration.from_sec(seconds)
+        point.velocities = [v * scaling for v in point.velocities]
+        point.accelerations = [a * scaling ** 2 for a in point.accelerations]
+
+    return trajectory
@@ -0,0 +1,455 @@
+#!/usr/bin/env python
+"""
+Table Inventory.
+
+Keeps  track of the banknotes on the table, from which Baxter gives the change
+back. Each  banknote  is  in a slot with its own side of the table,
+denomination and pose. The available slots are kept in free lists, one per
+side and denomination, hence taking a banknote or putting it back takes
+constant time, whatever the number of banknotes on the table.
+
+When  the  operator restocks the table, the slots are made available again
+without calibrating their poses again. The  operator may restock while Baxter
+is giving the change (e.g from the `~restock` topic), hence the free lists are
+only changed while holding the lock of the inventory.
+
+The slots are laid out as grids (`TableLayout`), described by the pose of the
+first banknote, the spacing between the banknotes and the number of rows and
+columns, or  as any other pattern of offsets from the first banknote. The grids
+are  generated  from  a  few  anchor poses (the corners of the grid). The
+layouts are saved to disk, hence the cashier can start again without the
+operator calibrating the table.
+
+    Copyright (C)  2016/2017 The University of Leeds and Rafael Papallas
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# System-wide imports
+import json
+import os
+import tempfile
+import threading
+from os.path import expanduser
+from os.path import join
+
+# Other imports
+import numpy as np
+
+# Project specific imports
+from baxter_pose import BaxterPose
+
+# Version of the format of the layouts file
+LAYOUTS_SCHEMA_VERSION = 2
+
+# File of the saved layouts
+DEFAULT_LAYOUTS_PATH = join(expanduser("~"), "baxter_cashier_calibrator_files",
+                            "table_layouts.json")
+
+# Offset (in metres) between two consecutive banknotes of a row, by side of the
+# table.
+ROW_OFFSETS = {
+    "left": (0, -0.10, 0),
+    "right": (0.10, 0, 0),
+}
+
+
+class LayoutsFileError(Exception):
+    """
+    Layouts File Error.
+
+    Raised when the layouts file was saved by a newer version, which this
+    version can neither read nor overwrite without losing it.
+    """
+
+    def __init__(self, path, message):
+        """Default constructor accepting the file and the problem."""
+        self.path = path
+        self.message = message
+
+    def __str__(self):
+        """String representation of the exception."""
+        return "Unusable layouts file {}: {}".format(self.path, self.message)
+
+
+def _check_schema_version(document, path):
+    """Will raise `LayoutsFileError` if the document is of a newer version."""
+    version = document.get("schema_version", 0)
+
+    if version > LAYOUTS_SCHEMA_VERSION:
+        raise LayoutsFileError(path, "schema version {} is newer than {}"
+                               .format(version, LAYOUTS_SCHEMA_VERSION))
+
+
+def offset_pose(pose, x=0.0, y=0.0, z=0.0):
+    """Will return a new `BaxterPose` moved by the given offset."""
+    return BaxterPose(pose.transformation_x + x,
+                      pose.transformation_y + y,
+                      pose.transformation_z + z,
+                      pose.rotation_x,
+                      pose.rotation_y,
+                      pose.rotation_z,
+                      pose.rotation_w)
+
+
+def _pose_to_list(pose):
+    """Will return the seven values of a `BaxterPose`."""
+    return [pose.transformation_x, pose.transformation_y,
+            pose.transformation_z, pose.rotation_x, pose.rotation_y,
+            pose.rotation_z, pose.rotation_w]
+
+
+def _position(pose):
+    """Will return the position of a `BaxterPose` as an array."""
+    return np.array([pose.transformation_x,
+                     pose.transformation_y,
+                     pose.transformation_z], dtype=float)
+
+
+def _squared_distance(a, b):
+    """Will return the squared distance between two `BaxterPose`s."""
+    return (a.transformation_x - b.transformation_x) ** 2 + \
+        (a.transformation_y - b.transformation_y) ** 2 + \
+        (a.transformation_z - b.transformation_z) ** 2
+
+
+class TableLayout:
+    """
+    Banknotes of the same denomination on one side of the table.
+
+    The banknotes are either a grid, where the banknote of row `r` and column
+    `c` is at the first pose moved by `r * row_spacing + c * column_spacing`,
+    or an arbitrary pattern of (x, y, z) offsets from the first pose.
+    """
+
+    def __init__(self, side, denomination, first_pose, rows=1, columns=1,
+                 row_spacing=(0, 0, 0), column_spacing=None, pattern=None):
+        """
+        Default constructor.
+
+        - first_pose: the `BaxterPose` of the first banknote.
+        - row_spacing and column_spacing: (x, y, z) offsets, in metres,
+        between two rows and two columns. The columns are by default spaced
+        along the side (see ROW_OFFSETS).
+        - pattern: (x, y, z) offsets of the banknotes from the first pose,
+        replacing the grid. The first pose is part of the layout only if the
+        pattern has a (0, 0, 0) offset.
+        """
+        self.side = side
+        self.denomination = denomination
+        self.first_pose = first_pose
+        self.rows = rows
+        self.columns = columns
+        self.row_spacing = tuple(row_spacing)
+        self.column_spacing = tuple(column_spacing if column_spacing
+                                    is not None else ROW_OFFSETS[side])
+        self.pattern = None
+        if pattern is not None:
+            self.pattern = [tuple(offset) for offset in pattern]
+
+    @staticmethod
+    def from_anchors(side, denomination, first_pose, row_end_pose=None,
+                     column_end_pose=None, rows=1, columns=1):
+        """
+        Will create a grid from the poses of its corners.
+
+        - first_pose: the first banknote of the first row.
+        - row_end_pose: the last banknote of the first row, if more than one
+        column (otherwise the columns are spaced by ROW_OFFSETS).
+        - column_end_pose: the first banknote of the last row, if more than
+        one row.
+        """
+        first = _position(first_pose)
+
+        column_spacing = None
+        if row_end_pose is not None and columns > 1:
+            column_spacing = (_position(row_end_pose) - first) / (columns - 1)
+
+        row_spacing = (0, 0, 0)
+        if column_end_pose is not None and rows > 1:
+            row_spacing = (_position(column_end_pose) - first) / (rows - 1)
+
+        return TableLayout(side, denomination, first_pose, rows, columns,
+                           [float(v) for v in row_spacing],
+                           None if column_spacing is None else
+                           [float(v) for v in column_spacing])
+
+    def size(self):
+        """Will return the number of banknotes of the layout."""
+        if self.pattern is not None:
+            return len(self.pattern)
+
+        return self.rows * self.columns
+
+    def offsets(self):
+        """
+        Will return the offsets of the banknotes from the first pose.
+
+        The offsets are an (N, 3) array, row by row for a grid.
+        """
+        if self.pattern is not None:
+            return np.array(self.pattern, dtype=float).reshape(-1, 3)
+
+        rows, columns = np.mgrid[0:self.rows, 0:self.columns]
+
+        return rows.reshape(-1, 1) * np.array(self.row_spacing) + \
+            columns.reshape(-1, 1) * np.array(self.column_spacing)
+
+    def poses(self):
+        """Will return the poses of the banknotes (see `offsets`)."""
+        first = self.first_pose
+        positions = _position(first) + self.offsets()
+
+        return [BaxterPose(x, y, z, first.rotation_x, first.rotation_y,
+                           first.rotation_z, first.rotation_w)
+                for x, y, z in positions.tolist()]
+
+    def to_dict(self):
+        """Will return the layout as a dictionary (to be saved as JSON)."""
+        return {"side": self.side,
+                "denomination": self.denomination,
+                "first_pose": _pose_to_list(self.first_pose),
+                "rows": self.rows,
+                "columns": self.columns,
+                "row_spacing": list(self.row_spacing),
+                "column_spacing": list(self.column_spacing),
+                "pattern": None if self.pattern is None else
+                [list(offset) for offset in self.pattern]}
+
+    @staticmethod
+    def from_dict(values):
+        """Will create the layout from a dictionary (see `to_dict`)."""
+        return TableLayout(values["side"],
+                           values["denomination"],
+                           BaxterPose(*values["first_pose"]),
+                           values["rows"],
+                           values["columns"],
+                           values["row_spacing"],
+                           values["column_spacing"],
+                           values.get("pattern"))
+
+
+def save_layouts(layouts, path=DEFAULT_LAYOUTS_PATH):
+    """
+    Will save the layouts to the JSON file.
+
+    The layouts are written to a temporary file which then replaces the file,
+    hence a crash while saving never leaves a truncated file. Will raise
+    `LayoutsFileError` rather than replace a file of a newer version.
+    """
+    directory, file_name = os.path.split(path)
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    if os.path.exists(path):
+        with open(path) as f:
+            _check_schema_version(json.load(f), path)
+
+    descriptor, temporary_path = tempfile.mkstemp(dir=directory,
+                                                  prefix="." + file_name + ".")
+
+    try:
+        # mkstemp creates the file readable only by its owner
+        os.fchmod(descriptor, 0o644)
+
+        with os.fdopen(descriptor, "w") as f:
+            json.dump({"schema_version": LAYOUTS_SCHEMA_VERSION,
+                       "layouts": [layout.to_dict() for layout in layouts]},
+                      f, indent=2, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.rename(temporary_path, path)
+    finally:
+        # Left behind only if writing failed
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+
+def load_layouts(path=DEFAULT_LAYOUTS_PATH):
+    """
+    Will return the layouts saved in the JSON file.
+
+    Returns None if there is no such file. Will raise `LayoutsFileError` if
+    it was saved by a newer version.
+    """
+    if not os.path.exists(path):
+        return None
+
+    with open(path) as f:
+        document = json.load(f)
+
+    _check_schema_version(document, path)
+
+    return [TableLayout.from_dict(values) for values in document["layouts"]]
+
+
+class Slot:
+    """A place on the table holding a single banknote."""
+
+    def __init__(self, index, side, denomination, pose):
+        """Default constructor."""
+        self.index = index
+        self.side = side
+        self.denomination = denomination
+        self.pose = pose
+        self.is_available = False
+
+        # Unreachable slots (see `TableInventory.exclude`) are never used
+        self.is_reachable = True
+
+        # Position of the slot in its free list, if available
+        self._free_position = None
+
+
+class TableInventory:
+    """The banknotes on the table, by side and denomination."""
+
+    def __init__(self):
+        """Will create an empty inventory."""
+        self.slots = []
+        self.layouts = []
+
+        # (side, denomination) -> available slots
+        self._free = {}
+
+        # Taken to change the free lists, re-entrant since `restock` and
+        # `add_slot` release the slots.
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def from_layouts(layouts):
+        """Will create the inventory of the given layouts."""
+        inventory = TableInventory()
+
+        for layout in layouts:
+            inventory.add_layout(layout)
+
+        return inventory
+
+    def add_slot(self, side, denomination, pose):
+        """Will add an (available) slot and return it."""
+        with self._lock:
+            slot = Slot(len(self.slots), side, denomination, pose)
+            self.slots.append(slot)
+            self.release(slot)
+
+        return slot
+
+    def add_layout(self, layout):
+        """Will add the slots of the `TableLayout` and return them."""
+        self.layouts.append(layout)
+
+        return [self.add_slot(layout.side, layout.denomination, pose)
+                for pose in layout.poses()]
+
+    def _sides(self, side):
+        """Will return the given side, or both if None."""
+        return [side] if side is not None else sorted(ROW_OFFSETS.keys())
+
+    def _take(self, slot):
+        """
+        Will remove the slot from its free list (in constant time).
+
+        The caller holds the lock.
+        """
+        free = self._free[(slot.side, slot.denomination)]
+
+        # Swap with the last slot of the list and remove it
+        last = free[-1]
+        free[slot._free_position] = last
+        last._free_position = slot._free_position
+        free.pop()
+
+        slot._free_position = None
+        slot.is_available = False
+
+        return slot
+
+    def allocate_nearest(self, denomination, pose, side=None):
+        """
+        Will take the available banknote of the denomination nearest to pose.
+
+        - pose: a `BaxterPose`, e.g the pose of the arm or the customer's
+        hand.
+        """
+        nearest = None
+        nearest_distance = None
+
+        with self._lock:
+            for side in self._sides(side):
+                for slot in self._free.get((side, denomination), []):
+                    distance = _squared_distance(slot.pose, pose)
+                    if nearest is None or distance < nearest_distance:
+                        nearest, nearest_distance = slot, distance
+
+            return self._take(nearest) if nearest is not None else None
+
+    def exclude(self, slot):
+        """
+        Will never use the slot again, e.g because the arm can not reach it.
+
+        The slot is not made available by `release` or `restock`.
+        """
+        with self._lock:
+            if slot.is_available:
+                self._take(slot)
+
+            slot.is_reachable = False
+
+    def release(self, slot):
+        """Will make the slot available (e.g a banknote put back)."""
+        with self._lock:
+            if slot.is_available or not slot.is_reachable:
+                return
+
+            free = self._free.setdefault((slot.side, slot.denomination), [])
+            slot._free_position = len(free)
+            slot.is_available = True
+            free.append(slot)
+
+    def restock(self, side=None, denomination=None):
+        """
+        Will make the slots available, once the operator has refilled them.
+
+        - side and denomination: restock only these slots, None for all.
+
+        Will return the number of slots restocked.
+        """
+        restocked = 0
+
+        with self._lock:
+            for slot in self.slots:
+                if (side is None or slot.side == side) and \
+                        (denomination is None or
+                         slot.denomination == denomination) and \
+                        not slot.is_available and slot.is_reachable:
+                    self.release(slot)
+                    restocked += 1
+
+        return restocked
+
+    def available(self, denomination=None, side=None):
+        """Will return the number of available banknotes."""
+        with self._lock:
+            return sum([len(free) for (s, d), free in self._free.items()
+                        if (side is None or s == side) and
+                        (denomination is None or d == denomination)])
+
+    def denominations(self, side=None):
+        """Will return the available denominations, largest first."""
+        with self._lock:
+            return sorted(set([d for (s, d), free in self._free.items()
+                               if free and (side is None or s == side)]),
+                          reverse=True)
@@ -5,6 +5,10 @@ Banknote recogniser.
 This script acts as a service and is responsible to detect and recognise
 banknotes from the given camera.
 
+The banknotes are recognised from the images of the camera (see
+image_recogniser.py), from the AR markers stuck on them, or both, as set by
+the `~recognition` parameter ("image", "markers" or "both").
+
     Copyright (C)  2016/2017 The University of Leeds and Rafael Papallas
 
 This program is free software: you can redistribute it and/or modify
@@ -31,16 +35,42 @@ import tf
 # Project specific imports
 from baxter_cashier_manipulation.srv import RecogniseBanknoteResponse
 from baxter_cashier_manipulation.srv import RecogniseBanknote
+from image_recogniser import ImageRecogniser
+
+# The metrics and tracing libraries of the manipulation package
+from baxter_cashier_manipulation import metrics
+from baxter_cashier_manipulation import tracing
+
+# Camera used when the request does not give one
+DEFAULT_CAMERA_TOPIC = "/cameras/head_camera/image"
+
+# Frames are matched for up to this many seconds between two checks of the
+# AR markers.
+IMAGE_RECOGNITION_PERIOD = 1.0
 
 
 class BanknoteRecogniser:
     """Banknote recogniser class."""
 
-    def __init__(self):
-        """Default constructor."""
+    def __init__(self, recognition="both"):
+        """
+        Default constructor.
+
+        - recognition: "image", "markers" or "both".
+        """
         self._listener = tf.TransformListener()
         self._RATE = rospy.Rate(0.3)
 
+        self._use_markers = recognition in ["markers", "both"]
+
+        # The descriptors of the banknotes are loaded (or computed) once
+        self._image_recogniser = None
+        if recognition in ["image", "both"]:
+            self._image_recogniser = ImageRecogniser()
+
+            # Subscribed ahead, so the first request does not wait for it
+            self._image_recogniser.subscribe(DEFAULT_CAMERA_TOPIC)
+
     def try_to_detect(self, amount):
         """
         Will try to detect the given amount from the tf topic.
@@ -49,9 +79,11 @@ class BanknoteRecogniser:
         return None if the given amount was not detected.
         """
         try:
-            _ = self._listener.lookupTransform("base",
-                                               "ar_marker_{}".format(amount),
-                                               rospy.Time(0))
+            with tracing.span("lookup_transform", "tf", amount=amount):
+                _ = self._listener.lookupTransform(
+                                                "base",
+                                                "ar_marker_{}".format(amount),
+                                                rospy.Time(0))
 
             return amount
         except (tf.LookupException, tf.ConnectivityException,
@@ -62,19 +94,49 @@ class BanknoteRecogniser:
 
     def detect(self, request):
         """Will return the amount detected or -1 if nothing detected."""
+        started = time.time()
+        with tracing.span("recognise_banknote", "service"):
+            response = self._detect(request)
+
+        metrics.observe("recognition_time", time.time() - started)
+        if response.banknote_amount == -1:
+            metrics.increment("failed_recognitions")
+
+        return response
+
+    def _detect(self, request):
+        """See `detect`."""
         timeout_start = time.time()
         timeout = 5   # [seconds]
 
-        while time.time() < timeout_start + timeout:
-            # Try to detect either the 5 or the 1 banknote.
-            if self.try_to_detect(5) is not None:
-                print "Trying 5"
-                return RecogniseBanknoteResponse(5)
-            elif self.try_to_detect(1) is not None:
-                print "Trying 1"
-                return RecogniseBanknoteResponse(1)
+        camera_topic = request.camera_topic or DEFAULT_CAMERA_TOPIC
 
-            self._RATE.sleep()
+        while time.time() < timeout_start + timeout:
+            # Match the frames of the camera against the banknotes
+            if self._image_recogniser is not None:
+                remaining = timeout_start + timeout - time.time()
+                with tracing.span("match_frames", "image",
+                                  camera_topic=camera_topic):
+                    amount = self._image_recogniser.recognise(
+                                    camera_topic,
+                                    min(IMAGE_RECOGNITION_PERIOD, remaining))
+
+                if amount is not None:
+                    return RecogniseBanknoteResponse(amount)
+
+            if self._use_markers:
+                # Try to detect either the 5 or the 1 banknote.
+                if self.try_to_detect(5) is not None:
+                    rospy.logdebug("Detected the marker of a 5 banknote")
+                    return RecogniseBanknoteResponse(5)
+                elif self.try_to_detect(1) is not None:
+                    rospy.logdebug("Detected the marker of a 1 banknote")
+                    return RecogniseBanknoteResponse(1)
+
+            # The image recogniser waits for the frames of the camera
+            if self._image_recogniser is None:
+                with tracing.span("sleep", "clock"):
+                    self._RATE.sleep()
 
         # If time over and nothing returned, nothing detected and return -1
         return RecogniseBanknoteResponse(-1)
@@ -85,7 +147,10 @@ if __name__ == '__main__':
 
     # Create the service
     rospy.init_node("bank_note_recogniser", anonymous=True)
-    banknote_recogniser = BanknoteRecogniser()
+    tracing.set_process_name(rospy.get_name())
+    metrics.start_publishing(period=rospy.get_param("~metrics_period", 10.0))
+    banknote_recogniser = BanknoteRecogniser(
+                                rospy.get_param("~recognition", "both"))
 
     s = rospy.Service('recognise_banknote',
                       RecogniseBanknote,
@@ -20,6 +20,12 @@ manner:
     - Feet: left_foot, right_foot
     - Other: head, neck, torso
 
+The pose is returned with the stamp of the tf frame it was looked up from,
+the time the skeleton tracker observed it. The caller can ask for a pose newer
+than the last one it has received; if the tracker has not published one yet,
+the pose is returned at once with a zero stamp (not observed), rather than
+waiting for it.
+
     Copyright (C)  2016/2017 The University of Leeds and Rafael Papallas
 
 This program is free software: you can redistribute it and/or modify
@@ -47,6 +53,10 @@ import tf
 from baxter_cashier_manipulation.srv import GetUserPose
 from baxter_cashier_manipulation.srv import GetUserPoseResponse
 
+# The metrics and tracing libraries of the manipulation package
+from baxter_cashier_manipulation import metrics
+from baxter_cashier_manipulation import tracing
+
 
 class InvalidBodyPartException(Exception):
     """
@@ -102,7 +112,9 @@ class BodyTrackerListener:
         Bridge method that starts the Skeleton Tracker, starts the process of
         listening to the pose and kill the skeleton tracker.
 
-        Returns back the transformation and rotation of the pose requested.
+        Returns back the transformation and rotation of the pose requested,
+        and the time it was observed (zero if there is no such pose, or none
+        newer than `request.newer_than`).
         """
         # Throw an exception if body part not valid
         if not self._is_body_part_valid(request.body_part):
@@ -114,61 +126,65 @@ class BodyTrackerListener:
         print("Server received: {} and {}".format(request.user_number,
                                                   request.body_part))
 
-        tran, rot = self._listen(user_number=request.user_number,
-                                 body_part=request.body_part)
+        started = time.time()
+        with tracing.span("get_user_pose", "service",
+                          body_part=request.body_part):
+            tran, rot, stamp = self._listen(user_number=request.user_number,
+                                            body_part=request.body_part,
+                                            newer_than=request.newer_than)
 
-        return GetUserPoseResponse(tran, rot)
+        # Time taken to look the pose of the body part up
+        if not stamp.is_zero():
+            metrics.observe("pose_lookup_time", time.time() - started)
+        else:
+            metrics.increment("poses_not_observed")
 
-    def _listen(self, user_number, body_part):
+        return GetUserPoseResponse(tran, rot, stamp)
+
+    def _listen(self, user_number, body_part, newer_than=None):
         # Source is the node parent and target the child we are looking for.
         source = '/base'
 
         trans = [0, 0, 0]
         rotation = [0, 0, 0, 0]
 
-        number_of_consecutive_frames = 0
-        timeout_start = time.time()
-        timeout = 2   # [seconds]
+        # Time the pose was observed, zero if not observed
+        stamp = rospy.Time(0)
 
-        while True:
-            target = "cob_body_tracker/user_{}/{}".format(user_number, body_part)
-            if number_of_consecutive_frames == 1:
-                break
+        target = "cob_body_tracker/user_{}/{}".format(user_number, body_part)
 
-            try:
-                # Try to listen for the transformation and rotation of the node
+        # The latest frame of the tracker is used as it is, without sleeping
+        # to wait for a stable frame.
+        try:
+            # Try to listen for the transformation and rotation of the node,
+            # at the time of the latest frame of the tracker.
+            with tracing.span("lookup_transform", "tf", target=target):
+                stamp = self._listener.getLatestCommonTime(source, target)
                 (trans, _) = self._listener.lookupTransform(source,
                                                             target,
-                                                            rospy.Time(0))
-            except:
-                return trans, rotation
-
-            x, y, z = trans
-
-            if number_of_consecutive_frames == 0:
-                xs = map(lambda v: v + x, [0.10, -0.10])
-                ys = map(lambda v: v + y, [0.10, -0.10])
-                zs = map(lambda v: v + z, [0.10, -0.10])
-
-            if (x >= xs[1] and x <= xs[0]) and \
-                (y >= ys[1] and y <= ys[0]) and \
-                (z >= zs[1] and z <= zs[0]):
-                number_of_consecutive_frames += 1
-            else:
-                number_of_consecutive_frames = 0
+                                                            stamp)
+        except:
+            return trans, rotation, rospy.Time(0)
 
-            time.sleep(0.5)
+        # Rather than returning the same (stale) pose again, the pose is not
+        # observed until the tracker publishes a newer frame. The caller polls
+        # again on its next frame, hence there is no wait here.
+        if newer_than is not None and not newer_than.is_zero() and \
+                stamp <= newer_than:
+            return [0, 0, 0], rotation, rospy.Time(0)
 
         rotation = [0.559, -0.504, 0.480, -0.451]
 
         if body_part == "right_hand":
             rotation = [-0.513, 0.520, -0.499, 0.467]
 
-        return trans, rotation
+        return trans, rotation, stamp
 
 
 if __name__ == '__main__':
     rospy.init_node("body_tracker_listener", anonymous=True)
+    tracing.set_process_name(rospy.get_name())
+    metrics.start_publishing(period=rospy.get_param("~metrics_period", 10.0))
     tracker_listener = BodyTrackerListener()
 
     # Create the so called: "Service Node" of the service.
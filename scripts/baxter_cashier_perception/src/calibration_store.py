@@ -0,0 +1,208 @@
+#!/usr/bin/python
+"""
+Calibration Store.
+
+Stores  the camera calibrations as JSON documents, with  float  precision and
+the  metadata needed to  use them later: when they were made, which frames they
+relate, how (manual  or automatic) and  their residual error. Each document
+carries a schema version, so that older calibrations can still be read when
+the format changes.
+
+The  store  keeps  an index  of  its calibrations, hence the production  nodes
+can  load the latest (or a named) calibration at startup without listing the
+directory or asking the operator.
+
+    Copyright (C)  2016/2017 The University of Leeds and Rafael Papallas
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Python specific imports
+import json
+import os
+import tempfile
+import threading
+import time
+from os.path import expanduser
+from os.path import join
+
+# Version of the format of the calibration documents
+SCHEMA_VERSION = 1
+
+# Directory of the calibrations
+DEFAULT_DIRECTORY = join(expanduser("~"), "baxter_cashier_calibrator_files",
+                         "calibrations")
+
+INDEX_FILE_NAME = "index.json"
+
+
+class CalibrationStoreError(Exception):
+    """
+    Calibration Store Error.
+
+    Raised when a calibration does not exist or can not be read.
+    """
+
+    def __init__(self, message):
+        """Default constructor accepting the problem."""
+        self.message = message
+
+    def __str__(self):
+        """String representation of the exception."""
+        return self.message
+
+
+def _write_atomically(path, document):
+    """Will write the JSON document to a temporary file and rename it."""
+    directory, file_name = os.path.split(path)
+    descriptor, temporary_path = tempfile.mkstemp(dir=directory,
+                                                  prefix="." + file_name + ".")
+
+    try:
+        # mkstemp creates the file readable only by its owner
+        os.fchmod(descriptor, 0o644)
+
+        with os.fdopen(descriptor, "w") as f:
+            json.dump(document, f, indent=2, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+
+        # Atomic on POSIX
+        os.rename(temporary_path, path)
+    finally:
+        # Left behind only if writing failed
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+
+class CalibrationStore:
+    """Versioned and indexed store of camera calibrations."""
+
+    def __init__(self, directory=DEFAULT_DIRECTORY):
+        """Will use (and create if needed) the given directory."""
+        self.directory = directory
+        self._lock = threading.Lock()
+
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+    def _index_path(self):
+        """Will return the path of the index."""
+        return join(self.directory, INDEX_FILE_NAME)
+
+    def _read_index(self):
+        """
+        Will return the index: name -> summary of the calibration.
+
+        A missing index is an empty store.
+        """
+        if not os.path.exists(self._index_path()):
+            return {}
+
+        with open(self._index_path()) as f:
+            try:
+                return json.load(f).get("calibrations", {})
+            except ValueError:
+                raise CalibrationStoreError("Corrupted index {}".format(
+                                                        self._index_path()))
+
+    def save(self, name, translation, quaternion, parent_frame, child_frame,
+             residual=None, method="manual", **metadata):
+        """
+        Will store the calibration under the given name.
+
+        - translation: (x, y, z) in metres.
+        - quaternion: (x, y, z, w) rotation.
+        - parent_frame and child_frame: the frames of the transform.
+        - residual: RMS error in metres, if known (automatic calibration).
+        - method: how the calibration was made ("manual" or "automatic").
+        - metadata: anything else worth keeping (e.g number of observations).
+
+        Returns the stored document.
+        """
+        document = {
+            "schema_version": SCHEMA_VERSION,
+            "name": name,
+            "timestamp": time.time(),
+            "parent_frame": parent_frame,
+            "child_frame": child_frame,
+            "translation": [float(v) for v in translation],
+            "rotation": [float(v) for v in quaternion],
+            "residual": None if residual is None else float(residual),
+            "method": method,
+            "metadata": metadata,
+        }
+
+        file_name = "{}.json".format(name)
+
+        with self._lock:
+            _write_atomically(join(self.directory, file_name), document)
+
+            index = self._read_index()
+            index[name] = {"file": file_name,
+                           "timestamp": document["timestamp"],
+                           "residual": document["residual"],
+                           "method": method}
+
+            _write_atomically(self._index_path(),
+                              {"schema_version": SCHEMA_VERSION,
+                               "calibrations": index})
+
+        return document
+
+    def names(self):
+        """Will return the names of the calibrations, oldest first."""
+        index = self._read_index()
+
+        return sorted(index.keys(), key=lambda n: index[n]["timestamp"])
+
+    def latest_name(self):
+        """Will return the name of the latest calibration, or None."""
+        names = self.names()
+
+        return names[-1] if len(names) > 0 else None
+
+    def load(self, name=None):
+        """
+        Will return the named calibration, or the latest one.
+
+        Raises `CalibrationStoreError` if there is no such calibration or if
+        it has been stored with a newer version of the format.
+        """
+        index = self._read_index()
+
+        if name is None:
+            name = self.latest_name()
+            if name is None:
+                raise CalibrationStoreError("No calibrations in {}".format(
+                                                            self.directory))
+
+        if name not in index:
+            raise CalibrationStoreError("Unknown calibration '{}'".format(
+                                                                        name))
+
+        with open(join(self.directory, index[name]["file"])) as f:
+            try:
+                document = json.load(f)
+            except ValueError:
+                raise CalibrationStoreError("Corrupted calibration '{}'"
+                                            .format(name))
+
+        if document.get("schema_version", 0) > SCHEMA_VERSION:
+            raise CalibrationStoreError(
+                    "Calibration '{}' has schema version {}, only up to {} "
+                    "is supported".format(name, document["schema_version"],
+                                          SCHEMA_VERSION))
+
+        return document
@@ -8,6 +8,21 @@ is to align the camera view relative to Baxter's base.
 Since Baxter will be far away from the RGB-D camera, this script will allow the
 user through a User Interface to aligh the two.
 
+By default the transform is broadcasted at 100 Hz. With `--static` it is
+published as a latched static transform instead, sent again only when the
+sliders change, and with `--apply [NAME]` the latest (or the named)
+calibration is published as a static transform without any User Interface
+(for production runs).
+
+Calibrations are kept in a `CalibrationStore` (see calibration_store.py) with
+float precision and metadata. The slider values are also saved in the plain
+files of `BasicDatabase`, used to restore the sliders.
+
+With `--auto` the calibration is computed instead: the operator moves Baxter's
+arm, holding an AR marker in the gripper, in front of the camera and the
+transform is fitted to the positions of the marker in both frames (see
+rigid_transform.py).
+
     Copyright (C)  2016/2017 The University of Leeds and Rafael Papallas
 
 This program is free software: you can redistribute it and/or modify
@@ -26,7 +41,11 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 # Python specific imports
 import argparse
+import atexit
 import os
+import tempfile
+import threading
+import time
 from os.path import isfile
 from os.path import join
 from os.path import expanduser
@@ -34,11 +53,123 @@ from os.path import expanduser
 # ROS specific imports
 import rospy
 import tf
+import tf2_ros
+from geometry_msgs.msg import TransformStamped
+
+# Baxter specific imports
+import baxter_interface
 
 # Other imports
 import numpy as np
 import cv2
 
+# Project specific imports
+from calibration_store import CalibrationStore, CalibrationStoreError
+from rigid_transform import fit_rigid_transform_robust
+
+
+def slider_values_to_transform(xyz, rpy):
+    """
+    Will convert the slider values to the translation and the quaternion.
+
+    The sliders have 1 mm steps, offset by 6 m (to allow negative values), and
+    0.1 degree steps.
+    """
+    def apply_formula(value):
+        return value * np.pi / 1800
+
+    # Perform (1000 - 1) to x, y and z using list comprehension
+    translation = [v / 1000.0 - 6 for v in xyz]
+
+    # Using map function we get new values for r, p and y
+    # based on static formula computed by `apply_formula` function
+    roll, pitch, yaw = map(apply_formula, rpy)
+
+    # Using Euler method calculates the quaternion from roll, pitch and yaw
+    quaternion = tf.transformations.quaternion_from_euler(roll, pitch, yaw)
+
+    return translation, quaternion
+
+
+def transform_to_slider_values(translation, quaternion):
+    """
+    Will convert a translation and a quaternion to the slider values.
+
+    This is the inverse of `slider_values_to_transform`, rounded to the 1 mm
+    and 0.1 degree steps of the sliders.
+    """
+    xyz = [int(round((v + 6) * 1000)) for v in translation]
+
+    angles = tf.transformations.euler_from_quaternion(quaternion)
+    rpy = [int(round((a % (2 * np.pi)) * 1800 / np.pi)) for a in angles]
+
+    return xyz, rpy
+
+
+def static_transform(translation, quaternion, parent, child):
+    """Will create the `TransformStamped` of a static transform."""
+    transform = TransformStamped()
+    transform.header.stamp = rospy.Time.now()
+    transform.header.frame_id = parent
+    transform.child_frame_id = child
+
+    transform.transform.translation.x, transform.transform.translation.y, \
+        transform.transform.translation.z = translation
+
+    transform.transform.rotation.x, transform.transform.rotation.y, \
+        transform.transform.rotation.z, transform.transform.rotation.w = \
+        quaternion
+
+    return transform
+
+
+def apply_saved_calibration(name, base_topic, target_topic):
+    """
+    Will publish the saved calibration as a static transform.
+
+    This is the headless mode for production runs: no window and no questions
+    to the operator, the transform is published once (latched) and the node
+    keeps running to keep it available.
+
+    - name: the name of the calibration. If None, the `~calibration` ROS
+    parameter or else the latest calibration is used. Names not found in the
+    `CalibrationStore` are looked up in the files of `BasicDatabase`.
+    """
+    rospy.init_node('camera_calibrator_tf_broadcaster')
+
+    if name is None:
+        name = rospy.get_param("~calibration", None)
+
+    try:
+        calibration = CalibrationStore().load(name)
+
+        name = calibration["name"]
+        translation = calibration["translation"]
+        quaternion = calibration["rotation"]
+        parent_frame = calibration["parent_frame"]
+        child_frame = calibration["child_frame"]
+    except CalibrationStoreError as e:
+        if name is None or name not in (BasicDatabase().get_available_files()
+                                        or []):
+            rospy.logerr(str(e))
+            return
+
+        # Older calibration, only saved as slider values
+        xyz, rpy = BasicDatabase().load_values(name)
+        translation, quaternion = slider_values_to_transform(xyz, rpy)
+
+        # The sliders give the pose of `base_topic` in `target_topic`, as
+        # broadcasted by the `Calibrator`.
+        parent_frame = target_topic
+        child_frame = base_topic
+
+    broadcaster = tf2_ros.StaticTransformBroadcaster()
+    broadcaster.sendTransform(static_transform(translation, quaternion,
+                                               parent_frame, child_frame))
+
+    print("Published calibration {}.".format(name))
+    rospy.spin()
+
 
 class BasicDatabase:
     """Stores the values from the script to a file for later use."""
@@ -66,8 +197,10 @@ class BasicDatabase:
         files and not sub-directories. The usage of this function is to show
         to the user a possible number of fils to choose from to load values.
         """
+        # Hidden files are temporary files of interrupted saves
         files = [f for f in os.listdir(self.file_save_directory)
-                 if isfile(join(self.file_save_directory, f))]
+                 if isfile(join(self.file_save_directory, f)) and
+                 not f.startswith(".")]
 
         return files if len(files) > 0 else None
 
@@ -94,30 +227,316 @@ class BasicDatabase:
         return xyz, rpy
 
     def save_values_to_file(self, file_name, xyz, rpy):
-        """Will store the xyz and rpy values to file."""
+        """
+        Will store the xyz and rpy values to file.
+
+        The values are written to a temporary file which then replaces the
+        file, hence a crash while writing never leaves a truncated file.
+        """
         full_file_path = join(self.file_save_directory, file_name)
-        store_values_file = open(full_file_path, "w")
+        descriptor, temporary_path = tempfile.mkstemp(
+                                            dir=self.file_save_directory,
+                                            prefix="." + file_name + ".")
+
+        try:
+            # mkstemp creates the file readable only by its owner
+            os.fchmod(descriptor, 0o644)
+
+            with os.fdopen(descriptor, "w") as store_values_file:
+                x, y, z = xyz
+                store_values_file.write(str(x) + "\n")
+                store_values_file.write(str(y) + "\n")
+                store_values_file.write(str(z) + "\n")
+
+                r, p, y = rpy
+                store_values_file.write(str(r) + "\n")
+                store_values_file.write(str(p) + "\n")
+                store_values_file.write(str(y) + "\n")
+
+                store_values_file.flush()
+                os.fsync(store_values_file.fileno())
+
+            # Atomic on POSIX
+            os.rename(temporary_path, full_file_path)
+        finally:
+            # Left behind only if writing failed
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+
+
+class WriteBehindDatabase:
+    """
+    Coalesces the saves to a `BasicDatabase`.
+
+    Saving on every slider event blocks the User Interface, hence the values
+    are only kept in memory and written once the sliders have been still for
+    `delay` seconds, or on exit.
+    """
+
+    def __init__(self, database, delay=0.5):
+        """Will wrap the given database."""
+        self.database = database
+        self.delay = delay
+
+        # Taken briefly to update the pending values, never while writing,
+        # hence the User Interface is never blocked on the disk.
+        self._lock = threading.Lock()
+
+        # Taken while writing, one flush at a time, so older values never
+        # replace newer ones written meanwhile.
+        self._write_lock = threading.Lock()
+
+        # Pending values of each file, by file name, and the ones being
+        # written by a flush.
+        self._pending = {}
+        self._writing = {}
+        self._timer = None
+
+        # Do not lose the last values on exit
+        atexit.register(self.flush)
 
-        x, y, z = xyz
-        store_values_file.write(str(x) + "\n")
-        store_values_file.write(str(y) + "\n")
-        store_values_file.write(str(z) + "\n")
+    def get_available_files(self):
+        """See `BasicDatabase.get_available_files`."""
+        return self.database.get_available_files()
 
-        r, p, y = rpy
-        store_values_file.write(str(r) + "\n")
-        store_values_file.write(str(p) + "\n")
-        store_values_file.write(str(y) + "\n")
+    def load_values(self, file_name):
+        """Will return the pending values of the file, or load them."""
+        with self._lock:
+            for values in (self._pending, self._writing):
+                if file_name in values:
+                    return values[file_name]
 
-        store_values_file.close()
+        return self.database.load_values(file_name)
+
+    def save_values_to_file(self, file_name, xyz, rpy):
+        """Will schedule the values to be stored, replacing pending ones."""
+        with self._lock:
+            self._pending[file_name] = (list(xyz), list(rpy))
+
+            # Restart the debounce
+            if self._timer is not None:
+                self._timer.cancel()
+
+            self._timer = threading.Timer(self.delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """Will store the pending values, if any."""
+        with self._write_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+
+                self._writing = self._pending
+                self._pending = {}
+
+            try:
+                for file_name, (xyz, rpy) in self._writing.items():
+                    self.database.save_values_to_file(file_name, xyz, rpy)
+            finally:
+                with self._lock:
+                    self._writing = {}
+
+
+class AutomaticCalibrator:
+    """
+    Computes the calibration from observations of an AR marker.
+
+    The marker is held in Baxter's gripper: its position in the `base` frame
+    is known from the end-point of the arm and its position in the camera
+    frame is detected by ar_track_alvar. While the operator moves the arm
+    around, pairs of positions are collected and the transform between the
+    two frames is fitted to them.
+    """
+
+    def __init__(self, base_topic, target_topic, camera_frame=None,
+                 marker_frame="ar_marker_0", side="right", samples=20,
+                 marker_offset=(0, 0, 0), min_distance=0.03, max_age=0.1):
+        """
+        Default constructor.
+
+        - base_topic and target_topic: the frames of the calibration (e.g
+        "camera_link" and "base").
+        - camera_frame: the frame the marker is detected in, if it is not
+        `base_topic` (e.g the optical frame of the camera).
+        - marker_frame: the frame of the marker published by ar_track_alvar.
+        - side: the arm holding the marker.
+        - samples: number of observations to collect.
+        - marker_offset: (x, y, z) position of the marker in the frame of the
+        end-point of the arm.
+        - min_distance: the arm needs to move at least this many metres
+        between two observations.
+        - max_age: maximum age, in seconds, of a marker detection.
+        """
+        rospy.init_node('camera_calibrator_tf_broadcaster')
+
+        self.base_topic = base_topic
+        self.target_topic = target_topic
+        self.camera_frame = camera_frame if camera_frame else base_topic
+        self.marker_frame = marker_frame
+        self.samples = samples
+        self.marker_offset = np.array(marker_offset, dtype=float)
+        self.min_distance = min_distance
+        self.max_age = max_age
+
+        self._limb = baxter_interface.Limb(side)
+        self._listener = tf.TransformListener()
+        self.broadcaster = tf2_ros.StaticTransformBroadcaster()
+
+        # Paired observations of the marker
+        self.base_points = []
+        self.camera_points = []
+
+    def _marker_in_camera(self):
+        """Will return the recent position of the marker, or None."""
+        try:
+            stamp = self._listener.getLatestCommonTime(self.camera_frame,
+                                                       self.marker_frame)
+            if (rospy.Time.now() - stamp).to_sec() > self.max_age:
+                return None
+
+            position, _ = self._listener.lookupTransform(self.camera_frame,
+                                                         self.marker_frame,
+                                                         stamp)
+        except (tf.Exception, tf.LookupException, tf.ConnectivityException,
+                tf.ExtrapolationException):
+            return None
+
+        return np.array(position, dtype=float)
+
+    def _marker_in_base(self):
+        """Will return the position of the marker held in the gripper."""
+        pose = self._limb.endpoint_pose()
+        position = np.array([pose["position"].x,
+                             pose["position"].y,
+                             pose["position"].z])
+
+        orientation = pose["orientation"]
+        rotation = tf.transformations.quaternion_matrix([orientation.x,
+                                                         orientation.y,
+                                                         orientation.z,
+                                                         orientation.w])
+
+        return position + rotation[:3, :3].dot(self.marker_offset)
+
+    def collect(self):
+        """Will collect the observations while the operator moves the arm."""
+        print("Move the arm around, with the marker in view of the camera...")
+
+        rate = rospy.Rate(10)
+        while len(self.base_points) < self.samples and \
+                not rospy.is_shutdown():
+            camera_point = self._marker_in_camera()
+
+            if camera_point is not None:
+                base_point = self._marker_in_base()
+
+                # Observations from the same place add nothing to the fit
+                if len(self.base_points) == 0 or \
+                        np.linalg.norm(base_point - self.base_points[-1]) >= \
+                        self.min_distance:
+                    self.base_points.append(base_point)
+                    self.camera_points.append(camera_point)
+                    print("Observation {}/{}".format(len(self.base_points),
+                                                     self.samples))
+
+            rate.sleep()
+
+    def solve(self):
+        """
+        Will fit the calibration to the observations.
+
+        Returns `(translation, quaternion, rms, inliers)` where translation
+        and quaternion are the pose of `base_topic` in `target_topic`, the
+        same direction as broadcasted by the `Calibrator`.
+        """
+        rotation, translation, inliers, rms = fit_rigid_transform_robust(
+                                                        self.base_points,
+                                                        self.camera_points)
+
+        # Pose of the `base` in the camera frame
+        matrix = np.eye(4)
+        matrix[:3, :3] = rotation
+        matrix[:3, 3] = translation
+
+        # Express it in the calibrated frame if the marker is detected in
+        # another frame of the camera.
+        if self.camera_frame != self.base_topic:
+            self._listener.waitForTransform(self.base_topic,
+                                            self.camera_frame,
+                                            rospy.Time(0),
+                                            rospy.Duration(5))
+            trans, rot = self._listener.lookupTransform(self.base_topic,
+                                                        self.camera_frame,
+                                                        rospy.Time(0))
+            camera = tf.transformations.quaternion_matrix(rot)
+            camera[:3, 3] = trans
+            matrix = camera.dot(matrix)
+
+        # Pose of the camera in the `base` frame
+        matrix = np.linalg.inv(matrix)
+
+        quaternion = tf.transformations.quaternion_from_matrix(matrix)
+
+        return list(matrix[:3, 3]), list(quaternion), rms, inliers
+
+    def calibrate(self, name=None):
+        """
+        Will collect the observations, fit, save and publish the calibration.
+
+        - name: the name of the calibration in the `CalibrationStore`, by
+        default "auto_" followed by the date and time. The calibration is
+        also saved to this file of the `BasicDatabase`, to be loaded by the
+        slider calibrator.
+        """
+        self.collect()
+
+        if rospy.is_shutdown():
+            return
+
+        translation, quaternion, rms, inliers = self.solve()
+
+        print("Residual error: {:.1f} mm RMS, using {}/{} observations."
+              .format(rms * 1000, inliers.sum(), len(inliers)))
+
+        self.broadcaster.sendTransform(static_transform(translation,
+                                                        quaternion,
+                                                        self.target_topic,
+                                                        self.base_topic))
+
+        if name is None:
+            name = time.strftime("auto_%Y%m%d_%H%M%S")
+
+        CalibrationStore().save(name, translation, quaternion,
+                                self.target_topic, self.base_topic,
+                                residual=rms,
+                                method="automatic",
+                                observations=len(inliers),
+                                inliers=int(inliers.sum()),
+                                marker_frame=self.marker_frame,
+                                camera_frame=self.camera_frame)
+
+        xyz, rpy = transform_to_slider_values(translation, quaternion)
+        BasicDatabase().save_values_to_file(name, xyz, rpy)
+
+        print("Saved calibration {}.".format(name))
+
+        rospy.spin()
 
 
 class Calibrator:
     """Calibrator aligns two camera's POV to a single one."""
 
-    def __init__(self, base_topic, target_topic, load_from_file=False):
+    def __init__(self, base_topic, target_topic, load_from_file=False,
+                 static=False):
         """
         Class constructor that do some important initialisation.
 
+        If `static` is True, the transform is published as a static transform
+        only when it changes, rather than broadcasted continuously.
+
         - Creates the required rospy configuration
         - Creates the Database instance to load or store values for this script
         - Set the class' values to default or loads from file.
@@ -131,11 +550,23 @@ class Calibrator:
         # Flag indicating if the script will load values from file or not.
         self.load_from_file = load_from_file
 
-        # Basic-flat database to store the values of the script.
-        self.database = BasicDatabase()
+        # Basic-flat database to store the values of the script. The slider
+        # values are saved in the background, coalescing the updates.
+        self.database = WriteBehindDatabase(BasicDatabase())
+        rospy.on_shutdown(self.database.flush)
+
+        # The final calibration is stored, with float precision, on exit
+        self.store = CalibrationStore()
 
         # The class' brodcasters
-        self.broadcaster = tf.TransformBroadcaster()
+        self.static = static
+        if self.static:
+            self.broadcaster = tf2_ros.StaticTransformBroadcaster()
+        else:
+            self.broadcaster = tf.TransformBroadcaster()
+
+        # The (translation, quaternion) last published in static mode
+        self._published = None
 
         # Default values
         self.quaternion = [0, 0, 0, 0]
@@ -171,12 +602,35 @@ class Calibrator:
             message = "Enter a new file name to save configuration: "
             self.file_name = raw_input(message)
 
+        # Only registered once the name of the calibration is known
+        rospy.on_shutdown(self._save_to_store)
+
         # OpenCV for window
         self.cv2 = cv2
 
         # Initialise the trackbars (sliders) for the CV window
         self._create_trackbars_for_window()
 
+    def _save_to_store(self):
+        """
+        Will save the current calibration to the `CalibrationStore`.
+
+        Nothing is saved until the values are calculated (i.e a slider has
+        been moved or the values have been loaded from file).
+        """
+        if not any(self.quaternion):
+            return
+
+        # The frames as broadcasted (see `calibrate`)
+        self.store.save(self.file_name,
+                        self.xyz_transformed,
+                        self.quaternion,
+                        self.target_topic,
+                        self.base_topic,
+                        method="manual",
+                        slider_xyz=list(self.xyz),
+                        slider_rpy=list(self.rpy))
+
     def _get_file_name_from_user(self):
         """
         Will ask the user for file to load.
@@ -230,20 +684,8 @@ class Calibrator:
         When xyz and rpy values are given from the user, some formulas needs to
         be applied to get the xyz corrected and the quaternion value.
         """
-        def apply_formula(value):
-            return value * np.pi / 1800
-
-        # Perform (1000 - 1) to x, y and z using list comprehension
-        self.xyz_transformed = [v / 1000.0 - 6 for v in self.xyz]
-
-        # Using map function we get new values for r, p and y
-        # based on static formula computed by `apply_formula` function
-        roll, pitch, yaw = map(apply_formula, self.rpy)
-
-        # Using Euler method calculates the quaternion from roll, pitch and yaw
-        self.quaternion = tf.transformations.quaternion_from_euler(roll,
-                                                                   pitch,
-                                                                   yaw)
+        self.xyz_transformed, self.quaternion = slider_values_to_transform(
+                                                            self.xyz, self.rpy)
 
     def _callback(self, _):
         """
@@ -259,7 +701,7 @@ class Calibrator:
         # Calculate the new values based on the new configuration
         self.calculate_values()
 
-        # Auto-save new values to file.
+        # Auto-save new values to file (in the background).
         self.database.save_values_to_file(self.file_name, self.xyz, self.rpy)
 
     def _extract_xyz_from_trackbars(self):
@@ -285,33 +727,86 @@ class Calibrator:
         while not rospy.is_shutdown():
             _ = self.cv2.waitKey(1) & 0xFF
 
-            self.broadcaster.sendTransform(tuple(self.xyz_transformed),
-                                           tuple(self.quaternion),
-                                           rospy.Time.now(),
-                                           self.base_topic,
-                                           self.target_topic)
+            if self.static:
+                self._publish_static_if_changed()
+            else:
+                self.broadcaster.sendTransform(tuple(self.xyz_transformed),
+                                               tuple(self.quaternion),
+                                               rospy.Time.now(),
+                                               self.base_topic,
+                                               self.target_topic)
 
             self.rate.sleep()
 
+    def _publish_static_if_changed(self):
+        """Will publish the static transform if the values have changed."""
+        value = (tuple(self.xyz_transformed), tuple(self.quaternion))
+
+        if value == self._published:
+            return
+
+        # Same direction as `tf.TransformBroadcaster.sendTransform`, which
+        # takes the child frame before the parent frame.
+        self.broadcaster.sendTransform(static_transform(value[0],
+                                                        value[1],
+                                                        self.target_topic,
+                                                        self.base_topic))
+        self._published = value
+
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument("-l", action="store_true",
                         help="Load values from file")
-
-    args = parser.parse_args()
+    parser.add_argument("-s", "--static", action="store_true",
+                        help="Publish a static transform, only on changes")
+    parser.add_argument("-a", "--apply", metavar="NAME", nargs="?",
+                        const="",
+                        help="Publish the named (by default the latest) "
+                             "calibration, without the User Interface")
+    parser.add_argument("--auto", action="store_true",
+                        help="Compute the calibration from an AR marker "
+                             "held in the gripper")
+    parser.add_argument("--side", default="right",
+                        help="The arm holding the marker (with --auto)")
+    parser.add_argument("--marker", default="ar_marker_0",
+                        help="The frame of the marker (with --auto)")
+    parser.add_argument("--camera-frame", default=None,
+                        help="The frame the marker is detected in "
+                             "(with --auto)")
+    parser.add_argument("--samples", type=int, default=20,
+                        help="Number of observations (with --auto)")
+    parser.add_argument("--save", metavar="NAME", default=None,
+                        help="Name of the computed calibration (with --auto)")
+
+    args = parser.parse_args(rospy.myargv()[1:])
 
     # Topics to be used to publish the tf.
     base_topic = "camera_link"
     target_topic = "base"
 
-    # Load values from file
-    if args.l:  # l for load
-        calibrator = Calibrator(base_topic=base_topic,
-                                target_topic=target_topic,
-                                load_from_file=True)
+    if args.apply is not None:
+        # Headless mode, publish the saved values
+        apply_saved_calibration(args.apply or None, base_topic, target_topic)
+    elif args.auto:
+        # Automatic mode, fit the calibration to observations of a marker
+        calibrator = AutomaticCalibrator(base_topic=base_topic,
+                                         target_topic=target_topic,
+                                         camera_frame=args.camera_frame,
+                                         marker_frame=args.marker,
+                                         side=args.side,
+                                         samples=args.samples)
+        calibrator.calibrate(args.save)
     else:
-        calibrator = Calibrator(base_topic=base_topic,
-                                target_topic=target_topic)
-
-    calibrator.calibrate()
+        # Load values from file
+        if args.l:  # l for load
+            calibrator = Calibrator(base_topic=base_topic,
+                                    target_topic=target_topic,
+                                    load_from_file=True,
+                                    static=args.static)
+        else:
+            calibrator = Calibrator(base_topic=base_topic,
+                                    target_topic=target_topic,
+                                    static=args.static)
+
+        calibrator.calibrate()
@@ -0,0 +1,341 @@
+#!/usr/bin/env python
+"""
+Image Recogniser.
+
+Recognises  banknotes  from  the  images  of  a camera (e.g Baxter's head
+camera), without  AR  markers. The  banknotes are  matched against  ORB feature
+descriptors  computed  from the images of the banknotes (documents/Banknotes).
+
+The  descriptors of the templates are computed once and cached on disk; the
+cache  is computed again when the templates change. The  descriptors  of all
+the templates are stacked into a single matrix, hence the descriptors of a
+frame are matched against every template at once, and the matches vote for
+the denomination of their template. The winning template is then verified
+with a homography, so a few random matches never recognise a banknote.
+
+    Copyright (C)  2016/2017 The University of Leeds and Rafael Papallas
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Python specific imports
+import os
+import tempfile
+import threading
+import time
+from os.path import basename, dirname, abspath, expanduser, join
+
+# Other imports
+import cv2
+import numpy as np
+
+# Images of the banknotes, by denomination
+DEFAULT_TEMPLATES_DIRECTORY = join(dirname(abspath(__file__)), "..", "..",
+                                   "..", "documents", "Banknotes",
+                                   "Banknotes (PNG)")
+TEMPLATE_FILES = {1: "one_bill.png", 5: "five_bill.png"}
+
+# Cache of the descriptors of the templates
+DEFAULT_CACHE_PATH = join(expanduser("~"), "baxter_cashier_calibrator_files",
+                          "banknote_descriptors.npz")
+
+# Number of features extracted from an image
+ORB_FEATURES = 500
+
+# Frames are resized to this width (in pixels) before extracting features
+FRAME_WIDTH = 640
+
+# A match is kept if its distance is less than this ratio of the distance of
+# the second best match (Lowe's ratio test).
+RATIO = 0.75
+
+# Minimum number of matches agreeing with the homography to recognise a
+# banknote.
+MIN_INLIERS = 12
+
+
+def _create_orb():
+    """Will create the ORB extractor (OpenCV 2 or 3)."""
+    if hasattr(cv2, "ORB_create"):
+        return cv2.ORB_create(nfeatures=ORB_FEATURES)
+
+    return cv2.ORB(nfeatures=ORB_FEATURES)
+
+
+def _resize(image, width=FRAME_WIDTH):
+    """Will resize the (grayscale) image to the width, if wider."""
+    if image.shape[1] <= width:
+        return image
+
+    height = int(round(image.shape[0] * width / float(image.shape[1])))
+
+    return cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+
+
+def _template_signature(directory):
+    """
+    Will return the signature of the templates (names, sizes and times).
+
+    The cache is valid only for the templates it was computed from.
+    """
+    signature = []
+    for denomination in sorted(TEMPLATE_FILES):
+        path = join(directory, TEMPLATE_FILES[denomination])
+        status = os.stat(path)
+        signature.append("{}:{}:{}:{}".format(denomination,
+                                              TEMPLATE_FILES[denomination],
+                                              status.st_size,
+                                              int(status.st_mtime)))
+
+    signature.append("orb:{}:{}".format(ORB_FEATURES, FRAME_WIDTH))
+
+    return "|".join(signature)
+
+
+class TemplateDescriptors:
+    """The ORB features of the banknote templates, stacked together."""
+
+    def __init__(self, points, descriptors, labels):
+        """
+        Default constructor.
+
+        - points: (N, 2) positions of the features in their template.
+        - descriptors: (N, 32) ORB descriptors.
+        - labels: (N,) denomination of the template of each feature.
+        """
+        self.points = points
+        self.descriptors = descriptors
+        self.labels = labels
+
+    @staticmethod
+    def compute(directory=DEFAULT_TEMPLATES_DIRECTORY):
+        """Will extract the features of the templates in the directory."""
+        orb = _create_orb()
+        points, descriptors, labels = [], [], []
+
+        for denomination in sorted(TEMPLATE_FILES):
+            path = join(directory, TEMPLATE_FILES[denomination])
+            # Read as grayscale
+            image = cv2.imread(path, 0)
+            if image is None:
+                raise IOError("Unable to read the template {}".format(path))
+
+            keypoints, features = orb.detectAndCompute(_resize(image), None)
+            if features is None:
+                continue
+
+            points.append(np.array([k.pt for k in keypoints],
+                                   dtype=np.float32))
+            descriptors.append(features)
+            labels.append(np.full(len(keypoints), denomination,
+                                  dtype=np.int32))
+
+        return TemplateDescriptors(np.vstack(points),
+                                   np.vstack(descriptors),
+                                   np.concatenate(labels))
+
+    @staticmethod
+    def load(directory=DEFAULT_TEMPLATES_DIRECTORY,
+             cache_path=DEFAULT_CACHE_PATH):
+        """
+        Will load the descriptors from the cache, or compute and cache them.
+
+        The cache is computed again if the templates have changed.
+        """
+        signature = _template_signature(directory)
+
+        if os.path.exists(cache_path):
+            try:
+                cache = np.load(cache_path)
+                try:
+                    if str(cache["signature"]) == signature:
+                        return TemplateDescriptors(cache["points"],
+                                                   cache["descriptors"],
+                                                   cache["labels"])
+                finally:
+                    cache.close()
+            except (IOError, KeyError, ValueError):
+                # Unreadable cache, computed again
+                pass
+
+        templates = TemplateDescriptors.compute(directory)
+
+        cache_directory = dirname(cache_path)
+        if not os.path.exists(cache_directory):
+            os.makedirs(cache_directory)
+
+        # Written to a temporary file which then replaces the cache, so two
+        # nodes starting together never read a truncated cache.
+        prefix = "." + basename(cache_path) + "."
+        descriptor, temporary_path = tempfile.mkstemp(dir=cache_directory,
+                                                      prefix=prefix)
+
+        try:
+            # mkstemp creates the file readable only by its owner
+            os.fchmod(descriptor, 0o644)
+
+            with os.fdopen(descriptor, "wb") as f:
+                np.savez(f,
+                         signature=np.array(signature),
+                         points=templates.points,
+                         descriptors=templates.descriptors,
+                         labels=templates.labels)
+
+            # Atomic on POSIX
+            os.rename(temporary_path, cache_path)
+        finally:
+            # Left behind only if writing failed
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+
+        return templates
+
+
+class ImageRecogniser:
+    """Recognises the banknotes shown to a camera."""
+
+    def __init__(self, templates=None):
+        """
+        Default constructor.
+
+        - templates: the `TemplateDescriptors`, loaded from the cache (or
+        computed) by default.
+        """
+        self.templates = templates or TemplateDescriptors.load()
+        self._orb = _create_orb()
+        self._matcher = cv2.BFMatcher(cv2.NORM_HAMMING)
+
+        # Latest frame of each camera topic subscribed to: (time, image)
+        self._frames = {}
+        self._subscribers = {}
+        self._frame_received = threading.Condition()
+        self._bridge = None
+
+    def subscribe(self, camera_topic):
+        """Will subscribe to the camera topic, the first time it is used."""
+        if camera_topic in self._subscribers:
+            return
+
+        # Imported here so the recogniser can be used without ROS (e.g on
+        # images read from files).
+        import cv_bridge
+        import rospy
+        from sensor_msgs.msg import Image
+
+        self._bridge = cv_bridge.CvBridge()
+
+        def receive(message):
+            image = self._bridge.imgmsg_to_cv2(message, "mono8")
+            with self._frame_received:
+                self._frames[camera_topic] = (time.time(), image)
+                self._frame_received.notify_all()
+
+        # Only the latest frame is of interest
+        self._subscribers[camera_topic] = rospy.Subscriber(camera_topic,
+                                                           Image,
+                                                           receive,
+                                                           queue_size=1,
+                                                           buff_size=2 ** 24)
+
+    def _wait_for_frame(self, camera_topic, newer_than, timeout):
+        """Will return a frame received after the given time, or None."""
+        deadline = time.time() + timeout
+
+        with self._frame_received:
+            while True:
+                received, image = self._frames.get(camera_topic, (0, None))
+                if received > newer_than:
+                    return received, image
+
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+
+                self._frame_received.wait(remaining)
+
+    def recognise(self, camera_topic, timeout=5.0):
+        """
+        Will recognise the banknote shown to the camera.
+
+        Frames are matched as they are received, until a banknote is
+        recognised or the timeout. Will return the denomination or None.
+        """
+        self.subscribe(camera_topic)
+
+        deadline = time.time() + timeout
+        last = time.time()
+
+        while time.time() < deadline:
+            frame = self._wait_for_frame(camera_topic, last,
+                                         deadline - time.time())
+            if frame is None:
+                break
+
+            last, image = frame
+            denomination = self.match(image)
+            if denomination is not None:
+                return denomination
+
+        return None
+
+    def match(self, image):
+        """
+        Will return the denomination of the banknote in the image, or None.
+
+        - image: grayscale image (e.g a camera frame).
+        """
+        keypoints, descriptors = self._orb.detectAndCompute(_resize(image),
+                                                            None)
+        if descriptors is None or len(keypoints) < MIN_INLIERS:
+            return None
+
+        # The two best matches of each feature of the frame, among all the
+        # features of all the templates.
+        matches = [pair for pair in self._matcher.knnMatch(
+                                        descriptors,
+                                        self.templates.descriptors,
+                                        k=2)
+                   if len(pair) == 2]
+        if len(matches) == 0:
+            return None
+
+        distances = np.array([[best.distance, second.distance]
+                              for best, second in matches])
+        indices = np.array([[best.queryIdx, best.trainIdx]
+                            for best, _ in matches])
+
+        good = distances[:, 0] < RATIO * distances[:, 1]
+        if np.count_nonzero(good) < MIN_INLIERS:
+            return None
+
+        frame_indices, template_indices = indices[good].T
+
+        # Every good match votes for the denomination of its template
+        labels = self.templates.labels[template_indices]
+        denomination = int(np.argmax(np.bincount(labels)))
+
+        # The matches of the winner must agree on the pose of the banknote
+        winner = labels == denomination
+        if np.count_nonzero(winner) < MIN_INLIERS:
+            return None
+
+        source = self.templates.points[template_indices[winner]]
+        target = np.array([keypoints[i].pt for i in frame_indices[winner]],
+                          dtype=np.float32)
+
+        _, mask = cv2.findHomography(source, target, cv2.RANSAC, 5.0)
+        if mask is None or int(mask.sum()) < MIN_INLIERS:
+            return None
+
+        return denomination
@@ -0,0 +1,118 @@
+#!/usr/bin/python
+"""
+Rigid Transform Fit.
+
+Least-squares  fit  of the  rigid  transform  (rotation and translation)
+between two sets of paired 3D points, using the SVD method of Kabsch.
+
+This  is used by the automatic camera calibration: the same AR marker is
+observed in Baxter's `base` frame (through the gripper holding it) and in the
+camera frame, and  the transform between the two frames is the one that best
+maps the first set of points to the second one. Observations with a large
+error (e.g a marker detection that jumped) are rejected and the transform is
+fitted again without them.
+
+    Copyright (C)  2016/2017 The University of Leeds and Rafael Papallas
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# Other imports
+import numpy as np
+
+
+def fit_rigid_transform(source, target):
+    """
+    Will return the rotation and translation best mapping source to target.
+
+    - source and target: (N, 3) arrays of paired points, N >= 3 and not all
+    on a line.
+
+    Returns the 3x3 rotation `R` and the translation `t` minimising the sum
+    of `|R * source_i + t - target_i|^2`.
+    """
+    source = np.asarray(source, dtype=float).reshape(-1, 3)
+    target = np.asarray(target, dtype=float).reshape(-1, 3)
+
+    source_centroid = source.mean(axis=0)
+    target_centroid = target.mean(axis=0)
+
+    # Cross-covariance of the centred points
+    covariance = (source - source_centroid).T.dot(target - target_centroid)
+
+    u, _, vt = np.linalg.svd(covariance)
+
+    # Correct a reflection into a proper rotation
+    correction = np.eye(3)
+    correction[2, 2] = np.sign(np.linalg.det(vt.T.dot(u.T)))
+
+    rotation = vt.T.dot(correction).dot(u.T)
+    translation = target_centroid - rotation.dot(source_centroid)
+
+    return rotation, translation
+
+
+def residuals(rotation, translation, source, target):
+    """Will return the error (distance) of each transformed source point."""
+    source = np.asarray(source, dtype=float).reshape(-1, 3)
+    target = np.asarray(target, dtype=float).reshape(-1, 3)
+
+    transformed = source.dot(rotation.T) + translation
+
+    return np.sqrt(((transformed - target) ** 2).sum(axis=1))
+
+
+def fit_rigid_transform_robust(source, target, threshold=0.01,
+                               iterations=5, minimum_points=4):
+    """
+    Will fit the rigid transform, rejecting the outliers.
+
+    - threshold: observations with a residual above the largest of this
+    (in metres) and three times the median residual are outliers.
+    - iterations: maximum number of times to reject outliers and fit again.
+    - minimum_points: the fit stops rejecting points below this number.
+
+    Returns `(rotation, translation, inliers, rms)` where `inliers` is a
+    boolean array of the observations used by the final fit and `rms` is
+    their root mean square residual.
+    """
+    source = np.asarray(source, dtype=float).reshape(-1, 3)
+    target = np.asarray(target, dtype=float).reshape(-1, 3)
+
+    if len(source) < 3:
+        raise ValueError("At least 3 observations are required, got {}"
+                         .format(len(source)))
+
+    inliers = np.ones(len(source), dtype=bool)
+
+    for _ in range(iterations):
+        rotation, translation = fit_rigid_transform(source[inliers],
+                                                    target[inliers])
+
+        errors = residuals(rotation, translation, source, target)
+        limit = max(threshold, 3 * np.median(errors[inliers]))
+        new_inliers = errors <= limit
+
+        if new_inliers.sum() < minimum_points or \
+                np.array_equal(new_inliers, inliers):
+            break
+
+        inliers = new_inliers
+
+    rotation, translation = fit_rigid_transform(source[inliers],
+                                                target[inliers])
+    errors = residuals(rotation, translation, source[inliers],
+                       target[inliers])
+
+    return rotation, translation, inliers, np.sqrt((errors ** 2).mean())